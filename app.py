@@ -1,5 +1,6 @@
+import asyncio
 import io
-from io import BytesIO
+import time
 from typing import TYPE_CHECKING
 
 from loguru import logger
@@ -25,13 +26,31 @@ from telegram.ext import (
     filters,
 )
 
-from config.openai_client import client, generate_transcription
+from config.openai_client import assistants_client, client
+from config.persistence import SessionConversationHandler, install_session_sync
+from config.settings import BOT_MODE
 from config.telegram_bot import application
+from config.webhook import run_polling, run_webhook
 from exceptions.bad_argument_error import BadArgumentError
 from exceptions.bad_choice_error import BadChoiceError
+from exceptions.bad_dataset_error import BadDatasetError
+from exceptions.llm_unavailable_error import LLMUnavailableError
+from utils.assistants import eda_assistant_registry
+from utils.cancellation import cancel_scopes
 from utils.constants import MAX_TOKENS, TEMPERATURE, CodePromptMode, ModelName, TaskPromptMode
-from utils.dialog_context import DialogContext
-from utils.helpers import check_user_settings, gen_messages_from_eda_stream, single_text2text_query, text_splitter
+from utils.dataset_compaction import CompactedDataset, compact_dataset
+from utils.dataset_profile import DatasetProfile, profile_dataset
+from utils.dialog_context import ConversationMemory, DialogContext
+from utils.helpers import (
+    check_user_settings,
+    gen_eda_text_deltas,
+    stream_text2text_query,
+    summarize_dialog,
+)
+from utils.images import PreparedImage, pick_photo_size, prepare_image
+from utils.meme_cache import MemeCacheEntry, MemeHash, image_hash, meme_cache
+from utils.metrics import LLM_LATENCY, instrument_conversation, observe_llm_usage
+from utils.model_router import model_router
 from utils.prompts import (
     AlgoTaskMakerPrompt,
     CodePrompt,
@@ -46,7 +65,11 @@ from utils.prompts import (
     TaskPrompt,
     TestMakerPrompt,
 )
-from utils.utils import print_message
+from utils.question_bank import BANK_PROMPTS, DIFFICULTIES, LEVELS, SEEN_LIMIT, BankKey, question_bank
+from utils.resilience import HELP_POLICY, VISION_POLICY, resilient_call
+from utils.semantic_cache import semantic_cache
+from utils.utils import StatusMessage, print_message, stream_message, text_splitter
+from utils.voice import voice_input
 
 if TYPE_CHECKING:
     from openai.types.beta.assistant import Assistant
@@ -169,13 +192,21 @@ async def task_choice(update: Update, _: CallbackContext) -> int:
     raise BadChoiceError(choice)  # type: ignore  # noqa: PGH003
 
 
+def restore_user_levels(user_data: dict) -> None:
+    """Задать уровень подготовки и сложность заданий, по умолчанию JUNIOR и EASY.
+
+    Раньше хэндлеры настроек сохраняли уровень и сложность в ключи друг друга,
+    поэтому выбор пользователя ищется в обоих ключах.
+    """
+    chosen = (user_data.get("questions_hard"), user_data.get("interview_hard"))
+    user_data["interview_hard"] = next((value for value in chosen if value in LEVELS), "JUNIOR")
+    user_data["questions_hard"] = next((value for value in reversed(chosen) if value in DIFFICULTIES), "EASY")
+
+
 async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     """хэндлер выбора прокачки знаний."""
     query = update.callback_query
-    if "interview_hard" not in context.user_data:  # type: ignore  # noqa: PGH003
-        context.user_data["interview_hard"] = "JUNIOR"  # type: ignore  # noqa: PGH003
-    if "questions_hard" not in context.user_data:  # type: ignore  # noqa: PGH003
-        context.user_data["questions_hard"] = "EASY"  # type: ignore  # noqa: PGH003
+    restore_user_levels(context.user_data)  # type: ignore  # noqa: PGH003
     if query is None:
         raise BadArgumentError(CALLBACK_QUERY_ARG)
     await query.answer()
@@ -183,7 +214,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "INTERVIEW_PREP" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -198,7 +229,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "ALGO_TASK" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -212,7 +243,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "ML_TASK" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -226,7 +257,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "TEST_MAKER" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -240,7 +271,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "ROADMAP_MAKER" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -255,7 +286,7 @@ async def knowledge_gain(update: Update, context: CallbackContext) -> int:
     if choice == "PSYCHO_HELP" and check_user_settings(context):
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
-        context.user_data["dialog"] = []  # type: ignore  # noqa: PGH003
+        context.user_data["dialog"] = ConversationMemory()  # type: ignore  # noqa: PGH003
         context.user_data["topic"] = ""  # type: ignore  # noqa: PGH003
         keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
         await context.bot.send_message(
@@ -314,8 +345,7 @@ async def problem_solving(update: Update, context: CallbackContext) -> int:
         if update.callback_query is None:
             raise BadArgumentError(CALLBACK_QUERY_ARG)
 
-        context.user_data["messages"] = []  # type: ignore[index]
-        context.user_data["assistant_id"] = None  # type: ignore[index]
+        context.user_data["thread_id"] = None  # type: ignore[index]
 
         keyboard = [[InlineKeyboardButton("Отмена", callback_data="CANCEL")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -382,14 +412,15 @@ async def help_factory(update: Update, context: CallbackContext) -> int:
             mode=context.user_data["prompt_mode"],  # type: ignore[index]
         )  # type: ignore[call-overload]
 
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            policy=HELP_POLICY,
+        ),
     )
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
     return await start(update, context)
 
 
@@ -408,75 +439,101 @@ async def eda(update: Update, context: CallbackContext) -> int:
     file: File = await context.bot.get_file(update.message.document)
     await file.download_to_memory(stream_dataset)
 
-    logger.info("Updload dataset to OpenAI")
+    logger.info("Profile dataset")
     stream_dataset.seek(0)
-    dataset_file: FileObject = client.files.create(file=stream_dataset, purpose="assistants")
-
-    logger.info("Create assistent for working with dataset")
-    eda_assistant: Assistant = client.beta.assistants.create(
-        instructions="""You are an excellent senior Data Scientist with 10 years of experience.
-        You make Exploratory Data Analysis for recieved datasets.
-        Probably dataset will be in csv format.
-
-        Output formatting:
-        - Give anwser on russian except of column names or terms. It's important!
-        - Give answer in correct Markdown format (use only Markdown's secial symbols)
-        - For all headers use Telegram's "*text example*" for bold, and "`text example`" for code
-        formatiing instead of Markdown's "#", "##"
-        - Must be possible to pretty display answer in Telegram message
-        - Don't use tables in response
-        - Answer that you can't plot any graph and image yet
-        """,
-        model="gpt-4o",
-        tools=[{"type": "code_interpreter"}],
-        tool_resources={"code_interpreter": {"file_ids": [dataset_file.id]}},
-    )
+    try:
+        profile: DatasetProfile = await asyncio.to_thread(profile_dataset, stream_dataset)
+    except BadDatasetError as error:
+        logger.info(f"Dataset rejected: {error.reason}")
+        await update.message.reply_text(error.message)
+        return EDA
+
+    eda_assistant: Assistant = await eda_assistant_registry.get()
 
     logger.info("Create task for model")
-    messages: list[MessageCreateParams] = [
-        MessageCreateParams(
-            role="user",
-            content="""In separate first message:
+    thread: Thread = await assistants_client.beta.threads.create(
+        messages=[
+            MessageCreateParams(
+                role="user",
+                content=f"""In separate first message:
         Provide short overview for features in dataset.
         Choose best candidate for target (the most useful info for business) in ML task among columns.
         Response me with conclusion.
+        Do not run code for this message: use the dataset profile below, it is computed from the whole file.
+
+        {profile.to_prompt()}
         """,
-        ),
-    ]
-    thread: Thread = client.beta.threads.create(messages=messages)
+            ),
+        ],
+    )
 
-    logger.info("Process dataset")
-    await print_message(message=update.message, text="Обрабатываем датасет (30-60 секунд)")
-    for text in gen_messages_from_eda_stream(thread=thread, eda_assistant=eda_assistant):
-        messages.append(MessageCreateParams(role="assistant", content=text))
-        await print_message(message=update.message, text=text, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["thread_id"] = thread.id
 
-    messages.append(
-        MessageCreateParams(
+    logger.info("Updload dataset to OpenAI")
+    stream_dataset.seek(0)
+    # the overview is written from the profile and does not wait for the compaction and the upload
+    upload: asyncio.Task[tuple[FileObject, str]] = asyncio.create_task(
+        upload_dataset(stream_dataset, profile, update.message.document.file_name or "dataset.csv"),
+    )
+
+    logger.info("Process dataset")
+    with cancel_scopes.scope(update.message.chat_id) as cancelled:
+        try:
+            status = StatusMessage(await update.message.reply_text("Обрабатываем датасет (30-60 секунд)"))
+            await stream_message(
+                message=update.message,
+                deltas=gen_eda_text_deltas(
+                    thread_id=thread.id,
+                    eda_assistant=eda_assistant,
+                    on_progress=status.update,
+                    cancelled=cancelled,
+                    allow_code=False,
+                ),
+            )
+        except BaseException:
+            await discard_dataset(upload)
+            raise
+        if cancelled.is_set():
+            await discard_dataset(upload)
+            return DATASET_CHAT
+        # the overview run has ended, so the thread takes messages again;
+        # questions after the overview are answered by running code on the file
+        await attach_dataset(thread.id, upload)
+
+        await assistants_client.beta.threads.messages.create(
+            thread_id=thread.id,
             role="user",
             content="""In separate second message:
-        Construct new features based solely on the columns present in the dataset.
-        Features have to be correlated with target, but can't use target.
-
-        In your response:
-        0. Header
-        1. Enumerate the features you suggest adding.
-        2. For each feature, provide a formula using the existing columns of the dataset.
-        3. Explain why each feature would be beneficial for an ML model.
-
-        Important constraints:
-        - Use only the columns contained in the dataset.
-        - Do not suggest collecting additional data or
-          adding anything that cannot be calculated from the existing columns.
-        - Respond with the list of new features, formulae, and explanations without any welcoming or accompanying text.
-        - You have not seen the data yet, so do not construct features based on concrete names of categories.
+            Construct new features based solely on the columns present in the dataset.
+            Features have to be correlated with target, but can't use target.
+
+            In your response:
+            0. Header
+            1. Enumerate the features you suggest adding.
+            2. For each feature, provide a formula using the existing columns of the dataset.
+            3. Explain why each feature would be beneficial for an ML model.
+
+            Important constraints:
+            - Use only the columns contained in the dataset.
+            - Do not suggest collecting additional data or
+              adding anything that cannot be calculated from the existing columns.
+            - Respond with the list of new features, formulae, and explanations
+              without any welcoming or accompanying text.
+            - You have not seen the data yet, so do not construct features based on concrete names of categories.
         """,
-        ),
-    )
-    thread = client.beta.threads.create(messages=messages)
-    for text in gen_messages_from_eda_stream(thread=thread, eda_assistant=eda_assistant):
-        messages.append(MessageCreateParams(role="assistant", content=text))
-        await print_message(message=update.message, text=text, parse_mode=ParseMode.MARKDOWN, add_finish=True)
+        )
+        await stream_message(
+            message=update.message,
+            deltas=gen_eda_text_deltas(
+                thread_id=thread.id,
+                eda_assistant=eda_assistant,
+                on_progress=status.update,
+                cancelled=cancelled,
+            ),
+        )
+    if cancelled.is_set():
+        return DATASET_CHAT
+    await status.update("Датасет обработан")
 
     await print_message(
         message=update.message,
@@ -484,12 +541,42 @@ async def eda(update: Update, context: CallbackContext) -> int:
         parse_mode=ParseMode.MARKDOWN,
         add_finish=True,
     )
-
-    context.user_data["messages"] = messages
-    context.user_data["assistant_id"] = eda_assistant.id
     return DATASET_CHAT
 
 
+async def upload_dataset(stream: io.BytesIO, profile: DatasetProfile, name: str) -> "tuple[FileObject, str]":
+    """Сжать датасет и загрузить его в OpenAI, вернуть файл и описание того, что с ним сделано."""
+    compacted: CompactedDataset = await asyncio.to_thread(compact_dataset, stream, profile, name)
+    logger.info(f"Dataset compacted to {compacted.name}: {len(compacted.content)} bytes")
+    dataset_file: FileObject = await assistants_client.files.create(
+        file=(compacted.name, compacted.content),
+        purpose="assistants",
+    )
+    return dataset_file, compacted.note
+
+
+async def attach_dataset(thread_id: str, upload: "asyncio.Task[tuple[FileObject, str]]") -> None:
+    """Дать code interpreter треда доступ к загруженному датасету."""
+    dataset_file, note = await upload
+    await assistants_client.beta.threads.messages.create(
+        thread_id=thread_id,
+        role="user",
+        content=note,
+        attachments=[{"file_id": dataset_file.id, "tools": [{"type": "code_interpreter"}]}],
+    )
+
+
+async def discard_dataset(upload: "asyncio.Task[tuple[FileObject, str]]") -> None:
+    """Отменить загрузку датасета, который больше не нужен, или удалить уже загруженный файл."""
+    upload.cancel()
+    (result,) = await asyncio.gather(upload, return_exceptions=True)
+    if isinstance(result, BaseException):
+        return
+    dataset_file, _ = result
+    logger.info(f"Delete unused dataset file {dataset_file.id}")
+    await assistants_client.files.delete(dataset_file.id)
+
+
 async def dataset_chat(
     update: Update,
     context: CallbackContext,
@@ -502,28 +589,30 @@ async def dataset_chat(
         raise BadArgumentError(USER_DATA_ARG)
 
     logger.info("Get info from context")
-    eda_assistant: Assistant = client.beta.assistants.retrieve(assistant_id=context.user_data["assistant_id"])
-    messages: list[MessageCreateParams] = context.user_data["messages"]
+    eda_assistant: Assistant = await eda_assistant_registry.get()
+    thread_id: str = context.user_data["thread_id"]
 
     logger.info("Get users question")
-    question: str
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        question = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        question = update.message.text
+    if (question := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
     logger.debug(f"{question=}")
 
-    messages.append(MessageCreateParams(role="user", content=question))
-    thread = client.beta.threads.create(messages=messages)
-
-    for text in gen_messages_from_eda_stream(thread=thread, eda_assistant=eda_assistant):
-        messages.append(MessageCreateParams(role="assistant", content=text))
-        await print_message(message=update.message, text=text, parse_mode=ParseMode.MARKDOWN, add_finish=True)
+    await assistants_client.beta.threads.messages.create(thread_id=thread_id, role="user", content=question)
+
+    status = StatusMessage(await update.message.reply_text("Изучаю вопрос..."))
+    with cancel_scopes.scope(update.message.chat_id) as cancelled:
+        await stream_message(
+            message=update.message,
+            deltas=gen_eda_text_deltas(
+                thread_id=thread_id,
+                eda_assistant=eda_assistant,
+                on_progress=status.update,
+                cancelled=cancelled,
+            ),
+        )
+    if cancelled.is_set():
+        return DATASET_CHAT
+    await status.update("Ответ готов")
 
     await print_message(
         message=update.message,
@@ -532,8 +621,6 @@ async def dataset_chat(
         add_finish=True,
     )
 
-    context.user_data["messages"] = messages
-    context.user_data["assistant_id"] = eda_assistant.id
     return DATASET_CHAT
 
 
@@ -578,13 +665,13 @@ async def interview_hard(update: Update, context: CallbackContext) -> int:
     await query.answer()
     choice = query.data
     if choice == "INTERN":
-        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "JUNIOR":
-        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "MIDDLE":
-        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "SENIOR":
-        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "BACK":
         pass
     keyboard = [
@@ -605,11 +692,11 @@ async def questions_hard(update: Update, context: CallbackContext) -> int:
     await query.answer()
     choice = query.data
     if choice == "EASY":
-        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "MEDIUM":
-        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "HARD":
-        context.user_data["interview_hard"] = choice  # type: ignore  # noqa: PGH003
+        context.user_data["questions_hard"] = choice  # type: ignore  # noqa: PGH003
     if choice == "BACK":
         pass
     keyboard = [
@@ -631,7 +718,7 @@ async def meme_explanation(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     file = None
     if update.message.photo:
-        file = await update.message.photo[-1].get_file()
+        file = await pick_photo_size(update.message.photo).get_file()
     if (
         update.message.effective_attachment
         and type(update.message.effective_attachment) is Document
@@ -642,8 +729,8 @@ async def meme_explanation(update: Update, context: CallbackContext) -> int:
     if file is None:
         return MEME_EXPL
     await update.message.reply_text(text="Изучаю мем...")
-    data = await file.download_as_bytearray()
-    explanation = explain_meme(data, context)
+    data = bytes(await file.download_as_bytearray())
+    explanation = await explain_meme(data, context)
     finish_dialog_keyboard = [[KeyboardButton("/finish_dialog")]]  # type: ignore[list-item]
     await update.message.reply_text(
         text=f"{explanation}",
@@ -668,63 +755,128 @@ async def meme_need_reaction(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(USER_DATA_ARG)
     if update.callback_query.data == "NEED_MEME_REACTION_YES":
         message = await update.callback_query.edit_message_text("Ок, генерирую ответ...")
-        context.user_data["dialog"].messages.append(*MemeNeedReactionPrompt().messages)
-        response = send_to_open_ai(context.user_data["dialog"])
+        dialog_context: DialogContext = context.user_data["dialog"]
+        dialog_context.messages.append(*MemeNeedReactionPrompt().messages)
+        meme_hash: MemeHash = context.user_data["meme_hash"]
+        cached: MemeCacheEntry | None = meme_cache.get(meme_hash)
+        if cached is not None and cached.reaction is not None:
+            response = cached.reaction
+            dialog_context.messages.append({"role": "assistant", "content": response})
+        else:
+            response = await send_to_open_ai(dialog_context, MemeNeedReactionPrompt.__name__)
+            if cached is not None and response:
+                cached.reaction = response
+                await meme_cache.save(meme_hash, cached)
         await message.edit_text(response)  # type: ignore   # noqa: PGH003
     else:
         await update.callback_query.edit_message_text("Ок, не генерирую ответ")
     return MEME_EXPL_DIALOG
 
 
-def explain_meme(image: bytearray, context: CallbackContext) -> str:
+async def explain_meme(image: bytes, context: CallbackContext) -> str:
     """Объяснить мем по изображению."""
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
 
     dialog_context = DialogContext(
-        model="gpt-4o",
+        model=ModelName.GPT_4O,
         max_tokens=1024,
         temperature=0.5,
     )
     context.user_data["dialog"] = dialog_context
-    dialog_context.messages.append(*MemeImagePrompt(image=image).messages)
-    return send_to_open_ai(dialog_context)
-
-
-def send_to_open_ai(dialog_context: DialogContext) -> str:
-    """Отправить контекст диалога в OpenAI."""
-    response: ChatCompletion = client.chat.completions.create(
-        model=dialog_context.model,
-        messages=dialog_context.messages,
-        max_tokens=dialog_context.max_tokens,
-        temperature=dialog_context.temperature,
+    prepared_image: PreparedImage = await asyncio.to_thread(prepare_image, image)
+    dialog_context.messages.pin(*MemeImagePrompt(image=prepared_image).messages)
+
+    meme_hash: MemeHash = await asyncio.to_thread(image_hash, image)
+    if (found := await meme_cache.find(meme_hash)) is not None:
+        context.user_data["meme_hash"], cached = found
+        dialog_context.messages.append({"role": "assistant", "content": cached.explanation})
+        return cached.explanation
+
+    context.user_data["meme_hash"] = meme_hash
+    explanation: str = await send_to_open_ai(dialog_context, MemeImagePrompt.__name__)
+    if explanation:
+        await meme_cache.save(meme_hash, MemeCacheEntry(explanation=explanation))
+    return explanation
+
+
+async def send_to_open_ai(dialog_context: DialogContext, prompt_class: str) -> str:
+    """Отправить контекст диалога в OpenAI, модель выбирается по классу промпта."""
+    messages = dialog_context.messages.window()
+    model: ModelName = model_router.pick(prompt_class, messages)
+    started_at: float = time.perf_counter()
+    response: ChatCompletion = await resilient_call(
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=dialog_context.max_tokens,
+            temperature=dialog_context.temperature,
+        ),
+        VISION_POLICY,
     )
+    latency: float = time.perf_counter() - started_at
+    LLM_LATENCY.labels(model, prompt_class).observe(latency)
+    model_router.record(model, prompt_class, latency, streamed=False)
+    observe_llm_usage(model, prompt_class, response.usage)
     content = response.choices[0].message.content
     if content is None:
         logger.error("OpenAI содержит пустой ответ")
         return ""
-    dialog_context.messages.append(response.choices[0].message)
+    dialog_context.messages.append({"role": "assistant", "content": content})
+    await dialog_context.messages.compact(summarize_dialog)
     return content.strip()
 
 
+def opening_key(context: CallbackContext, prompt_class: str) -> BankKey:
+    """Ключ первой задачи диалога: тема и уровни пользователя."""
+    if context.user_data is None:
+        raise BadArgumentError(USER_DATA_ARG)
+    return BankKey.of(
+        prompt_class,
+        context.user_data["topic"],
+        context.user_data["interview_hard"],
+        context.user_data["questions_hard"],
+    )
+
+
+async def reply_with_prepared_task(message: Message, context: CallbackContext, prompt_class: str) -> bool:
+    """Ответить на первый ход диалога готовой задачей: из банка или из семантического кэша по похожей теме."""
+    if context.user_data is None:
+        raise BadArgumentError(USER_DATA_ARG)
+
+    key: BankKey = opening_key(context, prompt_class)
+    seen_key: str = "question_bank_seen"
+    found = None
+    if prompt_class in BANK_PROMPTS:
+        found = await question_bank.take(key, exclude=context.user_data.get(seen_key, []))
+    if found is None:
+        seen_key = "semantic_cache_seen"
+        found = await semantic_cache.find(key, exclude=context.user_data.get(seen_key, []))
+    if found is None:
+        return False
+
+    task_id, task = found
+    context.user_data[seen_key] = [*context.user_data.get(seen_key, []), task_id][-SEEN_LIMIT:]
+    for chunk in text_splitter(task):
+        await print_message(message, chunk)
+    context.user_data["dialog"].append({"role": "assistant", "content": task})
+    return True
+
+
 async def algo_dialog(update: Update, context: CallbackContext) -> int:
     """Хэндлер диалога."""
     if update.message is None:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
-    if context.user_data["topic"] == "":
+    first_turn: bool = context.user_data["topic"] == ""
+    if first_turn:
         context.user_data["topic"] = text
+        if await reply_with_prepared_task(update.message, context, AlgoTaskMakerPrompt.__name__):
+            return ALGO_DIALOG
     else:
         context.user_data["dialog"].append({"role": "user", "content": text})
 
@@ -734,16 +886,21 @@ async def algo_dialog(update: Update, context: CallbackContext) -> int:
         topic=context.user_data["topic"],
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
 
     logger.debug(explanation)
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    if first_turn and explanation:
+        await semantic_cache.save(opening_key(context, AlgoTaskMakerPrompt.__name__), explanation)
+    await context.user_data["dialog"].compact(summarize_dialog)
     return ALGO_DIALOG
 
 
@@ -753,18 +910,14 @@ async def ml_dialog(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
-    if context.user_data["topic"] == "":
+    first_turn: bool = context.user_data["topic"] == ""
+    if first_turn:
         context.user_data["topic"] = text
+        if await reply_with_prepared_task(update.message, context, MLTaskMakerPrompt.__name__):
+            return ML_DIALOG
     else:
         context.user_data["dialog"].append({"role": "user", "content": text})
 
@@ -774,16 +927,21 @@ async def ml_dialog(update: Update, context: CallbackContext) -> int:
         topic=context.user_data["topic"],
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
 
     logger.debug(explanation)
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    if first_turn and explanation:
+        await semantic_cache.save(opening_key(context, MLTaskMakerPrompt.__name__), explanation)
+    await context.user_data["dialog"].compact(summarize_dialog)
     return ML_DIALOG
 
 
@@ -793,18 +951,14 @@ async def interview_dialog(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
-    if context.user_data["topic"] == "":
+    first_turn: bool = context.user_data["topic"] == ""
+    if first_turn:
         context.user_data["topic"] = text
+        if await reply_with_prepared_task(update.message, context, InterviewMakerPrompt.__name__):
+            return INTERVIEW_DIALOG
     else:
         context.user_data["dialog"].append({"role": "user", "content": text})
 
@@ -814,15 +968,19 @@ async def interview_dialog(update: Update, context: CallbackContext) -> int:
         topic=context.user_data["topic"],
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
-
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    if first_turn and explanation:
+        await semantic_cache.save(opening_key(context, InterviewMakerPrompt.__name__), explanation)
+    await context.user_data["dialog"].compact(summarize_dialog)
     return INTERVIEW_DIALOG
 
 
@@ -832,18 +990,14 @@ async def test_dialog(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
-    if context.user_data["topic"] == "":
+    first_turn: bool = context.user_data["topic"] == ""
+    if first_turn:
         context.user_data["topic"] = text
+        if await reply_with_prepared_task(update.message, context, TestMakerPrompt.__name__):
+            return TEST_MAKER
     else:
         context.user_data["dialog"].append({"role": "user", "content": text})
 
@@ -853,15 +1007,19 @@ async def test_dialog(update: Update, context: CallbackContext) -> int:
         topic=context.user_data["topic"],
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
-
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    if first_turn and explanation:
+        await semantic_cache.save(opening_key(context, TestMakerPrompt.__name__), explanation)
+    await context.user_data["dialog"].compact(summarize_dialog)
     return TEST_MAKER
 
 
@@ -871,18 +1029,14 @@ async def roadmap_dialog(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
-    if context.user_data["topic"] == "":
+    first_turn: bool = context.user_data["topic"] == ""
+    if first_turn:
         context.user_data["topic"] = text
+        if await reply_with_prepared_task(update.message, context, RoadMapMakerPrompt.__name__):
+            return ROADMAP_MAKER
     else:
         context.user_data["dialog"].append({"role": "user", "content": text})
 
@@ -892,15 +1046,19 @@ async def roadmap_dialog(update: Update, context: CallbackContext) -> int:
         topic=context.user_data["topic"],
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
-
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    if first_turn and explanation:
+        await semantic_cache.save(opening_key(context, RoadMapMakerPrompt.__name__), explanation)
+    await context.user_data["dialog"].compact(summarize_dialog)
     return ROADMAP_MAKER
 
 
@@ -910,30 +1068,25 @@ async def psyho_dialog(update: Update, context: CallbackContext) -> int:
         raise BadArgumentError(MESSAGE_ARG)
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
-    if update.message.voice:
-        audio_file = await context.bot.get_file(update.message.voice.file_id)
-
-        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
-
-        text: str = generate_transcription(audio_bytes)
-
-    if update.message.text:
-        text = update.message.text
+    if (text := await voice_input.read_text(update.message)) is None:
+        raise BadArgumentError(MESSAGE_ARG)
 
     context.user_data["dialog"].append({"role": "user", "content": text})
 
     prompt: PsychoHelpPrompt = PsychoHelpPrompt(
         reply=context.user_data["dialog"],
     )
-    explanation: str = single_text2text_query(
-        model=ModelName.GPT_4O,
-        prompt=prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    explanation: str = await stream_message(
+        message=update.message,
+        deltas=stream_text2text_query(
+            prompt=prompt,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            use_cache=False,
+        ),
     )
-
-    for text_chunk in text_splitter(text=explanation):
-        await update.message.reply_text(text=text_chunk, parse_mode=ParseMode.MARKDOWN)
+    context.user_data["dialog"].append({"role": "assistant", "content": explanation})
+    await context.user_data["dialog"].compact(summarize_dialog)
     return PSYCHO_HELP
 
 
@@ -945,7 +1098,7 @@ async def meme_explanation_dialog(update: Update, context: CallbackContext) -> i
         raise BadArgumentError(USER_DATA_ARG)
     messages = GenericUserTextPrompt(text=update.message.text).messages  # type: ignore[arg-type]
     context.user_data["dialog"].messages.append(*messages)
-    response = send_to_open_ai(context.user_data["dialog"])
+    response = await send_to_open_ai(context.user_data["dialog"], MemeImagePrompt.__name__)
 
     if context.user_data is None:
         raise BadArgumentError(USER_DATA_ARG)
@@ -1000,6 +1153,16 @@ async def deactivate_last_menu_button(context: CallbackContext) -> None:
         logger.debug("Не получилось деактивировать кнопки меню")
 
 
+async def error_handler(update: object, context: CallbackContext) -> None:
+    """Сообщает пользователю о недоступности OpenAI и логирует остальные ошибки."""
+    if isinstance(context.error, LLMUnavailableError):
+        logger.warning(f"OpenAI недоступен: {context.error.reason}")
+        if isinstance(update, Update) and update.effective_message:
+            await update.effective_message.reply_text(context.error.message)
+        return
+    logger.opt(exception=context.error).error("Ошибка при обработке апдейта")
+
+
 async def cancel(update: Update, _: CallbackContext) -> int:
     """Завершает беседу."""
     if update.message is None:
@@ -1009,7 +1172,7 @@ async def cancel(update: Update, _: CallbackContext) -> int:
 
 
 """Run the bot."""
-conv_handler = ConversationHandler(
+conv_handler = SessionConversationHandler(
     entry_points=[CommandHandler("start", start)],
     states={
         TASK_CHOICE: [CallbackQueryHandler(task_choice)],
@@ -1080,10 +1243,25 @@ conv_handler = ConversationHandler(
         ],
     },
     fallbacks=[CommandHandler("start", start)],
+    name="main",
+    persistent=True,
 )
 
+# метки состояний для метрик: имена констант состояний
+state_names: dict[object, str] = {
+    state: name
+    for name, state in list(globals().items())
+    if name.isupper() and isinstance(state, int) and state in conv_handler.states
+}
+instrument_conversation(conv_handler, state_names)
 application.add_handler(conv_handler)
+install_session_sync(application, conv_handler)
 application.add_handler(CommandHandler("start", start))
+application.add_error_handler(error_handler)
 
-# Запуск бота
-application.run_polling()
+# Запуск бота (модуль импортируется без запуска нагрузочным тестом)
+if __name__ == "__main__":
+    if BOT_MODE == "webhook":
+        run_webhook(application)
+    else:
+        run_polling(application)
@@ -1,27 +1,50 @@
+import time
+import typing
 from io import BytesIO
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from utils.metrics import LLM_LATENCY
+from utils.model_router import model_router
+from utils.resilience import CHAT_POLICY, TRANSCRIPTION_POLICY, resilient_call
 
 from .tokens import OPENAI_API_KEY
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+if typing.TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+# повторы делает resilient_call, чтобы они не умножались на повторы SDK
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+# Assistants, Files и Batches вызываются без resilient_call, поэтому повторы для них делает SDK
+assistants_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 
-def generate_response(text: str) -> str:
+async def generate_response(text: str) -> str:
     """Возвращаем текствый ответ."""
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": text}],
-        max_tokens=1024,
-        temperature=0.5,
+    messages: list[ChatCompletionMessageParam] = [{"role": "user", "content": text}]
+    response = await resilient_call(
+        lambda: client.chat.completions.create(
+            model=model_router.pick("GenericUserTextPrompt", messages),
+            messages=messages,
+            max_tokens=1024,
+            temperature=0.5,
+        ),
+        CHAT_POLICY,
     )
     return response.choices[0].message.content.strip()  # type: ignore  # noqa: PGH003
 
 
-def generate_transcription(audio_bytes: BytesIO) -> str:
+async def generate_transcription(audio_bytes: BytesIO) -> str:
     """Возвращаем аудио транскрипт."""
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1",
-        file=("audio.oga", audio_bytes, "audio/ogg"),
+    # запрос может повториться, поэтому передаём байты: поток прочитается только один раз
+    audio: bytes = audio_bytes.getvalue()
+    started_at: float = time.perf_counter()
+    transcription = await resilient_call(
+        lambda: client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.oga", audio, "audio/ogg"),
+        ),
+        TRANSCRIPTION_POLICY,
     )
+    LLM_LATENCY.labels("whisper-1", "transcription").observe(time.perf_counter() - started_at)
     return transcription.text.strip()
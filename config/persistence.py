@@ -0,0 +1,193 @@
+import asyncio
+import json
+import pickle
+import typing
+
+from loguru import logger
+from telegram import TelegramObject, Update
+from telegram.ext import Application, BasePersistence, ContextTypes, ConversationHandler, PersistenceInput, TypeHandler
+
+from .session_store import ConversationWrites, SessionStore, UserWrites
+
+UserData = dict[typing.Any, typing.Any]
+ConversationKey = tuple[int | str, ...]
+ConversationDict = dict[ConversationKey, object]
+CDCData = tuple[list[tuple[str, float, dict[str, typing.Any]]], dict[str, str]]
+
+
+class SessionPersistence(BasePersistence[UserData, dict, dict]):
+    """Хранит состояния диалогов и user_data в SessionStore.
+
+    Application сам копит изменения и сбрасывает их раз в update_interval секунд; все изменения
+    одного сброса записываются одной пачкой. user_data пользователя читается из хранилища только
+    при первом его апдейте после рестарта, поэтому старт не зависит от числа пользователей.
+    Если хранилище общее для нескольких реплик, user_data перечитывается перед каждым апдейтом.
+    """
+
+    def __init__(self, store: SessionStore, update_interval: float):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self._loaded_users: set[int] = set()
+        self._dirty_users: UserWrites = {}
+        self._dirty_conversations: ConversationWrites = {}
+        self._flush_task: asyncio.Task | None = None
+
+    # user_data
+
+    async def get_user_data(self) -> dict[int, UserData]:
+        """Данные пользователей подгружаются лениво в refresh_user_data."""
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: UserData) -> None:
+        """Подгружает данные пользователя при первом обращении к ним."""
+        if user_id in self._loaded_users and not self.store.shared:
+            return
+        self._loaded_users.add(user_id)
+        row = await self.store.load_user(user_id)
+        if row is None:
+            return
+        loaded: UserData = pickle.loads(row)  # noqa: S301
+        for value in loaded.values():
+            if isinstance(value, TelegramObject):
+                value.set_bot(self.bot)
+        if self.store.shared:
+            # в общем хранилище лежит самая свежая версия: её могла записать другая реплика
+            user_data.clear()
+            user_data.update(loaded)
+        else:
+            # то, что успело попасть в user_data до загрузки, важнее сохранённого
+            user_data.update({**loaded, **user_data})
+
+    async def update_user_data(self, user_id: int, data: UserData) -> None:
+        """Откладывает запись данных пользователя до конца текущего сброса."""
+        self._loaded_users.add(user_id)
+        self._dirty_users[user_id] = pickle.dumps(data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        """Удаляет данные пользователя."""
+        self._dirty_users[user_id] = None
+        self._schedule_flush()
+
+    # conversations
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        """Состояния диалогов занимают мало места, поэтому читаются целиком."""
+        states = await self.store.load_conversations(name)
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in states.items()}  # noqa: S301
+
+    async def load_conversation(self, name: str, key: ConversationKey) -> object | None:
+        """Состояние одного диалога из хранилища."""
+        state = await self.store.load_conversation(name, json.dumps(key))
+        return None if state is None else pickle.loads(state)  # noqa: S301
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: object | None) -> None:
+        """Откладывает запись состояния диалога до конца текущего сброса."""
+        self._dirty_conversations[(name, json.dumps(key))] = None if new_state is None else pickle.dumps(new_state)
+        self._schedule_flush()
+
+    # запись
+
+    def _schedule_flush(self) -> None:
+        # Application вызывает update_* подряд для всех изменившихся объектов, поэтому
+        # запись откладывается до следующей итерации цикла событий и делается одной пачкой
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.write_behind())
+
+    async def write_behind(self) -> None:
+        """Записывает накопленные изменения."""
+        await asyncio.sleep(0)
+        users, self._dirty_users = self._dirty_users, {}
+        conversations, self._dirty_conversations = self._dirty_conversations, {}
+        if not users and not conversations:
+            return
+        await self.store.save(users, conversations)
+        logger.debug(f"Persisted {len(users)} users and {len(conversations)} conversation states")
+
+    async def sync(self) -> None:
+        """Дожидается записи всех накопленных изменений."""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.write_behind()
+
+    async def flush(self) -> None:
+        """Записывает всё накопленное при остановке бота."""
+        await self.sync()
+        await self.store.close()
+
+    # bot_data, chat_data и callback_data бот не использует
+
+    async def get_bot_data(self) -> dict:
+        """Не используется."""
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        """Не используется."""
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        """Не используется."""
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        """Не используется."""
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        """Не используется."""
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        """Не используется."""
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        """Не используется."""
+
+    async def get_callback_data(self) -> CDCData | None:
+        """Не используется."""
+        return None
+
+    async def update_callback_data(self, data: CDCData) -> None:
+        """Не используется."""
+
+
+class SessionConversationHandler(ConversationHandler):
+    """ConversationHandler, который умеет перечитать состояние диалога из общего хранилища.
+
+    У ConversationHandler нет публичного способа подменить состояние, поэтому здесь используются
+    его внутренние _get_key и _conversations.
+    """
+
+    async def refresh_state(self, update: Update, persistence: SessionPersistence) -> None:
+        """Подтягивает состояние диалога, которое могла записать другая реплика."""
+        if self.name is None:
+            return
+        try:
+            key = self._get_key(update)
+        except RuntimeError:
+            return
+        state = await persistence.load_conversation(self.name, key)
+        if state is None:
+            self._conversations.pop(key, None)
+        else:
+            # persistent-хэндлер хранит диалоги в TrackingDict, хотя типизированы они как MutableMapping;
+            # update_no_track не помечает ключ изменённым, чтобы не записывать прочитанное обратно
+            self._conversations.update_no_track({key: state})  # type: ignore[attr-defined]
+
+
+def install_session_sync(application: Application, conversation_handler: SessionConversationHandler) -> None:
+    """Для общего хранилища: перечитывает состояние перед апдейтом и сразу записывает его после."""
+    persistence = application.persistence
+    if not isinstance(persistence, SessionPersistence) or not persistence.store.shared:
+        return
+
+    async def load_state(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        await conversation_handler.refresh_state(update, persistence)
+
+    async def save_state(_: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await context.application.update_persistence()
+        await persistence.sync()
+
+    # группы обрабатываются по порядку: сначала загрузка, затем основной диалог, затем запись
+    application.add_handler(TypeHandler(Update, load_state), group=-1)
+    application.add_handler(TypeHandler(Update, save_state), group=1)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import typing
+from collections import defaultdict
+
+from loguru import logger
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import TELEGRAM_SEND_QUEUE_DEPTH, timed_send
+
+# сколько вёдер чатов держим, прежде чем выбросить простаивающие
+MAX_IDLE_CHAT_BUCKETS: typing.Final[int] = 10_000
+# служебные запросы, которые не являются отправкой сообщений и не ограничиваются Telegram так же строго
+UNLIMITED_ENDPOINTS: typing.Final[frozenset[str]] = frozenset(
+    {"answerCallbackQuery", "getFile", "getMe", "getUpdates", "setMyCommands", "setWebhook", "deleteWebhook"},
+)
+
+
+class TokenBucket:
+    """Ведро токенов: пропускает не больше rate запросов в секунду с всплесками до capacity."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_full(self) -> bool:
+        """Ведро успело наполниться, т.е. давно не использовалось."""
+        return self._tokens + (time.monotonic() - self._updated_at) * self.rate >= self.capacity
+
+    async def acquire(self) -> None:
+        """Ждёт, пока в ведре появится токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TokenBucketRateLimiter(BaseRateLimiter[int]):
+    """Очередь исходящих запросов к Bot API.
+
+    Соблюдает общий лимит и лимиты отдельных чатов, сохраняет порядок сообщений внутри чата
+    и после RetryAfter приостанавливает всю отправку на указанное Telegram время.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        private_chat_rate: float,
+        group_chat_rate: float,
+        max_retries: int,
+    ):
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        # asyncio.Lock будит ожидающих в порядке очереди, поэтому порядок сообщений в чате сохраняется
+        self._chat_locks: defaultdict[int | str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._chat_depth: defaultdict[int | str, int] = defaultdict(int)
+        self._resume_at: float = 0.0
+
+    def chat_queue_depth(self, chat_id: int | str) -> int:
+        """Сколько запросов в чат ждут отправки."""
+        return self._chat_depth.get(chat_id, 0)
+
+    async def initialize(self) -> None:
+        """Дополнительная инициализация не нужна."""
+
+    async def shutdown(self) -> None:
+        """Дополнительное завершение не нужно."""
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        if chat_id not in self._chat_buckets:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._chat_buckets = {key: bucket for key, bucket in self._chat_buckets.items() if not bucket.is_full}
+            # группы и каналы имеют отрицательные id или @username
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            self._chat_buckets[chat_id] = TokenBucket(self.group_chat_rate if is_group else self.private_chat_rate)
+        return self._chat_buckets[chat_id]
+
+    async def _wait_flood_control(self) -> None:
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(
+        self,
+        request: typing.Callable[[], typing.Awaitable[typing.Any]],
+        endpoint: str,
+        chat_bucket: TokenBucket | None,
+        max_retries: int,
+    ) -> typing.Any:  # noqa: ANN401
+        for attempt in range(max_retries + 1):
+            await self._wait_flood_control()
+            if chat_bucket is not None:
+                await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                return await timed_send(endpoint, request)
+            except RetryAfter as error:
+                if attempt == max_retries:
+                    raise
+                delay = error.retry_after if isinstance(error.retry_after, int | float) else 1
+                logger.warning(f"Telegram flood control, pause sending for {delay}s")
+                self._resume_at = max(self._resume_at, time.monotonic() + float(delay))
+        return None
+
+    async def process_request(  # noqa: PLR0913 - сигнатура задана BaseRateLimiter
+        self,
+        callback: typing.Callable[..., typing.Coroutine[typing.Any, typing.Any, typing.Any]],
+        args: typing.Any,  # noqa: ANN401
+        kwargs: dict[str, typing.Any],
+        endpoint: str,
+        data: dict[str, typing.Any],
+        rate_limit_args: int | None,
+    ) -> typing.Any:  # noqa: ANN401
+        """Отправляет запрос, соблюдая лимиты Telegram."""
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+
+        def request() -> typing.Awaitable[typing.Any]:
+            return callback(*args, **kwargs)
+
+        if endpoint in UNLIMITED_ENDPOINTS:
+            return await self._send(request, endpoint, None, max_retries)
+
+        chat_id: int | str | None = data.get("chat_id")
+        TELEGRAM_SEND_QUEUE_DEPTH.inc()
+        try:
+            if chat_id is None:
+                return await self._send(request, endpoint, None, max_retries)
+
+            self._chat_depth[chat_id] += 1
+            try:
+                async with self._chat_locks[chat_id]:
+                    return await self._send(request, endpoint, self._chat_bucket(chat_id), max_retries)
+            finally:
+                self._chat_depth[chat_id] -= 1
+                if not self._chat_depth[chat_id]:
+                    del self._chat_depth[chat_id]
+                    del self._chat_locks[chat_id]
+        finally:
+            TELEGRAM_SEND_QUEUE_DEPTH.dec()
@@ -0,0 +1,215 @@
+import asyncio
+import contextlib
+import sqlite3
+import typing
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from redis.asyncio import Redis
+
+# изменения, накопленные между записями в хранилище: None означает удаление
+UserWrites = dict[int, bytes | None]
+ConversationWrites = dict[tuple[str, str], bytes | None]
+
+
+class SessionStore(ABC):
+    """Хранилище сессий: сериализованные user_data и состояния диалогов.
+
+    Если хранилище общее для нескольких реплик (shared=True), данные могут поменяться в любой момент,
+    поэтому их нужно перечитывать перед каждым апдейтом, а апдейты одного чата — обрабатывать под
+    блокировкой chat_lock.
+    """
+
+    shared: bool = False
+
+    @abstractmethod
+    async def load_user(self, user_id: int) -> bytes | None:
+        """Данные пользователя."""
+
+    @abstractmethod
+    async def load_conversations(self, name: str) -> dict[str, bytes]:
+        """Все состояния диалогов хэндлера name."""
+
+    @abstractmethod
+    async def load_conversation(self, name: str, key: str) -> bytes | None:
+        """Состояние одного диалога."""
+
+    @abstractmethod
+    async def save(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        """Записывает пачку изменений."""
+
+    async def close(self) -> None:  # noqa: B027 - закрывать нужно не каждое хранилище
+        """Освобождает ресурсы."""
+
+    def chat_lock(self, chat_id: int) -> typing.AsyncContextManager[typing.Any]:  # noqa: ARG002
+        """Блокировка чата между репликами; для локальных хранилищ не нужна."""
+        return contextlib.nullcontext()
+
+
+class InMemorySessionStore(SessionStore):
+    """Хранилище в памяти процесса, данные теряются при рестарте."""
+
+    def __init__(self) -> None:
+        self._users: dict[int, bytes] = {}
+        self._conversations: dict[tuple[str, str], bytes] = {}
+
+    async def load_user(self, user_id: int) -> bytes | None:
+        """Данные пользователя."""
+        return self._users.get(user_id)
+
+    async def load_conversations(self, name: str) -> dict[str, bytes]:
+        """Все состояния диалогов хэндлера name."""
+        return {key: state for (conv_name, key), state in self._conversations.items() if conv_name == name}
+
+    async def load_conversation(self, name: str, key: str) -> bytes | None:
+        """Состояние одного диалога."""
+        return self._conversations.get((name, key))
+
+    async def save(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        """Записывает пачку изменений."""
+        for user_id, data in users.items():
+            if data is None:
+                self._users.pop(user_id, None)
+            else:
+                self._users[user_id] = data
+        for conv_key, state in conversations.items():
+            if state is None:
+                self._conversations.pop(conv_key, None)
+            else:
+                self._conversations[conv_key] = state
+
+
+class SQLiteSessionStore(SessionStore):
+    """Хранилище в локальном SQLite-файле."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS conversations (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state BLOB NOT NULL,
+                PRIMARY KEY (name, key)
+            );
+            """,
+        )
+        self._connection.commit()
+
+    def _fetchall(self, query: str, params: tuple[typing.Any, ...]) -> list[tuple[typing.Any, ...]]:
+        return self._connection.execute(query, params).fetchall()
+
+    async def load_user(self, user_id: int) -> bytes | None:
+        """Данные пользователя."""
+        rows = await asyncio.to_thread(self._fetchall, "SELECT data FROM user_data WHERE user_id = ?", (user_id,))
+        return rows[0][0] if rows else None
+
+    async def load_conversations(self, name: str) -> dict[str, bytes]:
+        """Все состояния диалогов хэндлера name."""
+        rows = await asyncio.to_thread(self._fetchall, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return dict(rows)
+
+    async def load_conversation(self, name: str, key: str) -> bytes | None:
+        """Состояние одного диалога."""
+        rows = await asyncio.to_thread(
+            self._fetchall,
+            "SELECT state FROM conversations WHERE name = ? AND key = ?",
+            (name, key),
+        )
+        return rows[0][0] if rows else None
+
+    async def save(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        """Записывает пачку изменений одной транзакцией."""
+        await asyncio.to_thread(self._write, users, conversations)
+
+    def _write(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                [(user_id, data) for user_id, data in users.items() if data is not None],
+            )
+            self._connection.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id, data in users.items() if data is None],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, key, state) for (name, key), state in conversations.items() if state is not None],
+            )
+            self._connection.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [(name, key) for (name, key), state in conversations.items() if state is None],
+            )
+
+    async def close(self) -> None:
+        """Закрывает соединение."""
+        self._connection.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Сетевое key-value хранилище, общее для нескольких реплик бота.
+
+    Подходит любой сервер с протоколом Redis; в тестах вместо клиента можно передать fakeredis.
+    """
+
+    shared = True
+
+    def __init__(self, client: Redis, prefix: str = "ds-newcomer-bot", lock_timeout: float = 600):
+        self._redis = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+
+    @classmethod
+    def from_url(cls: type[typing.Self], url: str, **kwargs: typing.Any) -> typing.Self:  # noqa: ANN401
+        """Создаёт хранилище по адресу вида redis://host:6379/0."""
+        return cls(Redis.from_url(url), **kwargs)
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def _conversations_key(self, name: str) -> str:
+        return f"{self.prefix}:conversations:{name}"
+
+    async def load_user(self, user_id: int) -> bytes | None:
+        """Данные пользователя."""
+        return await self._redis.get(self._user_key(user_id))
+
+    async def load_conversations(self, name: str) -> dict[str, bytes]:
+        """Все состояния диалогов хэндлера name."""
+        states = await typing.cast(
+            typing.Awaitable[dict[bytes, bytes]],
+            self._redis.hgetall(self._conversations_key(name)),
+        )
+        return {key.decode(): state for key, state in states.items()}
+
+    async def load_conversation(self, name: str, key: str) -> bytes | None:
+        """Состояние одного диалога."""
+        return await typing.cast(
+            typing.Awaitable[bytes | None],
+            self._redis.hget(self._conversations_key(name), key),
+        )
+
+    async def save(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        """Записывает пачку изменений одной транзакцией."""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for user_id, data in users.items():
+                if data is None:
+                    pipe.delete(self._user_key(user_id))
+                else:
+                    pipe.set(self._user_key(user_id), data)
+            for (name, key), state in conversations.items():
+                if state is None:
+                    pipe.hdel(self._conversations_key(name), key)
+                else:
+                    pipe.hset(self._conversations_key(name), mapping={key: state})
+            await pipe.execute()
+
+    async def close(self) -> None:
+        """Закрывает соединение."""
+        await self._redis.aclose()
+
+    def chat_lock(self, chat_id: int) -> typing.AsyncContextManager[typing.Any]:
+        """Не даёт двум репликам одновременно обрабатывать один чат."""
+        return self._redis.lock(f"{self.prefix}:chat-lock:{chat_id}", timeout=self.lock_timeout)
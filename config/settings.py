@@ -0,0 +1,88 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Сколько апдейтов разных чатов бот обрабатывает одновременно
+MAX_CONCURRENT_UPDATES: int = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+# Кэш ответов LLM для помощи по коду и задачам
+RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# путь к SQLite-файлу; если пусто, кэш живёт только в памяти процесса
+RESPONSE_CACHE_PATH: str = os.getenv("RESPONSE_CACHE_PATH", "")
+
+# Банк заранее сгенерированных первых задач для собеседований (python -m utils.question_bank);
+# путь к SQLite-файлу, если пусто, первая задача всегда генерируется на лету
+QUESTION_BANK_PATH: str = os.getenv("QUESTION_BANK_PATH", "")
+
+# Семантический кэш первых задач и роадмапов: темы сравниваются по эмбеддингам.
+# Путь к SQLite-файлу (вектора лежат рядом в .npy); если пусто, кэш живёт только в памяти процесса
+SEMANTIC_CACHE_PATH: str = os.getenv("SEMANTIC_CACHE_PATH", "")
+SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
+# минимальное косинусное сходство тем, при котором ответ переиспользуется
+SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.88"))
+EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS: int = int(os.getenv("EMBEDDING_DIMENSIONS", "256"))
+
+# Подготовка датасета перед загрузкой в code interpreter.
+# Файлы больше этого размера (МБ), где строк больше DATASET_SAMPLE_ROWS, заменяются стратифицированной выборкой
+DATASET_SAMPLE_THRESHOLD_MB: float = float(os.getenv("DATASET_SAMPLE_THRESHOLD_MB", "20"))
+DATASET_SAMPLE_ROWS: int = int(os.getenv("DATASET_SAMPLE_ROWS", "200000"))
+# файлы больше этого размера (МБ) загружаются сжатыми в ZIP
+DATASET_ZIP_THRESHOLD_MB: float = float(os.getenv("DATASET_ZIP_THRESHOLD_MB", "1"))
+
+# Сколько расшифровок голосовых сообщений держим в памяти
+TRANSCRIPTION_CACHE_SIZE: int = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "2048"))
+
+# Кэш объяснений мемов по перцептивному хэшу картинки
+MEME_CACHE_SIZE: int = int(os.getenv("MEME_CACHE_SIZE", "10000"))
+# максимальное расстояние Хэмминга между 64-битными хэшами, при котором картинка — кандидат в тот же мем
+MEME_HASH_MAX_DISTANCE: int = int(os.getenv("MEME_HASH_MAX_DISTANCE", "6"))
+# кандидат подтверждается 256-битным хэшем: мемы одного шаблона, но под разными подписями, отличаются на 15+ бит
+MEME_DETAIL_HASH_MAX_DISTANCE: int = int(os.getenv("MEME_DETAIL_HASH_MAX_DISTANCE", "10"))
+MEME_CACHE_PATH: str = os.getenv("MEME_CACHE_PATH", "")
+
+# Подготовка картинок для vision-запросов
+IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Ограничения Telegram на исходящие сообщения (сообщений в секунду)
+GLOBAL_SEND_RATE: float = float(os.getenv("GLOBAL_SEND_RATE", "30"))
+PRIVATE_CHAT_SEND_RATE: float = float(os.getenv("PRIVATE_CHAT_SEND_RATE", "1"))
+GROUP_CHAT_SEND_RATE: float = float(os.getenv("GROUP_CHAT_SEND_RATE", str(20 / 60)))
+# сколько раз повторяем запрос после RetryAfter
+SEND_MAX_RETRIES: int = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Адреса Bot API: можно заменить на локальный Bot API сервер или фейковый сервер нагрузочного теста
+TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_URL: str = os.getenv("TELEGRAM_FILE_URL", "https://api.telegram.org/file/bot")
+
+# Способ получения апдейтов: polling или webhook
+BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+# публичный адрес, на который Telegram будет слать апдейты, например https://bot.example.com/telegram
+WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")  # noqa: S104
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram")
+# бот обрабатывает только сообщения и нажатия на inline-кнопки
+ALLOWED_UPDATES: list[str] = ["message", "callback_query"]
+
+# Где хранится состояние бота (диалоги, настройки пользователей): memory, sqlite или redis.
+# redis нужен, чтобы несколько реплик бота обслуживали один токен
+SESSION_STORE: str = os.getenv("SESSION_STORE", "sqlite")
+PERSISTENCE_PATH: str = os.getenv("PERSISTENCE_PATH", "data/bot_state.sqlite")
+REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# как часто накопленные изменения записываются на диск, секунд
+PERSISTENCE_FLUSH_INTERVAL: float = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "30"))
+
+# Устойчивость запросов к OpenAI
+# после стольких неудачных запросов подряд перестаём обращаться к OpenAI
+LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+# через сколько секунд пробуем обратиться к OpenAI снова
+LLM_BREAKER_RESET_TIMEOUT: float = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+
+# Внутренний порт для /healthz и /metrics в обоих режимах (0 — не отдавать).
+# Публичный порт вебхука метрики не отдаёт
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
@@ -1,12 +1,60 @@
 from telegram.ext import Application
 
+from utils.assistants import eda_assistant_registry
+
+from .persistence import SessionPersistence
+from .rate_limiter import TokenBucketRateLimiter
+from .session_store import InMemorySessionStore, RedisSessionStore, SessionStore, SQLiteSessionStore
+from .settings import (
+    GLOBAL_SEND_RATE,
+    GROUP_CHAT_SEND_RATE,
+    MAX_CONCURRENT_UPDATES,
+    PERSISTENCE_FLUSH_INTERVAL,
+    PERSISTENCE_PATH,
+    PRIVATE_CHAT_SEND_RATE,
+    REDIS_URL,
+    SEND_MAX_RETRIES,
+    SESSION_STORE,
+    TELEGRAM_API_URL,
+    TELEGRAM_FILE_URL,
+)
 from .tokens import TELEGRAM_BOT_TOKEN
+from .update_processor import PerChatUpdateProcessor
 
 
 async def post_init(app: Application) -> None:
     """Донастраивает бота после старта."""
     await app.bot.set_my_commands([("start", "Запускает бота")])
+    await eda_assistant_registry.warm_up()
+
+
+def make_session_store() -> SessionStore:
+    """Создаёт хранилище сессий, выбранное в настройках."""
+    if SESSION_STORE == "redis":
+        return RedisSessionStore.from_url(REDIS_URL)
+    if SESSION_STORE == "sqlite" and PERSISTENCE_PATH:
+        return SQLiteSessionStore(PERSISTENCE_PATH)
+    return InMemorySessionStore()
+
 
+session_store: SessionStore = make_session_store()
 
 # Создание экземпляра бота
-application: Application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+application: Application = (
+    Application.builder()
+    .token(TELEGRAM_BOT_TOKEN)
+    .base_url(TELEGRAM_API_URL)
+    .base_file_url(TELEGRAM_FILE_URL)
+    .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES, session_store))
+    .rate_limiter(
+        TokenBucketRateLimiter(
+            global_rate=GLOBAL_SEND_RATE,
+            private_chat_rate=PRIVATE_CHAT_SEND_RATE,
+            group_chat_rate=GROUP_CHAT_SEND_RATE,
+            max_retries=SEND_MAX_RETRIES,
+        ),
+    )
+    .post_init(post_init)
+    .persistence(SessionPersistence(session_store, update_interval=PERSISTENCE_FLUSH_INTERVAL))
+    .build()
+)
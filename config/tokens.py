@@ -6,3 +6,5 @@ load_dotenv()
 
 TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
 OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+# секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token каждого вебхука
+WEBHOOK_SECRET_TOKEN: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
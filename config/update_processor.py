@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import typing
+from weakref import WeakValueDictionary
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.cancellation import FINISH_DIALOG_COMMAND, cancel_scopes
+
+from .session_store import SessionStore
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает апдейты разных чатов параллельно, а апдейты одного чата — строго по очереди.
+
+    Хэндлеры диалогов читают и дописывают context.user_data["dialog"], поэтому два сообщения
+    из одного чата не должны обрабатываться одновременно. Если передано хранилище сессий,
+    чат блокируется и между репликами бота.
+    """
+
+    def __init__(self, max_concurrent_updates: int, session_store: SessionStore | None = None):
+        if max_concurrent_updates < 1:
+            msg = "max_concurrent_updates must be a positive integer"
+            raise ValueError(msg)
+        # семафор базового класса занимается раньше блокировки чата, и апдейты одного занятого чата
+        # держали бы все слоты, поэтому он не ограничен; слоты раздаёт свой семафор после очереди чата
+        super().__init__(sys.maxsize)
+        self.session_store = session_store
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: typing.Awaitable[typing.Any],
+    ) -> None:
+        """Ждёт своей очереди внутри чата и только потом занимает слот конкурентности."""
+        key = self._chat_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        # команда завершения должна остановить текущую долгую операцию чата, не дожидаясь её окончания
+        if isinstance(update, Update) and update.message and update.message.text == FINISH_DIALOG_COMMAND:
+            cancel_scopes.cancel(key)
+
+        # пока апдейт ждёт или держит блокировку, ссылка на неё жива и словарь её не теряет
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if self.session_store is None:
+                async with self._slots:
+                    await coroutine
+                return
+            # другие реплики не должны обрабатывать этот чат параллельно нашей
+            async with self.session_store.chat_lock(key), self._slots:
+                await coroutine
+
+    async def initialize(self) -> None:
+        """Дополнительная инициализация не нужна."""
+
+    async def shutdown(self) -> None:
+        """Дополнительное завершение не нужно."""
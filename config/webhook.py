@@ -0,0 +1,172 @@
+import asyncio
+import hmac
+import json
+import signal
+
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from telegram import Update
+from telegram.ext import Application
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication
+from tornado.web import RequestHandler
+
+from exceptions.missing_setting_error import MissingSettingError
+
+from .settings import ALLOWED_UPDATES, METRICS_PORT, WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_URL
+from .tokens import WEBHOOK_SECRET_TOKEN
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"  # noqa: S105 - это имя заголовка
+
+
+class TelegramWebhookHandler(RequestHandler):
+    """Принимает апдейты от Telegram и кладёт их в очередь бота."""
+
+    def initialize(self, bot_application: Application, secret_token: str) -> None:
+        """Получает зависимости хэндлера."""
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        """Обрабатывает апдейт из тела запроса."""
+        if self.secret_token and not hmac.compare_digest(
+            self.request.headers.get(SECRET_TOKEN_HEADER, ""),
+            self.secret_token,
+        ):
+            logger.warning("Webhook request with wrong secret token")
+            self.set_status(403)
+            return
+
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        if not isinstance(data, dict):
+            self.set_status(400)
+            return
+
+        # Telegram и так фильтрует апдейты, но при локальной отправке записанных апдейтов фильтра нет
+        if any(key in data for key in ALLOWED_UPDATES):
+            try:
+                update = Update.de_json(data, self.bot_application.bot)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                logger.warning("Webhook request with malformed update")
+                self.set_status(400)
+                return
+            await self.bot_application.update_queue.put(update)
+        self.set_status(200)
+
+
+class HealthHandler(RequestHandler):
+    """Проверка живости для балансировщика и Docker."""
+
+    def initialize(self, bot_application: Application) -> None:
+        """Получает зависимости хэндлера."""
+        self.bot_application = bot_application
+
+    def get(self) -> None:
+        """Отвечает ok, пока бот запущен."""
+        if self.bot_application.running:
+            self.write("ok")
+        else:
+            self.set_status(503)
+            self.write("stopped")
+
+
+class MetricsHandler(RequestHandler):
+    """Отдаёт метрики Prometheus."""
+
+    def get(self) -> None:
+        """Отвечает текущими значениями метрик."""
+        self.set_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.write(generate_latest())
+
+
+def make_web_app(application: Application, secret_token: str = WEBHOOK_SECRET_TOKEN) -> WebApplication:
+    """Собирает публичное HTTP-приложение: вебхук и /healthz."""
+    return WebApplication(
+        [
+            ("/healthz", HealthHandler, {"bot_application": application}),
+            (WEBHOOK_PATH, TelegramWebhookHandler, {"bot_application": application, "secret_token": secret_token}),
+        ],
+    )
+
+
+def make_metrics_app(application: Application) -> WebApplication:
+    """Собирает внутреннее HTTP-приложение: /metrics и /healthz."""
+    return WebApplication(
+        [
+            ("/healthz", HealthHandler, {"bot_application": application}),
+            ("/metrics", MetricsHandler),
+        ],
+    )
+
+
+def _listen(web_app: WebApplication, port: int) -> HTTPServer:
+    server = HTTPServer(web_app)
+    server.listen(port, address=WEBHOOK_LISTEN)
+    logger.info(f"HTTP server listens on {WEBHOOK_LISTEN}:{port}")
+    return server
+
+
+async def serve(
+    application: Application,
+    webhook: bool,  # noqa: FBT001
+    register: bool = True,  # noqa: FBT001, FBT002
+    secret_token: str = WEBHOOK_SECRET_TOKEN,
+) -> None:
+    """Запускает бота и HTTP-сервер, пока процесс не получит SIGINT/SIGTERM.
+
+    В режиме вебхука апдейты приходят на WEBHOOK_PATH порта WEBHOOK_PORT, без секрета бот не запускается.
+    В режиме polling бот сам забирает апдейты. /metrics в обоих режимах отдаётся только на METRICS_PORT,
+    чтобы не открывать его вместе с вебхуком; /healthz есть на обоих портах.
+    Если register=False, вебхук в Telegram не регистрируется — удобно для локальной отправки апдейтов.
+    """
+    if webhook and not secret_token:
+        # без секрета кто угодно может прислать боту апдейт от имени любого пользователя
+        setting: str = "WEBHOOK_SECRET_TOKEN"
+        raise MissingSettingError(setting)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if webhook and register:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=secret_token,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        if application.post_init:
+            await application.post_init(application)
+        if not webhook and application.updater:
+            await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+        await application.start()
+
+        servers: list[HTTPServer] = []
+        if webhook:
+            servers.append(_listen(make_web_app(application, secret_token), WEBHOOK_PORT))
+        if METRICS_PORT:
+            servers.append(_listen(make_metrics_app(application), METRICS_PORT))
+        try:
+            await stop.wait()
+        finally:
+            for server in servers:
+                server.stop()
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+def run_webhook(application: Application) -> None:
+    """Запускает бота в режиме вебхука."""
+    asyncio.run(serve(application, webhook=True, register=bool(WEBHOOK_URL)))
+
+
+def run_polling(application: Application) -> None:
+    """Запускает бота в режиме polling."""
+    asyncio.run(serve(application, webhook=False))
@@ -0,0 +1,6 @@
+class BadDatasetError(Exception):
+    """Возникает, когда присланный файл не удаётся разобрать как CSV-датасет."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.message = f"Не получилось прочитать датасет: {reason}. Пришлите, пожалуйста, CSV-файл."
@@ -0,0 +1,6 @@
+class LLMUnavailableError(Exception):
+    """Возникает, когда OpenAI недоступен и запрос к нему не выполняется."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.message = "Сервис ответов сейчас перегружен, попробуйте, пожалуйста, через пару минут."
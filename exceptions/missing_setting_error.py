@@ -0,0 +1,6 @@
+class MissingSettingError(Exception):
+    """Возникает, когда бот запускается без обязательной настройки."""
+
+    def __init__(self, setting: str):
+        self.setting = setting
+        self.message = f"Не задана обязательная настройка {setting}"
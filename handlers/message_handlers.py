@@ -1,13 +1,9 @@
-from typing import TYPE_CHECKING
-
 from loguru import logger
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config.openai_client import client
-
-if TYPE_CHECKING:
-    from openai.types.chat.chat_completion import ChatCompletion
+from utils.helpers import single_text2text_query
+from utils.prompts import GenericUserTextPrompt
 
 
 async def chatgpt_reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:  # noqa: ARG001
@@ -23,22 +19,14 @@ async def chatgpt_reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # текст входящего сообщения
     text: str = update.message.text
 
-    # запрос
-    response: ChatCompletion = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": text}],
+    # запрос, модель выбирает model_router
+    reply: str = await single_text2text_query(
+        prompt=GenericUserTextPrompt(text=text),
         max_tokens=1024,
         temperature=0.5,
+        use_cache=False,
     )
 
-    reply: str
-    if response.choices[0].message.content is None:
-        reply = "OpenAI response context is empty"
-        logger.error(reply)
-    else:
-        # ответ
-        reply = response.choices[0].message.content.strip()
-
     # перенаправление ответа в Telegram
     await update.message.reply_text(reply)
 
@@ -0,0 +1,315 @@
+"""Load test: synthetic users walk conversation scenarios against fake OpenAI and Telegram servers.
+
+Run from the repository root:
+
+    python -m loadtest --users 100 --duration 120
+
+The bot runs in this process with its real handlers, update processor and rate limiter; only the
+network is replaced. The fake servers run on a separate event loop thread so that their work does not
+show up as lag of the bot's event loop.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import typing
+from collections import Counter, defaultdict
+from pathlib import Path
+from types import ModuleType
+
+from loguru import logger
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication
+
+from loadtest.fake_openai import FakeOpenAI, LLMProfile
+from loadtest.fake_telegram import FakeTelegram, TelegramProfile
+from loadtest.scenarios import SCENARIOS, Step, SyntheticUser
+
+BOT_TOKEN: typing.Final[str] = "123456:LOADTEST"
+# completion of an update is detected by a handler that runs after all bot handlers
+LAST_GROUP: typing.Final[int] = 1_000
+LAG_PROBE_INTERVAL: typing.Final[float] = 0.05
+PERCENTILES: typing.Final[tuple[int, ...]] = (50, 95, 99)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--users", type=int, default=50, help="simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="test duration, seconds")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds until all users are active")
+    parser.add_argument("--think-time", type=float, default=3, help="mean pause between user actions, seconds")
+    parser.add_argument("--turns", type=int, default=4, help="dialog turns per scenario")
+    parser.add_argument(
+        "--mix",
+        default="algo=0.6,eda=0.15,meme=0.25",
+        help="scenario weights, e.g. algo=0.6,eda=0.15,meme=0.25",
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="time to first token, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="fake model generation speed")
+    parser.add_argument("--reply-tokens", type=int, default=150, help="tokens per fake reply")
+    parser.add_argument("--tool-latency", type=float, default=3, help="code interpreter step of EDA runs, seconds")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="Bot API request latency, seconds")
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0, help="share of Bot API requests that get 429")
+    parser.add_argument("--update-timeout", type=float, default=300, help="give up waiting for an update, seconds")
+    parser.add_argument(
+        "--question-bank",
+        default="",
+        help="comma-separated topics to pre-generate opening tasks for through the fake Batch API",
+    )
+    parser.add_argument("--openai-port", type=int, default=18081)
+    parser.add_argument("--telegram-port", type=int, default=18082)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING", help="log level of the bot")
+    return parser.parse_args()
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parse scenario weights."""
+    weights: dict[str, float] = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            msg = f"Unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}"
+            raise SystemExit(msg)
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def serve_in_thread(apps: list[tuple[WebApplication, int]]) -> typing.Callable[[], None]:
+    """Start HTTP servers on a separate event loop thread and return a function stopping them."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run() -> None:
+        asyncio.set_event_loop(loop)
+
+        async def listen() -> None:
+            for app, port in apps:
+                HTTPServer(app).listen(port, address="127.0.0.1")
+
+        loop.run_until_complete(listen())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="fake-servers", daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop() -> None:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop
+
+
+def configure_bot(args: argparse.Namespace) -> None:
+    """Point the bot at the fake servers, before its settings are imported."""
+    os.environ["TELEGRAM_BOT_TOKEN"] = BOT_TOKEN
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{args.telegram_port}/bot"
+    os.environ["TELEGRAM_FILE_URL"] = f"http://127.0.0.1:{args.telegram_port}/file/bot"
+    os.environ["OPENAI_API_KEY"] = "loadtest"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.openai_port}/v1"
+    # tunables can still be overridden from the environment
+    os.environ.setdefault("SESSION_STORE", "memory")
+    os.environ.setdefault("RESPONSE_CACHE_PATH", "")
+    os.environ.setdefault("MEME_CACHE_PATH", "")
+    os.environ.setdefault("SEMANTIC_CACHE_PATH", "")
+    if args.question_bank:
+        os.environ["QUESTION_BANK_PATH"] = str(Path(tempfile.mkdtemp(prefix="loadtest-")) / "question_bank.sqlite")
+    else:
+        os.environ.setdefault("QUESTION_BANK_PATH", "")
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Recorder:
+    """Latencies of processed updates per conversation state."""
+
+    def __init__(self: typing.Self):
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.timeouts: Counter[str] = Counter()
+        self.scenarios: Counter[str] = Counter()
+        self.loop_lag: list[float] = []
+        self.pending: dict[int, asyncio.Future[None]] = {}
+        self.failed: set[int] = set()
+
+
+class LoadTest:
+    """Drives the bot's application with synthetic users."""
+
+    def __init__(self: typing.Self, args: argparse.Namespace, bot: ModuleType):
+        self.args = args
+        self.application = bot.application
+        self.conv_handler = bot.conv_handler
+        self.state_names: dict[object, str] = bot.state_names
+        self.weights = parse_mix(args.mix)
+        self.recorder = Recorder()
+        self.stop = asyncio.Event()
+        self.application.add_handler(TypeHandler(Update, self._on_done), group=LAST_GROUP)
+        self.application.add_error_handler(self._on_error)
+
+    async def _on_done(self: typing.Self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        future = self.recorder.pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def _on_error(self: typing.Self, update: object, _: object) -> None:
+        if isinstance(update, Update):
+            self.recorder.failed.add(update.update_id)
+
+    def _state(self: typing.Self, user: SyntheticUser) -> str:
+        state = self.conv_handler._conversations.get((user.user_id, user.user_id))  # noqa: SLF001
+        return "entry" if state is None else self.state_names.get(state, str(state))
+
+    async def send(self: typing.Self, user: SyntheticUser, step: Step) -> None:
+        """Send one update and wait until the bot has processed it."""
+        data = user.update(step)
+        state: str = self._state(user)
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.recorder.pending[data["update_id"]] = future
+
+        started_at: float = time.perf_counter()
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        try:
+            await asyncio.wait_for(future, self.args.update_timeout)
+        except TimeoutError:
+            self.recorder.timeouts[state] += 1
+            self.recorder.pending.pop(data["update_id"], None)
+            return
+        self.recorder.latencies[state].append(time.perf_counter() - started_at)
+        if data["update_id"] in self.recorder.failed:
+            self.recorder.errors[state] += 1
+
+    async def think(self: typing.Self) -> None:
+        """Pause like a user reading the reply."""
+        if self.args.think_time > 0:
+            await asyncio.sleep(random.expovariate(1 / self.args.think_time))
+
+    async def drive_user(self: typing.Self, number: int) -> None:
+        """Walk random scenarios until the test is over."""
+        await asyncio.sleep(self.args.ramp_up * number / max(1, self.args.users))
+        user = SyntheticUser(number)
+        names, weights = list(self.weights), list(self.weights.values())
+        while not self.stop.is_set():
+            name: str = random.choices(names, weights)[0]
+            for step in SCENARIOS[name](self.args.turns).steps:
+                if self.stop.is_set():
+                    return
+                await self.send(user, step)
+                await self.think()
+            self.recorder.scenarios[name] += 1
+
+    async def probe_loop_lag(self: typing.Self) -> None:
+        """Measure how late the event loop wakes up a sleeping task."""
+        while not self.stop.is_set():
+            started_at: float = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.recorder.loop_lag.append(time.perf_counter() - started_at - LAG_PROBE_INTERVAL)
+
+    async def fill_question_bank(self: typing.Self) -> None:
+        """Run the question bank job against the fake Batch API."""
+        from utils.question_bank import generate, question_bank
+        from utils.question_bank import parse_args as parse_bank_args
+
+        bank_args = parse_bank_args(["--topics", self.args.question_bank, "--poll-interval", "0.1"])
+        stored: int = await generate(bank_args, question_bank)
+        print(f"Question bank: {stored} tasks")
+
+    async def run(self: typing.Self) -> float:
+        """Run the test and return its duration in seconds."""
+        async with self.application:
+            if self.application.post_init:
+                await self.application.post_init(self.application)
+            await self.application.start()
+            if self.args.question_bank:
+                await self.fill_question_bank()
+            started_at: float = time.perf_counter()
+            users = [asyncio.create_task(self.drive_user(number)) for number in range(self.args.users)]
+            probe = asyncio.create_task(self.probe_loop_lag())
+            await asyncio.sleep(self.args.duration)
+            self.stop.set()
+            # users finish the update they are waiting for
+            await asyncio.wait(users, timeout=self.args.update_timeout)
+            elapsed: float = time.perf_counter() - started_at
+            for task in [*users, probe]:
+                task.cancel()
+            await self.application.stop()
+        return elapsed
+
+
+def report(
+    recorder: Recorder,
+    elapsed: float,
+    openai: FakeOpenAI,
+    telegram: FakeTelegram,
+) -> None:
+    """Print throughput, latency percentiles per state and event loop lag."""
+    total: int = sum(len(values) for values in recorder.latencies.values())
+    print(f"\nDuration: {elapsed:.1f}s, updates processed: {total}, throughput: {total / elapsed:.1f} updates/s")
+    print("Scenarios completed: " + ", ".join(f"{name}={count}" for name, count in recorder.scenarios.items()))
+
+    header: str = f"{'state':<20}{'updates':>9}{'errors':>8}{'timeouts':>10}"
+    print(f"\n{header}" + "".join(f"{f'p{q}':>9}" for q in PERCENTILES) + f"{'max':>9}")
+    for state in sorted(recorder.latencies.keys() | recorder.timeouts.keys()):
+        values = sorted(recorder.latencies[state])
+        cells = [percentile(values, q) for q in PERCENTILES] + [values[-1]] if values else []
+        print(
+            f"{state:<20}{len(values):>9}{recorder.errors[state]:>8}{recorder.timeouts[state]:>10}"
+            + "".join(f"{cell:>8.2f}s" for cell in cells),
+        )
+
+    if lag := sorted(recorder.loop_lag):
+        print(
+            "\nEvent loop lag: "
+            + ", ".join(f"p{q}={percentile(lag, q) * 1000:.1f}ms" for q in PERCENTILES)
+            + f", max={lag[-1] * 1000:.1f}ms",
+        )
+    print(f"\nOpenAI requests: {dict(openai.requests.most_common())}")
+    print(f"Bot API requests: {dict(telegram.requests.most_common())}")
+    print(f"Bot API requests/s: {telegram.requests.total() / elapsed:.1f}")
+
+
+def main() -> None:
+    """Start fake servers, import the bot and run the test."""
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    openai = FakeOpenAI(
+        LLMProfile(
+            first_token_latency=args.llm_latency,
+            tokens_per_second=args.tokens_per_second,
+            reply_tokens=args.reply_tokens,
+            tool_latency=args.tool_latency,
+        ),
+    )
+    telegram = FakeTelegram(TelegramProfile(latency=args.telegram_latency, retry_after_rate=args.telegram_429_rate))
+    stop_servers = serve_in_thread([(openai.make_app(), args.openai_port), (telegram.make_app(), args.telegram_port)])
+
+    configure_bot(args)
+    import app
+
+    test = LoadTest(args, app)
+    try:
+        elapsed = asyncio.run(test.run())
+    finally:
+        stop_servers()
+    report(test.recorder, elapsed, openai, telegram)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+"""Fake OpenAI API with configurable latency: chat completions, embeddings, batches and the assistants endpoints."""
+
+import array
+import asyncio
+import base64
+import itertools
+import json
+import math
+import random
+import time
+import typing
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+
+from tornado.iostream import StreamClosedError
+from tornado.web import Application, RequestHandler
+
+# streamed tokens are flushed in batches, not one timer per token
+STREAM_TICK: typing.Final[float] = 0.05
+# a line break after every so many words of a reply
+WORDS_PER_LINE: typing.Final[int] = 20
+# plain words, so that replies are valid Markdown however they are split
+WORDS: typing.Final[tuple[str, ...]] = (
+    "граф",
+    "вершина",
+    "ребро",
+    "алгоритм",
+    "сложность",
+    "память",
+    "датасет",
+    "признак",
+    "модель",
+    "ответ",
+)
+# a thread takes no new messages and runs while it has a run in one of these statuses
+ACTIVE_RUN_STATUSES: typing.Final[frozenset[str]] = frozenset(
+    {"queued", "in_progress", "requires_action", "cancelling"},
+)
+
+
+@dataclass
+class LLMProfile:
+    """How fast the fake model answers."""
+
+    # seconds until the first token
+    first_token_latency: float = 0.8
+    # standard deviation of the first token latency, as a fraction of the mean
+    latency_jitter: float = 0.3
+    tokens_per_second: float = 60.0
+    reply_tokens: int = 150
+    # duration of a code interpreter step of an assistant run, seconds
+    tool_latency: float = 3.0
+    # a streamed chat reply stops after this many chunks and the connection stays open
+    stall_after_chunks: int | None = None
+    # how long a cancelled assistant run stays in the cancelling status, seconds
+    cancel_latency: float = 1.0
+
+    def first_token_delay(self: typing.Self) -> float:
+        """Sample the time until the first token."""
+        deviation: float = self.first_token_latency * self.latency_jitter
+        return max(0.0, random.gauss(self.first_token_latency, deviation))
+
+    def tokens(self: typing.Self, max_tokens: int | None = None) -> list[str]:
+        """Generate reply tokens."""
+        count: int = min(self.reply_tokens, max_tokens or self.reply_tokens)
+        words = random.choices(WORDS, k=count)
+        return [f"{word}\n" if i % WORDS_PER_LINE == WORDS_PER_LINE - 1 else f"{word} " for i, word in enumerate(words)]
+
+
+class FakeOpenAI:
+    """State shared by the handlers of the fake API."""
+
+    def __init__(self: typing.Self, profile: LLMProfile):
+        self.profile = profile
+        self.requests: Counter[str] = Counter()
+        # statuses to answer the next requests of an endpoint with, keyed like requests
+        self.failures: dict[str, list[int]] = {}
+        self.assistants: list[dict[str, typing.Any]] = []
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, typing.Any]] = {}
+        self.runs: dict[str, dict[str, typing.Any]] = {}
+        self._ids = itertools.count(1)
+
+    def new_id(self: typing.Self, prefix: str) -> str:
+        """Return a unique object id."""
+        return f"{prefix}_{next(self._ids)}"
+
+    def make_app(self: typing.Self) -> Application:
+        """Build the HTTP application serving /v1."""
+        deps = {"api": self}
+        return Application(
+            [
+                (r"/v1/chat/completions", ChatCompletionsHandler, deps),
+                (r"/v1/embeddings", EmbeddingsHandler, deps),
+                (r"/v1/audio/transcriptions", TranscriptionsHandler, deps),
+                (r"/v1/assistants", AssistantsHandler, deps),
+                (r"/v1/assistants/([^/]+)", AssistantsHandler, deps),
+                (r"/v1/files", FilesHandler, deps),
+                (r"/v1/files/([^/]+)", FileHandler, deps),
+                (r"/v1/files/([^/]+)/content", FileContentHandler, deps),
+                (r"/v1/batches", BatchesHandler, deps),
+                (r"/v1/batches/([^/]+)", BatchesHandler, deps),
+                (r"/v1/threads", ThreadsHandler, deps),
+                (r"/v1/threads/([^/]+)", ThreadsHandler, deps),
+                (r"/v1/threads/([^/]+)/messages", MessagesHandler, deps),
+                (r"/v1/threads/([^/]+)/runs", RunsHandler, deps),
+                (r"/v1/threads/([^/]+)/runs/([^/]+)", RunHandler, deps),
+                (r"/v1/threads/([^/]+)/runs/([^/]+)/cancel", RunCancelHandler, deps),
+            ],
+        )
+
+
+class FakeOpenAIHandler(RequestHandler):
+    """Base handler: JSON bodies and server-sent events."""
+
+    def initialize(self: typing.Self, api: FakeOpenAI) -> None:
+        """Receive the shared state."""
+        self.api = api
+        self.connection_closed: bool = False
+
+    def on_connection_close(self: typing.Self) -> None:
+        """Remember that the client has gone."""
+        self.connection_closed = True
+
+    def prepare(self: typing.Self) -> None:
+        """Count the request and fail it if a failure is queued for the endpoint."""
+        endpoint: str = f"{self.request.method} {type(self).__name__}"
+        self.api.requests[endpoint] += 1
+        if statuses := self.api.failures.get(endpoint):
+            self.set_status(statuses.pop(0))
+            self.finish({"error": {"message": "Injected failure", "type": "server_error", "code": None}})
+
+    def json_body(self: typing.Self) -> dict[str, typing.Any]:
+        """Parse a JSON request body."""
+        return json.loads(self.request.body) if self.request.body else {}
+
+    def start_events(self: typing.Self) -> None:
+        """Switch the response to a server-sent event stream."""
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+
+    async def send_event(self: typing.Self, data: object, event: str | None = None) -> None:
+        """Write one server-sent event and flush it to the client."""
+        if event is not None:
+            self.write(f"event: {event}\n")
+        self.write(f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n")
+        await self.flush()
+
+
+class ChatCompletionsHandler(FakeOpenAIHandler):
+    """POST /v1/chat/completions, plain and streamed."""
+
+    async def post(self: typing.Self) -> None:
+        """Answer with random words after a simulated delay."""
+        body = self.json_body()
+        profile = self.api.profile
+        tokens = profile.tokens(body.get("max_tokens"))
+        # a rough estimate is enough for usage reporting
+        usage = {
+            "prompt_tokens": len(json.dumps(body.get("messages", []))) // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": len(json.dumps(body.get("messages", []))) // 4 + len(tokens),
+        }
+        completion_id: str = self.api.new_id("chatcmpl")
+        created = int(time.time())
+        model: str = body.get("model", "")
+        await asyncio.sleep(profile.first_token_delay())
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(tokens) / profile.tokens_per_second)
+            self.write(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        },
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        def chunk(delta: dict[str, str], finish_reason: str | None = None) -> dict[str, typing.Any]:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        self.start_events()
+        per_tick: int = max(1, round(profile.tokens_per_second * STREAM_TICK))
+        try:
+            for number, start in enumerate(range(0, len(tokens), per_tick)):
+                if number == profile.stall_after_chunks:
+                    # hang until the client gives up and closes the connection
+                    while not self.connection_closed:
+                        await asyncio.sleep(STREAM_TICK)
+                    return
+                await self.send_event(chunk({"content": "".join(tokens[start : start + per_tick])}))
+                await asyncio.sleep(STREAM_TICK)
+            await self.send_event(chunk({}, "stop"))
+            if body.get("stream_options", {}).get("include_usage"):
+                last = chunk({})
+                last["choices"] = []
+                last["usage"] = usage
+                await self.send_event(last)
+            await self.send_event("[DONE]")
+        except StreamClosedError:
+            return
+
+
+class TranscriptionsHandler(FakeOpenAIHandler):
+    """POST /v1/audio/transcriptions."""
+
+    async def post(self: typing.Self) -> None:
+        """Transcribe an uploaded voice note into random words."""
+        await asyncio.sleep(self.api.profile.first_token_delay())
+        self.write({"text": "".join(self.api.profile.tokens()).strip()})
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    """Embed text as a unit vector of hashed character trigrams: the same words in any order come out close."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        padded = f" {word} "
+        for start in range(len(padded) - 2):
+            vector[zlib.crc32(padded[start : start + 3].encode()) % dimensions] += 1.0
+    norm: float = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class EmbeddingsHandler(FakeOpenAIHandler):
+    """POST /v1/embeddings."""
+
+    def post(self: typing.Self) -> None:
+        """Embed every input, in the requested encoding."""
+        body = self.json_body()
+        inputs: list[str] = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data: list[dict[str, typing.Any]] = []
+        for index, text in enumerate(inputs):
+            embedding: list[float] | str = fake_embedding(text, body.get("dimensions") or 1536)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(array.array("f", embedding).tobytes()).decode()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens: int = sum(len(text) // 4 + 1 for text in inputs)
+        self.write(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", ""),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+
+class AssistantsHandler(FakeOpenAIHandler):
+    """GET/POST /v1/assistants and POST /v1/assistants/{id}."""
+
+    def get(self: typing.Self) -> None:
+        """List created assistants, newest first, a page after the given id."""
+        data = list(reversed(self.api.assistants))
+        # the SDK asks for the next page until it gets an empty one
+        if after := self.get_query_argument("after", None):
+            data = data[[item["id"] for item in data].index(after) + 1 :]
+        limit = int(self.get_query_argument("limit", "20"))
+        has_more: bool = len(data) > limit
+        data = data[:limit]
+        self.write(
+            {
+                "object": "list",
+                "data": data,
+                "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None,
+                "has_more": has_more,
+            },
+        )
+
+    def post(self: typing.Self, assistant_id: str | None = None) -> None:
+        """Create or update an assistant."""
+        body = self.json_body()
+        if assistant_id is not None:
+            assistant = next(item for item in self.api.assistants if item["id"] == assistant_id)
+            assistant.update(body)
+        else:
+            assistant = {
+                "id": self.api.new_id("asst"),
+                "object": "assistant",
+                "created_at": int(time.time()),
+                "description": None,
+                "metadata": {},
+                "tools": [],
+                **body,
+            }
+            self.api.assistants.append(assistant)
+        self.write(assistant)
+
+
+class FilesHandler(FakeOpenAIHandler):
+    """POST /v1/files."""
+
+    def post(self: typing.Self) -> None:
+        """Accept an uploaded file."""
+        upload = self.request.files["file"][0]
+        file_id: str = self.api.new_id("file")
+        self.api.files[file_id] = upload.body
+        self.write(
+            {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(upload.body),
+                "created_at": int(time.time()),
+                "filename": upload.filename,
+                "purpose": self.get_body_argument("purpose", "assistants"),
+                "status": "processed",
+            },
+        )
+
+
+class FileHandler(FakeOpenAIHandler):
+    """DELETE /v1/files/{id}."""
+
+    def delete(self: typing.Self, file_id: str) -> None:
+        """Delete an uploaded file."""
+        deleted: bool = self.api.files.pop(file_id, None) is not None
+        self.write({"id": file_id, "object": "file", "deleted": deleted})
+
+
+class FileContentHandler(FakeOpenAIHandler):
+    """GET /v1/files/{id}/content."""
+
+    def get(self: typing.Self, file_id: str) -> None:
+        """Return an uploaded or generated file."""
+        self.write(self.api.files[file_id])
+
+
+def _completion(model: str, content: str) -> dict[str, typing.Any]:
+    return {
+        "id": f"chatcmpl-{random.getrandbits(32):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+class BatchesHandler(FakeOpenAIHandler):
+    """POST /v1/batches and GET /v1/batches/{id}: batches complete as soon as they are created."""
+
+    def get(self: typing.Self, batch_id: str) -> None:
+        """Return a batch."""
+        self.write(self.api.batches[batch_id])
+
+    def post(self: typing.Self) -> None:
+        """Answer every request of the input file and store the results as the output file."""
+        body = self.json_body()
+        results: list[str] = []
+        for line in self.api.files[body["input_file_id"]].decode().splitlines():
+            request = json.loads(line)
+            content: str = "".join(self.api.profile.tokens(request["body"].get("max_tokens")))
+            result = {
+                "id": self.api.new_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": self.api.new_id("req"),
+                    "body": _completion(request["body"].get("model", ""), content),
+                },
+                "error": None,
+            }
+            results.append(json.dumps(result, ensure_ascii=False))
+        output_file_id: str = self.api.new_id("file")
+        self.api.files[output_file_id] = "\n".join(results).encode()
+        now = int(time.time())
+        batch = {
+            "id": self.api.new_id("batch"),
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "completed",
+            "output_file_id": output_file_id,
+            "created_at": now,
+            "completed_at": now,
+            "request_counts": {"total": len(results), "completed": len(results), "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        self.api.batches[batch["id"]] = batch
+        self.write(batch)
+
+
+class ThreadsHandler(FakeOpenAIHandler):
+    """POST /v1/threads and POST /v1/threads/{id}."""
+
+    def post(self: typing.Self, thread_id: str | None = None) -> None:
+        """Create or update a thread."""
+        body = self.json_body()
+        self.write(
+            {
+                "id": thread_id or self.api.new_id("thread"),
+                "object": "thread",
+                "created_at": int(time.time()),
+                "metadata": {},
+                "tool_resources": body.get("tool_resources", {}),
+            },
+        )
+
+
+def _message(
+    message_id: str,
+    thread_id: str,
+    text: str,
+    role: str = "assistant",
+    status: str = "completed",
+) -> dict[str, typing.Any]:
+    content = [{"type": "text", "text": {"value": text, "annotations": []}}] if text else []
+    return {
+        "id": message_id,
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "status": status,
+        "content": content,
+        "attachments": [],
+        "metadata": {},
+    }
+
+
+def _run(run_id: str, thread_id: str, assistant_id: str, status: str) -> dict[str, typing.Any]:
+    return {
+        "id": run_id,
+        "object": "thread.run",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "assistant_id": assistant_id,
+        "status": status,
+        "model": "",
+        "instructions": "",
+        "tools": [],
+        "metadata": {},
+    }
+
+
+def _step(
+    step_id: str,
+    run: dict[str, typing.Any],
+    details: dict[str, typing.Any],
+    status: str,
+) -> dict[str, typing.Any]:
+    return {
+        "id": step_id,
+        "object": "thread.run.step",
+        "created_at": int(time.time()),
+        "run_id": run["id"],
+        "assistant_id": run["assistant_id"],
+        "thread_id": run["thread_id"],
+        "type": details["type"],
+        "status": status,
+        "step_details": details,
+    }
+
+
+class MessagesHandler(FakeOpenAIHandler):
+    """POST /v1/threads/{id}/messages."""
+
+    def post(self: typing.Self, thread_id: str) -> None:
+        """Add a user message to a thread, unless a run of the thread is still active."""
+        runs = self.api.runs.values()
+        if any(run["thread_id"] == thread_id and run["status"] in ACTIVE_RUN_STATUSES for run in runs):
+            self.set_status(400)
+            message: str = f"Can't add messages to {thread_id} while a run is active."
+            self.write({"error": {"message": message, "type": "invalid_request_error", "code": None}})
+            return
+        body = self.json_body()
+        self.write(_message(self.api.new_id("msg"), thread_id, str(body.get("content", "")), role="user"))
+
+
+class RunsHandler(FakeOpenAIHandler):
+    """POST /v1/threads/{id}/runs, streamed like a code interpreter run unless tools are disabled."""
+
+    async def post(self: typing.Self, thread_id: str) -> None:
+        """Stream run events: a tool call step, then a message."""
+        body = self.json_body()
+        profile = self.api.profile
+        run = _run(self.api.new_id("run"), thread_id, body.get("assistant_id", ""), "queued")
+        self.api.runs[run["id"]] = run
+        self.start_events()
+        try:
+            await self.send_event(run, "thread.run.created")
+            run["status"] = "in_progress"
+            await self.send_event(run, "thread.run.in_progress")
+
+            if body.get("tool_choice") != "none":
+                details = {"type": "tool_calls", "tool_calls": []}
+                tool_step = _step(self.api.new_id("step"), run, details, "in_progress")
+                await self.send_event(tool_step, "thread.run.step.created")
+                await asyncio.sleep(profile.tool_latency)
+                if run["status"] != "in_progress":
+                    return
+                tool_step["status"] = "completed"
+                await self.send_event(tool_step, "thread.run.step.completed")
+
+            message_id: str = self.api.new_id("msg")
+            message_step = _step(
+                self.api.new_id("step"),
+                run,
+                {"type": "message_creation", "message_creation": {"message_id": message_id}},
+                "in_progress",
+            )
+            await self.send_event(message_step, "thread.run.step.created")
+            await self.send_event(_message(message_id, thread_id, "", status="in_progress"), "thread.message.created")
+            await asyncio.sleep(profile.first_token_delay())
+
+            tokens = profile.tokens()
+            per_tick: int = max(1, round(profile.tokens_per_second * STREAM_TICK))
+            for start in range(0, len(tokens), per_tick):
+                if run["status"] != "in_progress":
+                    return
+                text = {"value": "".join(tokens[start : start + per_tick])}
+                delta = {
+                    "id": message_id,
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": text}]},
+                }
+                await self.send_event(delta, "thread.message.delta")
+                await asyncio.sleep(STREAM_TICK)
+
+            await self.send_event(_message(message_id, thread_id, "".join(tokens)), "thread.message.completed")
+            message_step["status"] = "completed"
+            await self.send_event(message_step, "thread.run.step.completed")
+            run["status"] = "completed"
+            await self.send_event(run, "thread.run.completed")
+            await self.send_event("[DONE]", "done")
+        except StreamClosedError:
+            return
+        finally:
+            # a run goes on after the client has gone; the fake finishes it at once
+            if run["status"] == "in_progress":
+                run["status"] = "completed"
+
+
+class RunHandler(FakeOpenAIHandler):
+    """GET /v1/threads/{id}/runs/{id}."""
+
+    def get(self: typing.Self, thread_id: str, run_id: str) -> None:  # noqa: ARG002
+        """Return the run with its current status."""
+        self.write(self.api.runs[run_id])
+
+
+class RunCancelHandler(FakeOpenAIHandler):
+    """POST /v1/threads/{id}/runs/{id}/cancel."""
+
+    def post(self: typing.Self, thread_id: str, run_id: str) -> None:
+        """Start cancelling the run: it stays in the cancelling status for a while."""
+        run = self.api.runs.setdefault(run_id, _run(run_id, thread_id, "", "in_progress"))
+        if run["status"] in ACTIVE_RUN_STATUSES:
+            run["status"] = "cancelling"
+            asyncio.get_running_loop().call_later(self.api.profile.cancel_latency, run.update, {"status": "cancelled"})
+        self.write(run)
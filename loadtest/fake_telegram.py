@@ -0,0 +1,175 @@
+"""Fake Telegram Bot API: answers every method the bot calls and serves files of synthetic users."""
+
+import asyncio
+import io
+import itertools
+import json
+import random
+import time
+import typing
+from collections import Counter
+from dataclasses import dataclass
+
+from PIL import Image
+from tornado.web import Application, RequestHandler
+
+BOT_ID: typing.Final[int] = 1_000_000
+BOT_USER: typing.Final[dict[str, typing.Any]] = {
+    "id": BOT_ID,
+    "is_bot": True,
+    "first_name": "Load test bot",
+    "username": "loadtest_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+# methods answered with a message object, others are answered with True
+MESSAGE_METHODS: typing.Final[frozenset[str]] = frozenset(
+    {"sendMessage", "sendDocument", "sendPhoto", "editMessageText", "editMessageReplyMarkup"},
+)
+DATASET_ROWS: typing.Final[int] = 2000
+
+
+@dataclass
+class TelegramProfile:
+    """How the fake Bot API behaves."""
+
+    # seconds per Bot API request
+    latency: float = 0.03
+    # share of requests answered with 429 Too Many Requests
+    retry_after_rate: float = 0.0
+
+
+class FakeTelegram:
+    """State shared by the handlers of the fake Bot API."""
+
+    def __init__(self: typing.Self, profile: TelegramProfile):
+        self.profile = profile
+        self.requests: Counter[str] = Counter()
+        self._message_ids = itertools.count(1)
+        self._files: dict[str, bytes] = {}
+
+    def make_app(self: typing.Self) -> Application:
+        """Build the HTTP application serving /bot<token>/<method> and /file/bot<token>/<path>."""
+        deps = {"api": self}
+        return Application(
+            [
+                (r"/bot([^/]+)/(\w+)", BotMethodHandler, deps),
+                (r"/file/bot([^/]+)/(.+)", FileHandler, deps),
+            ],
+        )
+
+    def message(self: typing.Self, chat_id: str, text: str, message_id: str | None = None) -> dict[str, typing.Any]:
+        """Build a message sent by the bot."""
+        return {
+            "message_id": int(message_id) if message_id else next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    def file_content(self: typing.Self, file_id: str) -> bytes:
+        """Return the content of a file sent by a synthetic user, generating it on first request.
+
+        Ids look like meme-<n>, dataset-<n> or voice-<n>: the same id always has the same content, so caches hit
+        as they would for a popular meme.
+        """
+        if file_id not in self._files:
+            seed = int(file_id.rsplit("-", 1)[-1])
+            if file_id.startswith("dataset"):
+                self._files[file_id] = _dataset(seed)
+            elif file_id.startswith("voice"):
+                # only the fake Whisper reads it, and it does not look inside
+                self._files[file_id] = b"OggS" + seed.to_bytes(8, "big")
+            else:
+                self._files[file_id] = _image(seed)
+        return self._files[file_id]
+
+
+def _image(seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (64, 48))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64 * 48)])
+    buffer = io.BytesIO()
+    # upscaled noise keeps the file small while giving every meme a distinct perceptual hash
+    image.resize((800, 600), Image.Resampling.NEAREST).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _dataset(seed: int) -> bytes:
+    rng = random.Random(seed)
+    lines = ["id,age,city,income,churn"]
+    cities = ("Москва", "Казань", "Пермь", "Омск")
+    lines.extend(
+        f"{row},{rng.randint(18, 70)},{rng.choice(cities)},{rng.randint(20, 300) * 1000},{rng.randint(0, 1)}"
+        for row in range(DATASET_ROWS)
+    )
+    return "\n".join(lines).encode()
+
+
+class BotMethodHandler(RequestHandler):
+    """POST /bot<token>/<method>."""
+
+    def initialize(self: typing.Self, api: FakeTelegram) -> None:
+        """Receive the shared state."""
+        self.api = api
+
+    def argument(self: typing.Self, name: str) -> str | None:
+        """Read a request parameter, sent either as a form field or as JSON."""
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            value = json.loads(self.request.body or b"{}").get(name)
+            return None if value is None else str(value)
+        return self.get_body_argument(name, None)
+
+    async def post(self: typing.Self, _token: str, method: str) -> None:
+        """Answer a Bot API method."""
+        self.api.requests[method] += 1
+        await asyncio.sleep(self.api.profile.latency)
+        if random.random() < self.api.profile.retry_after_rate:
+            self.set_status(429)
+            self.write(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+            )
+            return
+
+        result: object = True
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            file_id: str = self.argument("file_id") or ""
+            content = self.api.file_content(file_id)
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(content),
+                "file_path": f"files/{file_id}",
+            }
+        elif method in MESSAGE_METHODS:
+            result = self.api.message(
+                self.argument("chat_id") or "0",
+                self.argument("text") or "",
+                self.argument("message_id"),
+            )
+        self.write({"ok": True, "result": result})
+
+    get = post
+
+
+class FileHandler(RequestHandler):
+    """GET /file/bot<token>/<path>."""
+
+    def initialize(self: typing.Self, api: FakeTelegram) -> None:
+        """Receive the shared state."""
+        self.api = api
+
+    async def get(self: typing.Self, _token: str, path: str) -> None:
+        """Serve a file by the path returned from getFile."""
+        self.api.requests["download"] += 1
+        await asyncio.sleep(self.api.profile.latency)
+        self.write(self.api.file_content(path.rsplit("/", 1)[-1]))
@@ -0,0 +1,184 @@
+"""Scenario paths of synthetic users and the Telegram updates they send."""
+
+import itertools
+import random
+import time
+import typing
+from dataclasses import dataclass
+
+from loadtest.fake_telegram import BOT_USER
+
+# first user id, far from real-looking ids to make synthetic chats obvious in logs
+FIRST_USER_ID: typing.Final[int] = 9_000_000_000
+# distinct memes in circulation: a small pool makes repeated memes hit the meme cache
+MEME_POOL: typing.Final[int] = 30
+# seconds of every synthetic voice note
+VOICE_DURATION: typing.Final[int] = 7
+
+_update_ids = itertools.count(1)
+_file_ids = itertools.count(1)
+
+# topics as different users type them: paraphrases should hit the semantic cache
+ALGO_TOPICS: typing.Final[tuple[str, ...]] = (
+    "Графы",
+    "графы",
+    "Динамическое программирование",
+    "программирование динамическое",
+    "Бинарный поиск",
+    "поиск бинарный",
+)
+ALGO_ANSWERS: typing.Final[tuple[str, ...]] = (
+    "Использую поиск в ширину, сложность O(V + E)",
+    "Можно хранить посещённые вершины в множестве",
+    "А если граф ориентированный?",
+    "Покажи решение на Python",
+)
+DATASET_QUESTIONS: typing.Final[tuple[str, ...]] = (
+    "Какие признаки сильнее всего связаны с оттоком?",
+    "Есть ли в данных выбросы?",
+    "Какую модель попробовать первой?",
+)
+
+
+@dataclass(frozen=True)
+class Step:
+    """One update a user sends: a command, text, button press, dataset, meme or voice note."""
+
+    kind: typing.Literal["command", "text", "callback", "document", "photo", "voice"]
+    payload: str = ""
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A path through the conversation from the main menu back to it."""
+
+    name: str
+    steps: tuple[Step, ...]
+
+
+def algo_task(turns: int) -> Scenario:
+    """Menu → ALGO_TASK → topic → several answers → /finish_dialog."""
+    return Scenario(
+        "algo",
+        (
+            Step("command", "/start"),
+            Step("callback", "KNOWLEDGE_GAIN"),
+            Step("callback", "ALGO_TASK"),
+            Step("text", random.choice(ALGO_TOPICS)),
+            *(Step("text", random.choice(ALGO_ANSWERS)) for _ in range(turns)),
+            Step("command", "/finish_dialog"),
+        ),
+    )
+
+
+def eda_upload(turns: int) -> Scenario:
+    """Menu → EDA → dataset upload → questions about it → /finish_dialog."""
+    return Scenario(
+        "eda",
+        (
+            Step("command", "/start"),
+            Step("callback", "PROBLEM_SOL"),
+            Step("callback", "EDA"),
+            Step("document", f"dataset-{next(_file_ids)}"),
+            *(Step("text", random.choice(DATASET_QUESTIONS)) for _ in range(max(1, turns // 2))),
+            Step("command", "/finish_dialog"),
+        ),
+    )
+
+
+def meme(turns: int) -> Scenario:
+    """Menu → MEME_EXPL → picture → reaction → a few dialog turns → /finish_dialog."""
+    return Scenario(
+        "meme",
+        (
+            Step("command", "/start"),
+            Step("callback", "MEME_EXPL"),
+            Step("photo", f"meme-{random.randrange(MEME_POOL)}"),
+            Step("callback", "NEED_MEME_REACTION_YES"),
+            *(Step("text", "А почему это смешно?") for _ in range(max(1, turns // 2))),
+            Step("command", "/finish_dialog"),
+        ),
+    )
+
+
+SCENARIOS: typing.Final[dict[str, typing.Callable[[int], Scenario]]] = {
+    "algo": algo_task,
+    "eda": eda_upload,
+    "meme": meme,
+}
+
+
+class SyntheticUser:
+    """Builds updates of one private chat, as Telegram would send them."""
+
+    def __init__(self: typing.Self, number: int):
+        self.user_id: int = FIRST_USER_ID + number
+        self._message_ids = itertools.count(1)
+
+    @property
+    def user(self: typing.Self) -> dict[str, typing.Any]:
+        """Telegram user object."""
+        return {"id": self.user_id, "is_bot": False, "first_name": f"User {self.user_id}", "language_code": "ru"}
+
+    @property
+    def chat(self: typing.Self) -> dict[str, typing.Any]:
+        """Private chat with the user."""
+        return {"id": self.user_id, "type": "private", "first_name": f"User {self.user_id}"}
+
+    def _message(self: typing.Self, **fields: object) -> dict[str, typing.Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self.chat,
+            "from": self.user,
+            **fields,
+        }
+
+    def update(self: typing.Self, step: Step) -> dict[str, typing.Any]:
+        """Build the update JSON for a step."""
+        update: dict[str, typing.Any] = {"update_id": next(_update_ids)}
+        if step.kind == "command":
+            update["message"] = self._message(
+                text=step.payload,
+                entities=[{"type": "bot_command", "offset": 0, "length": len(step.payload)}],
+            )
+        elif step.kind == "text":
+            update["message"] = self._message(text=step.payload)
+        elif step.kind == "document":
+            update["message"] = self._message(
+                document={
+                    "file_id": step.payload,
+                    "file_unique_id": step.payload,
+                    "file_name": "dataset.csv",
+                    "mime_type": "text/csv",
+                },
+            )
+        elif step.kind == "photo":
+            update["message"] = self._message(
+                photo=[{"file_id": step.payload, "file_unique_id": step.payload, "width": 800, "height": 600}],
+            )
+        elif step.kind == "voice":
+            update["message"] = self._message(
+                voice={
+                    "file_id": step.payload,
+                    "file_unique_id": step.payload,
+                    "duration": VOICE_DURATION,
+                    "mime_type": "audio/ogg",
+                },
+            )
+        else:
+            update["callback_query"] = {
+                "id": str(update["update_id"]),
+                "from": self.user,
+                "chat_instance": str(self.user_id),
+                "data": step.payload,
+                # the menu message the button belongs to
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": self.chat,
+                    "from": BOT_USER,
+                    "text": "Выберите задачу:",
+                },
+            }
+        return update
@@ -0,0 +1,142 @@
+"""Shared fixtures: the bot talks to the fake OpenAI and Telegram servers of the load test.
+
+The environment is set before any module of the bot is imported, since settings are read at import time.
+All coroutines run on one event loop: the OpenAI client and the bot keep connections bound to it.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import typing
+
+import pytest
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+OPENAI_PORT: typing.Final[int] = _free_port()
+TELEGRAM_PORT: typing.Final[int] = _free_port()
+BOT_TOKEN: typing.Final[str] = "123456:TESTS"
+
+os.environ.update(
+    {
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+        "TELEGRAM_FILE_URL": f"http://127.0.0.1:{TELEGRAM_PORT}/file/bot",
+        "OPENAI_API_KEY": "tests",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+        "SESSION_STORE": "memory",
+        "RESPONSE_CACHE_PATH": "",
+        "MEME_CACHE_PATH": "",
+        "SEMANTIC_CACHE_PATH": "",
+        "QUESTION_BANK_PATH": "",
+        "WEBHOOK_SECRET_TOKEN": "",
+        # the fake Bot API has no limits, tests should not wait for the token buckets
+        "GLOBAL_SEND_RATE": "1000",
+        "PRIVATE_CHAT_SEND_RATE": "1000",
+    },
+)
+
+# imported after the environment is set
+from loadtest.__main__ import LoadTest, serve_in_thread  # noqa: E402
+from loadtest.fake_openai import FakeOpenAI, LLMProfile  # noqa: E402
+from loadtest.fake_telegram import FakeTelegram, TelegramProfile  # noqa: E402
+from loadtest.scenarios import Step, SyntheticUser  # noqa: E402
+
+T = typing.TypeVar("T")
+Run = typing.Callable[[typing.Awaitable[T]], T]
+
+# synthetic users of different tests must not share user_data
+_user_numbers = itertools.count(1)
+
+
+def fast_profile() -> LLMProfile:
+    """Make a fake model quick enough for tests."""
+    return LLMProfile(
+        first_token_latency=0.02,
+        latency_jitter=0,
+        tokens_per_second=2000,
+        reply_tokens=20,
+        tool_latency=0.05,
+        cancel_latency=0.05,
+    )
+
+
+@pytest.fixture(scope="session")
+def servers() -> typing.Iterator[tuple[FakeOpenAI, FakeTelegram]]:
+    """Fake OpenAI and Telegram servers on a thread of their own."""
+    openai = FakeOpenAI(fast_profile())
+    telegram = FakeTelegram(TelegramProfile(latency=0))
+    stop = serve_in_thread([(openai.make_app(), OPENAI_PORT), (telegram.make_app(), TELEGRAM_PORT)])
+    yield openai, telegram
+    stop()
+
+
+@pytest.fixture()
+def fake_openai(servers: tuple[FakeOpenAI, FakeTelegram]) -> FakeOpenAI:
+    """Fake OpenAI with a fast model, no requests counted yet and no failures queued."""
+    openai = servers[0]
+    openai.profile = fast_profile()
+    openai.requests.clear()
+    openai.failures.clear()
+    return openai
+
+
+@pytest.fixture(scope="session")
+def loop() -> typing.Iterator[asyncio.AbstractEventLoop]:
+    """Share one event loop across the whole test session."""
+    event_loop = asyncio.new_event_loop()
+    yield event_loop
+    event_loop.close()
+
+
+@pytest.fixture()
+def run(loop: asyncio.AbstractEventLoop) -> Run:
+    """Run a coroutine on the session event loop."""
+    return loop.run_until_complete
+
+
+@pytest.fixture(scope="session")
+def bot(
+    servers: tuple[FakeOpenAI, FakeTelegram],  # noqa: ARG001
+    loop: asyncio.AbstractEventLoop,
+) -> typing.Iterator[LoadTest]:
+    """Start the bot with its real handlers, to be fed with updates of synthetic users."""
+    import app
+
+    driver = LoadTest(argparse.Namespace(mix="algo=1", update_timeout=30), app)
+    application = driver.application
+    loop.run_until_complete(application.initialize())
+    loop.run_until_complete(application.post_init(application))
+    loop.run_until_complete(application.start())
+    yield driver
+    loop.run_until_complete(application.stop())
+    loop.run_until_complete(application.shutdown())
+
+
+@pytest.fixture()
+def user() -> SyntheticUser:
+    """Make a user the bot has never seen."""
+    return SyntheticUser(next(_user_numbers))
+
+
+Walk = typing.Callable[..., typing.Awaitable[None]]
+
+
+@pytest.fixture()
+def walk(bot: LoadTest) -> Walk:
+    """Send steps of a user one by one, each after the previous one is processed, failing on handler errors."""
+
+    async def send(user: SyntheticUser, *steps: Step) -> None:
+        for step in steps:
+            errors: int = bot.recorder.errors.total() + bot.recorder.timeouts.total()
+            await bot.send(user, step)
+            assert bot.recorder.errors.total() + bot.recorder.timeouts.total() == errors, f"{step} failed"
+
+    return send
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from loadtest.__main__ import LoadTest
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import DATASET_QUESTIONS, Step, SyntheticUser
+from tests.conftest import Run, Walk
+from utils import assistants
+from utils.assistants import AssistantRegistry, eda_assistant_registry
+from utils.constants import ModelName
+
+ASSISTANT_CALLS = ("GET AssistantsHandler", "POST AssistantsHandler")
+
+
+def _assistant_calls(fake_openai: FakeOpenAI) -> int:
+    return sum(fake_openai.requests[call] for call in ASSISTANT_CALLS)
+
+
+def _eda(dataset: str) -> tuple[Step, ...]:
+    return (
+        Step("command", "/start"),
+        Step("callback", "PROBLEM_SOL"),
+        Step("callback", "EDA"),
+        Step("document", dataset),
+        Step("text", DATASET_QUESTIONS[0]),
+        Step("command", "/finish_dialog"),
+    )
+
+
+def test_uploads_make_no_assistant_calls(run: Run, walk: Walk, fake_openai: FakeOpenAI, user: SyntheticUser) -> None:
+    """The EDA assistant is looked up at startup: uploads and questions reuse it."""
+    run(walk(user, *_eda("dataset-1")))
+    run(walk(user, *_eda("dataset-2")))
+    assert _assistant_calls(fake_openai) == 0
+    assert fake_openai.requests["POST RunsHandler"] == 6
+
+
+def test_cancelled_overview_leaves_no_dataset(
+    run: Run,
+    walk: Walk,
+    fake_openai: FakeOpenAI,
+    user: SyntheticUser,
+) -> None:
+    """/finish_dialog during the overview waits for the run to stop and deletes the dataset nobody will ask about."""
+    fake_openai.profile.first_token_latency = 1.0
+    fake_openai.profile.cancel_latency = 0.3
+    files = len(fake_openai.files)
+    run(walk(user, Step("command", "/start"), Step("callback", "PROBLEM_SOL"), Step("callback", "EDA")))
+
+    async def cancel_overview() -> None:
+        overview = asyncio.ensure_future(walk(user, Step("document", "dataset-1")))
+        await asyncio.sleep(0.5)
+        await walk(user, Step("command", "/finish_dialog"))
+        await overview
+
+    run(cancel_overview())
+    assert fake_openai.requests["POST RunCancelHandler"] == 1
+    assert fake_openai.requests["GET RunHandler"] > 0
+    assert fake_openai.requests["POST MessagesHandler"] == 0
+    assert len(fake_openai.files) == files
+
+
+def test_failed_thread_leaves_no_dataset(
+    run: Run,
+    walk: Walk,
+    bot: LoadTest,
+    fake_openai: FakeOpenAI,
+    user: SyntheticUser,
+) -> None:
+    """The dataset is uploaded only once there is a thread to attach it to."""
+    fake_openai.failures["POST ThreadsHandler"] = [400]
+    run(walk(user, Step("command", "/start"), Step("callback", "PROBLEM_SOL"), Step("callback", "EDA")))
+    run(bot.send(user, Step("document", "dataset-1")))
+    assert fake_openai.requests["POST ThreadsHandler"] == 1
+    assert fake_openai.requests["POST FilesHandler"] == 0
+
+
+def test_registry_reuses_assistant_by_name(run: Run, fake_openai: FakeOpenAI) -> None:
+    """After a restart the assistant is found by name, not created again, and updated if its instructions changed."""
+    name = "tests-registry"
+    first = run(AssistantRegistry(name, "instructions", ModelName.GPT_4O, []).get())
+    again = AssistantRegistry(name, "instructions", ModelName.GPT_4O, [])
+    assert run(again.get()).id == first.id
+    assert run(again.get()).id == first.id
+    assert fake_openai.requests["POST AssistantsHandler"] == 1
+
+    changed = run(AssistantRegistry(name, "new instructions", ModelName.GPT_4O, []).get())
+    assert changed.id == first.id
+    assert changed.instructions == "new instructions"
+    assert fake_openai.requests["POST AssistantsHandler"] == 2
+
+
+def test_registry_is_warmed_at_startup(bot: LoadTest) -> None:  # noqa: ARG001
+    """post_init has already looked up the EDA assistant."""
+    assert eda_assistant_registry._assistant is not None  # noqa: SLF001
+
+
+def test_search_stops_after_limit(run: Run, fake_openai: FakeOpenAI, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Only the newest assistants of the organization are searched, an older one is created again."""
+    monkeypatch.setattr(assistants, "ASSISTANT_SEARCH_LIMIT", 3)
+    monkeypatch.setattr(assistants, "ASSISTANTS_PAGE_SIZE", 2)
+    old = run(AssistantRegistry("tests-search-limit", "instructions", ModelName.GPT_4O, []).get())
+    for number in range(5):
+        run(AssistantRegistry(f"tests-search-limit-{number}", "instructions", ModelName.GPT_4O, []).get())
+    fake_openai.requests.clear()
+
+    found = run(AssistantRegistry("tests-search-limit", "instructions", ModelName.GPT_4O, []).get())
+    assert found.id != old.id
+    assert fake_openai.requests["GET AssistantsHandler"] == 2
+
+
+def test_warm_up_fails_soft(run: Run, fake_openai: FakeOpenAI) -> None:
+    """An OpenAI failure at startup does not stop the bot, the assistant is looked up on first use."""
+    registry = AssistantRegistry("tests-warm-up", "instructions", ModelName.GPT_4O, [])
+    fake_openai.failures["GET AssistantsHandler"] = [400]
+    run(registry.warm_up())
+    assert registry._assistant is None  # noqa: SLF001
+    assert run(registry.get()).name == "tests-warm-up"
@@ -0,0 +1,63 @@
+import csv
+import io
+import zipfile
+
+import pytest
+
+from utils import dataset_compaction
+from utils.dataset_compaction import ARCHIVE_MEMBER, MIN_STRATUM_ROWS, CompactedDataset, compact_dataset
+from utils.dataset_profile import MAX_TRACKED_VALUES, profile_dataset
+
+ROWS = 3 * MAX_TRACKED_VALUES
+SAMPLE_ROWS = 300
+
+
+def _compact(text: str) -> CompactedDataset:
+    """Profile the file and compact it, as the bot does with an upload."""
+    stream = io.BytesIO(text.encode())
+    return compact_dataset(stream, profile_dataset(stream), "data.csv")
+
+
+def _unpack(compacted: CompactedDataset) -> list[list[str]]:
+    with zipfile.ZipFile(io.BytesIO(compacted.content)) as package:
+        return list(csv.reader(io.TextIOWrapper(package.open(ARCHIVE_MEMBER), encoding="utf-8")))
+
+
+def test_clean_small_file_is_uploaded_as_is() -> None:
+    text = "city,price\nMoscow,1.5\nKazan,2.5\nMoscow,3\n"
+    compacted = _compact(text)
+    assert (compacted.name, compacted.content) == ("data.csv", text.encode())
+
+
+def test_constant_and_id_columns_are_dropped() -> None:
+    """A column is dropped as an id only if its values are known to be distinct."""
+    text = "id,order_id,country,price\n1,7,RU,10\n2,7,RU,20\n3,8,RU,30\n"
+    compacted = _compact(text)
+    assert compacted.name == "data.zip"
+    assert _unpack(compacted) == [["order_id", "price"], ["7", "10"], ["7", "20"], ["8", "30"]]
+    assert "id (row identifier), country (constant)" in compacted.note
+
+
+def test_overflowed_id_is_dropped_only_if_it_is_a_row_counter() -> None:
+    """Past MAX_TRACKED_VALUES duplicates are not counted, so only consecutive integers prove an id unique."""
+    # user_id has more distinct values than are tracked, yet repeats
+    rows = (f"{row},{row // 2},{row * 0.5}" for row in range(ROWS))
+    compacted = _compact("\n".join(["row_id,user_id,amount", *rows]))
+    assert _unpack(compacted)[0] == ["user_id", "amount"]
+
+
+def test_large_file_is_sampled_by_class(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The sample has the requested size, rare classes keep all their rows up to MIN_STRATUM_ROWS."""
+    monkeypatch.setattr(dataset_compaction, "DATASET_SAMPLE_THRESHOLD_MB", 0)
+    monkeypatch.setattr(dataset_compaction, "DATASET_SAMPLE_ROWS", SAMPLE_ROWS)
+    rare: int = 30
+    rows = (f"{row * 0.5},{'1' if row < rare else '0'}" for row in range(ROWS))
+    compacted = _compact("\n".join(["amount,churn", *rows]))
+
+    sample = _unpack(compacted)[1:]
+    labels = [label for _, label in sample]
+    assert labels.count("1") == rare
+    assert labels.count("0") == round((ROWS - rare) * SAMPLE_ROWS / ROWS)
+    assert rare < MIN_STRATUM_ROWS
+    assert f"sample of {len(sample)} of {ROWS} rows" in compacted.note
+    assert "stratified by 'churn'" in compacted.note
@@ -0,0 +1,75 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+from exceptions.bad_dataset_error import BadDatasetError
+from utils import dataset_profile
+from utils.dataset_profile import MIN_BAD_ROWS, ColumnProfile, profile_dataset
+
+# Excel in Russian locale: cp1251, semicolons and decimal commas
+RUSSIAN_EXCEL_CSV = "город;цена;площадь\nМосква;1,5;40\nКазань;2,25;\nМосква;3;55\n".encode("cp1251")
+UTF8_CSV = "\ufeffcity,price\nMoscow,1.5\nKazan,2.5\n".encode()
+
+
+def _malformed_csv(bad_rows: int) -> bytes:
+    """Make a file with 100 good rows, bad_rows rows with an extra field and a few blank lines."""
+    lines = ["id,value"] + [f"{row},{row * 2}" for row in range(100)] + ["1,2,3"] * bad_rows + ["", ""]
+    return "\n".join(lines).encode()
+
+
+def _column(profile: dataset_profile.DatasetProfile, name: str) -> ColumnProfile:
+    return next(column for column in profile.columns if column.name == name)
+
+
+def test_cp1251_with_decimal_comma() -> None:
+    profile = profile_dataset(io.BytesIO(RUSSIAN_EXCEL_CSV))
+    assert (profile.encoding, profile.delimiter, profile.rows) == ("cp1251", ";", 3)
+    assert [column.name for column in profile.columns] == ["город", "цена", "площадь"]
+
+    price = _column(profile, "цена")
+    assert price.kind == "float"
+    assert price.mean == pytest.approx((1.5 + 2.25 + 3) / 3)
+    area = _column(profile, "площадь")
+    assert (area.kind, area.nulls) == ("int", 1)
+    city = _column(profile, "город")
+    assert (city.kind, city.cardinality) == ("category", "2")
+
+
+def test_utf8_with_bom() -> None:
+    profile = profile_dataset(io.BytesIO(UTF8_CSV))
+    assert (profile.encoding, profile.delimiter) == ("utf-8-sig", ",")
+    # the byte order mark is not part of the first column name
+    assert profile.columns[0].name == "city"
+
+
+def test_binary_file_is_rejected() -> None:
+    with pytest.raises(BadDatasetError):
+        profile_dataset(io.BytesIO(b"PK\x03\x04\x00\x00binary"))
+
+
+def test_a_few_malformed_rows_are_skipped() -> None:
+    """Rows with a wrong number of fields are counted and skipped, blank lines are not rows at all."""
+    profile = profile_dataset(io.BytesIO(_malformed_csv(MIN_BAD_ROWS)))
+    assert (profile.rows, profile.bad_rows) == (100, MIN_BAD_ROWS)
+    assert f"skipped malformed rows: {MIN_BAD_ROWS}" in profile.to_prompt()
+
+
+def test_many_malformed_rows_reject_the_file() -> None:
+    with pytest.raises(BadDatasetError):
+        profile_dataset(io.BytesIO(_malformed_csv(MIN_BAD_ROWS + 1)))
+
+
+def test_statistics_merged_across_chunks_match_the_whole_column(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Mean and variance merged chunk by chunk equal the ones computed over all values at once."""
+    monkeypatch.setattr(dataset_profile, "CHUNK_ROWS", 7)
+    rng = random.Random(0)
+    values = [rng.gauss(1000, 250) for _ in range(100)]
+    data = "\n".join(["value", *(f"{value!r}" for value in values)]).encode()
+
+    column = _column(profile_dataset(io.BytesIO(data)), "value")
+    assert column.count == 100
+    assert column.mean == pytest.approx(np.mean(values))
+    assert column.m2 / (column.count - 1) == pytest.approx(np.var(values, ddof=1))
+    assert (column.minimum, column.maximum) == (min(values), max(values))
@@ -0,0 +1,98 @@
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from tests.conftest import Run
+from utils.dialog_context import ConversationMemory, count_tokens
+
+PINNED: ChatCompletionMessageParam = {"role": "system", "content": "Объясни мем на картинке. " * 50}
+
+
+def _turn(number: int) -> ChatCompletionMessageParam:
+    if number % 2 == 0:
+        return {"role": "user", "content": f"реплика {number:03d}"}
+    return {"role": "assistant", "content": f"реплика {number:03d}"}
+
+
+def _turns(count: int) -> list[ChatCompletionMessageParam]:
+    """Make turns of the same size, alternating between the user and the assistant."""
+    return [_turn(number) for number in range(count)]
+
+
+def _turn_tokens() -> int:
+    return count_tokens(_turns(1))
+
+
+class StubSummarizer:
+    """Record what was folded and return a short summary of it."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list[ChatCompletionMessageParam]]] = []
+
+    async def __call__(self, summary: str, turns: list[ChatCompletionMessageParam]) -> str:
+        """Join the previous summary with the numbers of the folded turns."""
+        self.calls.append((summary, list(turns)))
+        return " ".join([summary, *(str(turn["content"])[-3:] for turn in turns)]).strip()
+
+
+def test_window_keeps_latest_turns_within_budget() -> None:
+    """Pinned messages are always sent and do not count; the newest turns fill the budget."""
+    memory = ConversationMemory(token_budget=3 * _turn_tokens())
+    memory.pin(PINNED)
+    turns = _turns(10)
+    memory.append(*turns)
+
+    assert memory.window() == [PINNED, *turns[-3:]]
+    assert list(memory) == memory.window()
+    assert len(memory) == 10
+
+
+def test_last_turn_is_sent_even_over_budget() -> None:
+    memory = ConversationMemory(token_budget=1)
+    turns = _turns(3)
+    memory.append(*turns)
+    assert memory.window() == turns[-1:]
+
+
+def test_compact_folds_evicted_turns_into_summary(run: Run) -> None:
+    memory = ConversationMemory(token_budget=4 * _turn_tokens())
+    memory.pin(PINNED)
+    summarize = StubSummarizer()
+    turns = _turns(6)
+    memory.append(*turns)
+
+    run(memory.compact(summarize))
+    assert summarize.calls[0][0] == ""
+    folded = summarize.calls[0][1]
+    assert folded == turns[: len(folded)]
+    assert memory.turns == turns[len(folded) :]
+    assert memory.summary
+
+    window = memory.window()
+    assert window[0] == PINNED
+    assert window[1]["role"] == "system"
+    assert memory.summary in str(window[1]["content"])
+    # the summary takes part of the budget, so the window may now start later than the kept turns
+    assert window[2:] == memory.turns[len(memory.turns) - len(window[2:]) :]
+    assert count_tokens(window[1:]) <= memory.token_budget
+
+
+def test_compact_extends_the_previous_summary(run: Run) -> None:
+    memory = ConversationMemory(token_budget=4 * _turn_tokens())
+    summarize = StubSummarizer()
+    memory.append(*_turns(6))
+    run(memory.compact(summarize))
+    first_summary = memory.summary
+
+    memory.append(*_turns(6))
+    run(memory.compact(summarize))
+    assert summarize.calls[-1][0] == first_summary
+    assert memory.summary.startswith(first_summary)
+
+
+def test_nothing_to_compact_within_budget(run: Run) -> None:
+    memory = ConversationMemory(token_budget=100 * _turn_tokens())
+    summarize = StubSummarizer()
+    memory.append(*_turns(4))
+    run(memory.compact(summarize))
+    assert summarize.calls == []
+    assert len(memory) == 4
+    assert memory.summary == ""
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import typing
+
+from prometheus_client import REGISTRY
+
+from config.openai_client import client
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import ALGO_ANSWERS, Step, SyntheticUser
+from tests.conftest import Run, Walk
+from utils.assistants import eda_assistant_registry
+from utils.helpers import gen_eda_text_deltas, single_text2text_query, stream_text2text_query
+from utils.prompts import GenericUserTextPrompt
+
+CONCURRENT_DIALOGS = 8
+
+
+async def _timed(*coroutines: typing.Awaitable[object]) -> float:
+    started_at = time.perf_counter()
+    await asyncio.gather(*coroutines)
+    return time.perf_counter() - started_at
+
+
+async def _stream(prompt: GenericUserTextPrompt) -> str:
+    return "".join([delta async for delta in stream_text2text_query(prompt, 100, 0.5, use_cache=False)])
+
+
+def test_concurrent_queries_take_the_time_of_one(run: Run, fake_openai: FakeOpenAI) -> None:
+    """Waiting for OpenAI does not block the event loop: N queries finish in about the time of one."""
+    fake_openai.profile.first_token_latency = 0.5
+
+    def query(number: int) -> typing.Awaitable[str]:
+        return single_text2text_query(GenericUserTextPrompt(f"вопрос {number}"), 100, 0.5, use_cache=False)
+
+    one: float = run(_timed(query(0)))
+    many: float = run(_timed(*(query(number) for number in range(CONCURRENT_DIALOGS))))
+    assert many < 2 * one
+
+
+def test_concurrent_streams_take_the_time_of_one(run: Run, fake_openai: FakeOpenAI) -> None:
+    """Streamed replies are read without blocking each other."""
+    fake_openai.profile.first_token_latency = 0.5
+
+    one: float = run(_timed(_stream(GenericUserTextPrompt("вопрос"))))
+    prompts = (GenericUserTextPrompt(f"вопрос {number}") for number in range(CONCURRENT_DIALOGS))
+    many: float = run(_timed(*(_stream(prompt) for prompt in prompts)))
+    assert many < 2 * one
+
+
+def test_concurrent_dialogs_take_the_time_of_one(run: Run, walk: Walk, fake_openai: FakeOpenAI) -> None:
+    """Opening turns of dialogs in different chats are answered in parallel."""
+    users = [SyntheticUser(number) for number in range(1000, 1000 + CONCURRENT_DIALOGS + 1)]
+    menu = (Step("command", "/start"), Step("callback", "KNOWLEDGE_GAIN"), Step("callback", "ALGO_TASK"))
+    run(_timed(*(walk(user, *menu) for user in users)))
+    fake_openai.profile.first_token_latency = 0.5
+
+    one: float = run(_timed(walk(users[0], Step("text", "Деревья отрезков"))))
+    topics = (f"Тема {number}" for number in range(CONCURRENT_DIALOGS))
+    turns = (walk(user, Step("text", topic)) for user, topic in zip(users[1:], topics, strict=True))
+    many: float = run(_timed(*turns))
+    assert many < 2 * one
+
+
+async def _eda_run(cancel_after_progress: float | None) -> tuple[list[str], float]:
+    assistant = await eda_assistant_registry.get()
+    thread = await client.beta.threads.create()
+    cancelled = asyncio.Event()
+
+    async def on_progress(_: str) -> None:
+        if cancel_after_progress is not None:
+            asyncio.get_running_loop().call_later(cancel_after_progress, cancelled.set)
+
+    started_at = time.perf_counter()
+    deltas = [delta async for delta in gen_eda_text_deltas(thread.id, assistant, on_progress, cancelled)]
+    # /finish_dialog after the reply is over
+    cancelled.set()
+    return deltas, time.perf_counter() - started_at
+
+
+def test_eda_run_is_cancelled_during_a_silent_code_step(run: Run, fake_openai: FakeOpenAI) -> None:
+    """Cancellation does not wait for the next event of a long code interpreter step."""
+    fake_openai.profile.tool_latency = 30
+    deltas, elapsed = run(_eda_run(cancel_after_progress=0.2))
+    assert deltas == []
+    assert elapsed < 2
+    assert fake_openai.requests["POST RunCancelHandler"] == 1
+
+
+def test_finished_eda_run_is_not_cancelled(run: Run, fake_openai: FakeOpenAI) -> None:
+    """A run is streamed to the end and a cancellation after it is a no-op."""
+    deltas, _ = run(_eda_run(cancel_after_progress=None))
+    assert "".join(deltas).strip()
+    assert fake_openai.requests["POST RunCancelHandler"] == 0
+
+
+def test_first_visible_token_is_measured(run: Run, walk: Walk, fake_openai: FakeOpenAI, user: SyntheticUser) -> None:
+    """A streamed reply records when the user first sees its text, which is after the first LLM token."""
+    menu = (Step("command", "/start"), Step("callback", "KNOWLEDGE_GAIN"), Step("callback", "ALGO_TASK"))
+    run(walk(user, *menu, Step("text", "Деревья отрезков")))
+    fake_openai.profile.first_token_latency = 0.3
+    count: float = REGISTRY.get_sample_value("bot_time_to_first_visible_token_seconds_count") or 0
+    total: float = REGISTRY.get_sample_value("bot_time_to_first_visible_token_seconds_sum") or 0
+
+    run(walk(user, Step("text", ALGO_ANSWERS[0])))
+    assert REGISTRY.get_sample_value("bot_time_to_first_visible_token_seconds_count") == count + 1
+    assert (REGISTRY.get_sample_value("bot_time_to_first_visible_token_seconds_sum") or 0) - total >= 0.3
@@ -0,0 +1,105 @@
+import asyncio
+import base64
+import io
+import time
+import typing
+
+import numpy as np
+from PIL import Image
+from telegram import PhotoSize
+
+from config.openai_client import client
+from loadtest.fake_openai import FakeOpenAI
+from tests.conftest import Run
+from utils.constants import ModelName
+from utils.images import LOW_DETAIL_MAX_SIDE, pick_photo_size, prepare_image
+from utils.prompts import MemeImagePrompt
+
+MAX_SIDE = 1024
+
+
+def _photo(width: int, height: int, image_format: str = "JPEG") -> bytes:
+    """Make a phone photo: smooth gradients with sensor noise, which is what makes real photos heavy."""
+    rng = np.random.default_rng(width * height)
+    gradient = np.linspace(0, 255, width)[np.newaxis, :, np.newaxis] * np.ones((height, 1, 3))
+    pixels = np.clip(gradient + rng.normal(0, 25, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=image_format, quality=95)
+    return buffer.getvalue()
+
+
+def _decoded(data_url: str) -> Image.Image:
+    header, encoded = data_url.split(",", 1)
+    assert header == "data:image/jpeg;base64"
+    return Image.open(io.BytesIO(base64.b64decode(encoded)))
+
+
+def test_large_photo_is_downscaled_to_jpeg() -> None:
+    """Photos are shrunk to max_side keeping the aspect ratio and sent as high-detail JPEG."""
+    prepared = prepare_image(_photo(3000, 2000, "PNG"), max_side=MAX_SIDE)
+    assert prepared.size == (1024, 683)
+    assert prepared.detail == "high"
+    with _decoded(prepared.data_url) as image:
+        assert image.format == "JPEG"
+        assert image.size == prepared.size
+
+
+def test_small_image_is_kept_and_sent_in_low_detail() -> None:
+    """Images that fit one 512px tile are not upscaled and cost a single low-detail tile."""
+    prepared = prepare_image(_photo(LOW_DETAIL_MAX_SIDE, 300, "PNG"), max_side=MAX_SIDE)
+    assert prepared.size == (LOW_DETAIL_MAX_SIDE, 300)
+    assert prepared.detail == "low"
+
+
+def test_prompt_reuses_the_prepared_data_url() -> None:
+    """The pinned prompt is rebuilt for every request of the dialog, the image is encoded only once."""
+    prepared = prepare_image(_photo(800, 600), max_side=MAX_SIDE)
+    prompt = MemeImagePrompt(image=prepared)
+    urls = [next(iter(prompt.messages))["content"][1]["image_url"]["url"] for _ in range(3)]  # type: ignore[index]
+    assert all(url is prepared.data_url for url in urls)
+
+
+def test_smallest_sufficient_photo_size_is_downloaded() -> None:
+    """Telegram offers several sizes of a photo; the smallest one that still covers max_side is enough."""
+    sizes = [PhotoSize(f"id{side}", f"unique{side}", side, side * 3 // 4) for side in (90, 320, 800, 1280, 2560)]
+    assert pick_photo_size(sizes, max_side=MAX_SIDE).width == 1280
+    assert pick_photo_size(sizes[:3], max_side=MAX_SIDE).width == 800
+
+
+async def _request_seconds(data_url: str, detail: typing.Literal["low", "high"]) -> float:
+    started_at = time.perf_counter()
+    await client.chat.completions.create(
+        model=ModelName.GPT_4O,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Объясни мем"},
+                    {"type": "image_url", "image_url": {"url": data_url, "detail": detail}},
+                ],
+            },
+        ],
+        max_tokens=16,
+    )
+    return time.perf_counter() - started_at
+
+
+def test_benchmark_upload_bytes_and_latency(run: Run, fake_openai: FakeOpenAI) -> None:
+    """Benchmark against the old path, which sent the largest Telegram size base64-encoded as is."""
+    photo = _photo(2560, 1920)
+    old_url = f"data:image/jpeg;base64,{base64.b64encode(photo).decode('ascii')}"
+
+    started_at = time.perf_counter()
+    prepared = run(asyncio.to_thread(prepare_image, photo))
+    prepare_seconds = time.perf_counter() - started_at
+
+    old_seconds = min(run(_request_seconds(old_url, "high")) for _ in range(3))
+    new_seconds = min(run(_request_seconds(prepared.data_url, prepared.detail)) for _ in range(3))
+    print(  # noqa: T201
+        f"\nupload: {len(old_url)} -> {len(prepared.data_url)} bytes; "
+        f"request: {old_seconds * 1000:.1f} -> {new_seconds * 1000:.1f} ms "
+        f"(+{prepare_seconds * 1000:.1f} ms to prepare in a worker thread)",
+    )
+    assert len(prepared.data_url) * 4 < len(old_url)
+    assert new_seconds < old_seconds
+    assert fake_openai.requests["POST ChatCompletionsHandler"] == 6
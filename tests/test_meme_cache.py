@@ -0,0 +1,130 @@
+import io
+import random
+import sqlite3
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import Step, SyntheticUser
+from tests.conftest import Run, Walk
+from utils.meme_cache import MemeCache, MemeCacheEntry, MemeHash, image_hash
+
+CAPTIONS = (
+    ("WHEN THE CODE", "WORKS FIRST TRY"),
+    ("PYTHON DEVS", "AFTER ONE IMPORT"),
+    ("ME FIXING", "ONE BUG"),
+    ("GIT PUSH", "--FORCE"),
+)
+
+
+def _template(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (600, 600), (200, 200, 200))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(150, 450)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.ellipse((x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)), fill=color)
+    return image.filter(ImageFilter.GaussianBlur(3))
+
+
+def _meme(seed: int, caption: tuple[str, str]) -> Image.Image:
+    image = _template(seed)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(44)
+    draw.text((20, 20), caption[0], font=font, fill="white", stroke_width=3, stroke_fill="black")
+    draw.text((20, 520), caption[1], font=font, fill="white", stroke_width=3, stroke_fill="black")
+    return image
+
+
+def _encode(image: Image.Image, side: int = 600, image_format: str = "PNG", quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    image.resize((side, side)).save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _cache(path: str = "") -> MemeCache:
+    return MemeCache(max_size=100, max_distance=6, max_detail_distance=10, path=path)
+
+
+def test_recompressed_meme_hits(run: Run) -> None:
+    """A meme forwarded through chats is resized and recompressed, but it is the same meme."""
+    cache = _cache()
+    for seed in range(3):
+        meme = _meme(seed, CAPTIONS[0])
+        run(cache.save(image_hash(_encode(meme)), MemeCacheEntry(explanation=f"meme {seed}")))
+    for seed in range(3):
+        forwarded = _encode(_meme(seed, CAPTIONS[0]), side=400, image_format="JPEG", quality=60)
+        found = run(cache.find(image_hash(forwarded)))
+        assert found is not None
+        assert found[1].explanation == f"meme {seed}"
+
+
+def test_same_template_with_another_caption_misses(run: Run) -> None:
+    """Memes of one template differ only in the caption and need their own explanations."""
+    for seed in range(3):
+        cache = _cache()
+        run(cache.save(image_hash(_encode(_meme(seed, CAPTIONS[0]))), MemeCacheEntry(explanation="first")))
+        for caption in CAPTIONS[1:]:
+            assert run(cache.find(image_hash(_encode(_meme(seed, caption))))) is None
+
+
+def _keys(count: int) -> list[MemeHash]:
+    return [image_hash(_encode(_meme(seed, CAPTIONS[0]))) for seed in range(count)]
+
+
+def _rows(path: str) -> int:
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT count(*) FROM memes").fetchone()[0]
+
+
+def test_entries_survive_restart(run: Run, tmp_path: Path) -> None:
+    path = str(tmp_path / "memes.sqlite")
+    key = image_hash(_encode(_meme(0, CAPTIONS[0])))
+    run(_cache(path).save(key, MemeCacheEntry(explanation="explanation", reaction="reaction")))
+
+    restarted = _cache(path)
+    assert restarted.get(key) == MemeCacheEntry(explanation="explanation", reaction="reaction")
+
+
+def test_evicted_memes_are_deleted_from_disk(run: Run, tmp_path: Path) -> None:
+    """The table holds no more rows than the cache holds entries."""
+    path = str(tmp_path / "memes.sqlite")
+    cache = MemeCache(max_size=2, max_distance=6, max_detail_distance=10, path=path)
+    keys = _keys(3)
+    for number, key in enumerate(keys):
+        run(cache.save(key, MemeCacheEntry(explanation=f"meme {number}")))
+    assert _rows(path) == 2
+    assert cache.get(keys[0]) is None
+
+    restarted = MemeCache(max_size=2, max_distance=6, max_detail_distance=10, path=path)
+    assert [restarted.get(key) for key in keys] == [None, MemeCacheEntry("meme 1"), MemeCacheEntry("meme 2")]
+
+
+def test_smaller_cache_keeps_newest_rows_after_restart(run: Run, tmp_path: Path) -> None:
+    path = str(tmp_path / "memes.sqlite")
+    cache = _cache(path)
+    keys = _keys(3)
+    for number, key in enumerate(keys):
+        run(cache.save(key, MemeCacheEntry(explanation=f"meme {number}")))
+
+    restarted = MemeCache(max_size=1, max_distance=6, max_detail_distance=10, path=path)
+    assert restarted.get(keys[2]) == MemeCacheEntry("meme 2")
+    assert restarted.get(keys[1]) is None
+    assert _rows(path) == 1
+
+
+def test_repeated_meme_is_explained_once(run: Run, walk: Walk, fake_openai: FakeOpenAI) -> None:
+    """The second user sending a popular meme gets the cached explanation."""
+    for number in range(2):
+        run(
+            walk(
+                SyntheticUser(2000 + number),
+                Step("command", "/start"),
+                Step("callback", "MEME_EXPL"),
+                Step("photo", "meme-1001"),
+                Step("command", "/finish_dialog"),
+            ),
+        )
+    assert fake_openai.requests["POST ChatCompletionsHandler"] == 1
@@ -0,0 +1,43 @@
+import pytest
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from utils import model_router as router_module
+from utils import resilience
+from utils.constants import ModelName
+from utils.model_router import ModelRouter, Route
+from utils.resilience import MIN_LATENCY_SAMPLES
+
+ROUTE = Route(primary=ModelName.GPT_4O, latency_slo=1, reply_slo=10)
+MESSAGES: list[ChatCompletionMessageParam] = [{"role": "user", "content": "вопрос"}]
+
+
+@pytest.fixture()
+def router(monkeypatch: pytest.MonkeyPatch) -> ModelRouter:
+    """Make a router with one route that never probes the primary while it breaches the SLO."""
+    monkeypatch.setattr(router_module, "PROBE_SHARE", 0)
+    return ModelRouter({"Prompt": ROUTE})
+
+
+def test_plain_replies_are_checked_against_their_own_slo(router: ModelRouter) -> None:
+    """A whole plain reply takes longer than the first token of a stream and does not count against it."""
+    for _ in range(MIN_LATENCY_SAMPLES):
+        router.record(ModelName.GPT_4O, "Prompt", 5, streamed=False)
+    assert router.pick("Prompt", MESSAGES, streamed=True) == ModelName.GPT_4O
+    assert router.pick("Prompt", MESSAGES) == ModelName.GPT_4O
+
+    for _ in range(MIN_LATENCY_SAMPLES):
+        router.record(ModelName.GPT_4O, "Prompt", 2, streamed=True)
+    assert router.pick("Prompt", MESSAGES, streamed=True) == ROUTE.fallback
+    assert router.pick("Prompt", MESSAGES) == ModelName.GPT_4O
+
+
+def test_old_latencies_are_forgotten(router: ModelRouter, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The primary gets its traffic back once slow samples age out, without waiting for probes."""
+    now = 1000.0
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        router.record(ModelName.GPT_4O, "Prompt", 2, streamed=True)
+    assert router.pick("Prompt", MESSAGES, streamed=True) == ROUTE.fallback
+
+    now += router_module.LATENCY_MAX_AGE + 1
+    assert router.pick("Prompt", MESSAGES, streamed=True) == ModelName.GPT_4O
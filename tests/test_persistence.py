@@ -0,0 +1,128 @@
+import pickle
+import typing
+from pathlib import Path
+
+import fakeredis
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+
+from config.persistence import SessionConversationHandler, SessionPersistence, install_session_sync
+from config.session_store import ConversationWrites, RedisSessionStore, SessionStore, SQLiteSessionStore, UserWrites
+from config.settings import TELEGRAM_API_URL, TELEGRAM_FILE_URL
+from loadtest.__main__ import LoadTest
+from loadtest.scenarios import Step, SyntheticUser
+from tests.conftest import BOT_TOKEN, Run
+
+COUNTING: typing.Final[int] = 1
+
+
+async def _start(_: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    typing.cast(dict, context.user_data)["texts"] = []
+    return COUNTING
+
+
+async def _count(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    typing.cast(dict, context.user_data)["texts"].append(typing.cast(str, update.effective_message.text))  # type: ignore[union-attr]
+    return COUNTING
+
+
+def make_application(store: SessionStore) -> Application:
+    """Build a bot with one persistent conversation that records the texts a user sends."""
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .base_file_url(TELEGRAM_FILE_URL)
+        .persistence(SessionPersistence(store, update_interval=60))
+        .build()
+    )
+    conversation = SessionConversationHandler(
+        entry_points=[CommandHandler("start", _start)],
+        states={COUNTING: [MessageHandler(filters.TEXT & ~filters.COMMAND, _count)]},
+        fallbacks=[],
+        name="tests",
+        persistent=True,
+    )
+    application.add_handler(conversation)
+    install_session_sync(application, conversation)
+    return application
+
+
+async def send(application: Application, user: SyntheticUser, *steps: Step) -> None:
+    """Process the steps and write the changes to the store, as the persistence job would."""
+    for step in steps:
+        await application.process_update(Update.de_json(user.update(step), application.bot))
+    await application.update_persistence()
+    await typing.cast(SessionPersistence, application.persistence).sync()
+
+
+def test_state_and_user_data_survive_restart(run: Run, bot: LoadTest, tmp_path: Path) -> None:  # noqa: ARG001
+    """A restarted bot goes on with the dialog: its state is loaded at start, user_data on the first update."""
+    path = str(tmp_path / "state.sqlite")
+    user = SyntheticUser(9201)
+
+    async def before_restart() -> None:
+        async with make_application(SQLiteSessionStore(path)) as application:
+            await send(application, user, Step("command", "/start"), Step("text", "первый"))
+
+    async def after_restart() -> tuple[bool, list[str]]:
+        async with make_application(SQLiteSessionStore(path)) as application:
+            loaded_before_update: bool = user.user_id in application.user_data
+            await send(application, user, Step("text", "второй"))
+            return loaded_before_update, application.user_data[user.user_id]["texts"]
+
+    run(before_restart())
+    loaded_before_update, texts = run(after_restart())
+    assert not loaded_before_update
+    # the text is recorded only if the restarted bot knows the dialog is in the COUNTING state
+    assert texts == ["первый", "второй"]
+
+
+def test_replicas_hand_the_dialog_over_through_redis(run: Run, bot: LoadTest) -> None:  # noqa: ARG001
+    """Two bots on one Redis store continue each other's dialog: each update may go to either of them."""
+    store = RedisSessionStore(fakeredis.FakeAsyncRedis())
+    user = SyntheticUser(9202)
+
+    async def alternate() -> list[list[str]]:
+        async with make_application(store) as first, make_application(store) as second:
+            await send(first, user, Step("command", "/start"))
+            await send(second, user, Step("text", "первый"))
+            await send(first, user, Step("text", "второй"))
+            await send(second, user, Step("text", "третий"))
+            return [first.user_data[user.user_id]["texts"], second.user_data[user.user_id]["texts"]]
+
+    # each replica reads what the other one wrote, so both end up with the whole dialog
+    assert run(alternate()) == [["первый", "второй"], ["первый", "второй", "третий"]]
+
+
+class CountingStore(SQLiteSessionStore):
+    """Count the batches written to SQLite."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.batches: list[tuple[UserWrites, ConversationWrites]] = []
+
+    async def save(self, users: UserWrites, conversations: ConversationWrites) -> None:
+        """Record the batch and write it."""
+        self.batches.append((dict(users), dict(conversations)))
+        await super().save(users, conversations)
+
+
+def test_changes_of_one_flush_are_written_at_once(run: Run, tmp_path: Path) -> None:
+    """Writes requested one after another are coalesced into one batch, the latest version wins."""
+    store = CountingStore(str(tmp_path / "state.sqlite"))
+    persistence = SessionPersistence(store, update_interval=60)
+
+    async def flush() -> None:
+        for version in range(3):
+            await persistence.update_user_data(1, {"version": version})
+            await persistence.update_user_data(2, {"version": version})
+            await persistence.update_conversation("tests", (1, 1), COUNTING)
+        await persistence.sync()
+
+    run(flush())
+    assert len(store.batches) == 1
+    users, conversations = store.batches[0]
+    assert sorted(users) == [1, 2]
+    assert len(conversations) == 1
+    assert pickle.loads(typing.cast(bytes, run(store.load_user(1)))) == {"version": 2}  # noqa: S301
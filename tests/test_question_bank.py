@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import pytest
+
+import app
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import Step, SyntheticUser
+from tests.conftest import Run, Walk
+from utils.prompts import AlgoTaskMakerPrompt
+from utils.question_bank import BankKey, QuestionBank, batch_requests, collect_batch, submit_batch
+
+TOPIC = "Хеш-таблицы"
+
+
+@pytest.fixture()
+def bank(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> QuestionBank:
+    """Make an empty bank and let the bot use it."""
+    filled = QuestionBank(str(tmp_path / "bank.sqlite"))
+    monkeypatch.setattr(app, "question_bank", filled)
+    return filled
+
+
+def test_bank_is_hit_after_settings_change(
+    run: Run,
+    walk: Walk,
+    fake_openai: FakeOpenAI,
+    bank: QuestionBank,
+    user: SyntheticUser,
+) -> None:
+    """The level and difficulty chosen in the settings are the ones the bank is keyed by."""
+    bank.add(BankKey.of(AlgoTaskMakerPrompt.__name__, TOPIC, "SENIOR", "HARD"), "Задача из банка")
+    run(
+        walk(
+            user,
+            Step("command", "/start"),
+            Step("callback", "KNOWLEDGE_GAIN"),
+            Step("callback", "USER_SETTINGS"),
+            Step("callback", "INTERVIEW_HARD"),
+            Step("callback", "SENIOR"),
+            Step("callback", "QUESTIONS_HARD"),
+            Step("callback", "HARD"),
+            Step("callback", "BACK"),
+            Step("callback", "KNOWLEDGE_GAIN"),
+            Step("callback", "ALGO_TASK"),
+            Step("text", TOPIC),
+        ),
+    )
+    assert fake_openai.requests["POST ChatCompletionsHandler"] == 0
+    assert app.application.user_data[user.user_id]["dialog"].turns[-1]["content"] == "Задача из банка"
+
+
+@pytest.mark.parametrize(
+    ("stored", "expected"),
+    [
+        ({}, ("JUNIOR", "EASY")),
+        ({"interview_hard": "MIDDLE", "questions_hard": "MEDIUM"}, ("MIDDLE", "MEDIUM")),
+        # stored by the swapped handlers
+        ({"interview_hard": "HARD", "questions_hard": "SENIOR"}, ("SENIOR", "HARD")),
+        ({"interview_hard": "HARD", "questions_hard": "EASY"}, ("JUNIOR", "HARD")),
+        ({"interview_hard": "JUNIOR", "questions_hard": "INTERN"}, ("INTERN", "EASY")),
+    ],
+)
+def test_stored_levels_are_restored(stored: dict[str, str], expected: tuple[str, str]) -> None:
+    app.restore_user_levels(stored)
+    assert (stored["interview_hard"], stored["questions_hard"]) == expected
+
+
+def test_batch_results_are_served_in_rotation(run: Run, fake_openai: FakeOpenAI, bank: QuestionBank) -> None:
+    """Tasks generated by a batch are stored under the key a user types, and a user gets each at most once."""
+    requests = batch_requests([AlgoTaskMakerPrompt.__name__], [TOPIC], ["SENIOR"], ["HARD"], variants=3)
+    assert len({request["custom_id"] for request in requests}) == 3
+    assert run(collect_batch(run(submit_batch(requests)), bank, poll_interval=0)) == 3
+    assert fake_openai.requests["POST BatchesHandler"] == 1
+
+    key = BankKey.of(AlgoTaskMakerPrompt.__name__, f" {TOPIC.upper()}! ", "SENIOR", "HARD")
+    served = [run(bank.take(key)) for _ in range(3)]
+    ids = {task[0] for task in served if task is not None}
+    # the least served task goes first, so three takes give three different tasks
+    assert len(ids) == 3
+    first_id: int = min(ids)
+    first = next(task for task in served if task is not None and task[0] == first_id)
+    assert run(bank.take(key, exclude=ids - {first_id})) == first
+    assert run(bank.take(key, exclude=ids)) is None
@@ -0,0 +1,72 @@
+import asyncio
+import time
+import typing
+
+from prometheus_client import REGISTRY
+from telegram.error import RetryAfter
+
+from config.rate_limiter import TokenBucketRateLimiter
+from tests.conftest import Run
+
+CHAT: typing.Final[int] = 1
+OTHER_CHAT: typing.Final[int] = 2
+
+
+def _limiter() -> TokenBucketRateLimiter:
+    return TokenBucketRateLimiter(global_rate=1000, private_chat_rate=1000, group_chat_rate=1000, max_retries=2)
+
+
+def _queue_depth() -> float:
+    return REGISTRY.get_sample_value("bot_telegram_send_queue_depth") or 0
+
+
+def test_messages_of_a_chat_keep_their_order(run: Run) -> None:
+    """Requests to one chat are sent one after another in the order they were made."""
+    limiter = _limiter()
+    sent: list[int] = []
+    depths: list[float] = []
+
+    async def send(number: int) -> int:
+        depths.append(_queue_depth())
+        # later requests finish sooner if they are let through concurrently
+        await asyncio.sleep(0.01 * (10 - number))
+        sent.append(number)
+        return number
+
+    async def send_all() -> list[int]:
+        requests = [
+            limiter.process_request(send, (number,), {}, "sendMessage", {"chat_id": CHAT}, None) for number in range(10)
+        ]
+        return await asyncio.gather(*requests)
+
+    assert run(send_all()) == list(range(10))
+    assert sent == list(range(10))
+    # requests waiting for the chat are counted until they are sent
+    assert max(depths) == 9
+    assert _queue_depth() == 0
+
+
+def test_retry_after_pauses_every_chat(run: Run) -> None:
+    """After RetryAfter nothing is sent to any chat until the pause is over, then the request is retried."""
+    limiter = _limiter()
+    sent_at: dict[str, float] = {}
+    failed: list[float] = []
+
+    async def flooded() -> None:
+        if not failed:
+            failed.append(time.monotonic())
+            raise RetryAfter(1)
+        sent_at["flooded"] = time.monotonic()
+
+    async def other() -> None:
+        sent_at["other"] = time.monotonic()
+
+    async def send_both() -> None:
+        first = asyncio.ensure_future(limiter.process_request(flooded, (), {}, "sendMessage", {"chat_id": CHAT}, None))
+        await asyncio.sleep(0.1)
+        await limiter.process_request(other, (), {}, "sendMessage", {"chat_id": OTHER_CHAT}, None)
+        await first
+
+    run(send_both())
+    assert sent_at["other"] - failed[0] >= 0.9
+    assert sent_at["flooded"] - failed[0] >= 0.9
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from exceptions.llm_unavailable_error import LLMUnavailableError
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import DATASET_QUESTIONS, Step, SyntheticUser
+from tests.conftest import Run, Walk
+from utils import resilience
+from utils.helpers import single_text2text_query, stream_text2text_query
+from utils.prompts import GenericUserTextPrompt
+from utils.resilience import CallPolicy, CircuitBreaker, _hedged, resilient_call
+
+FAST_POLICY = CallPolicy(name="tests", deadline=10, base_delay=0.01, idle_timeout=0.5)
+
+
+@pytest.fixture()
+def breaker(monkeypatch: pytest.MonkeyPatch) -> CircuitBreaker:
+    """Replace the breaker with a fresh one, so that failures of one test do not open it for the others."""
+    fresh = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+    monkeypatch.setattr(resilience, "openai_breaker", fresh)
+    return fresh
+
+
+def test_server_errors_are_retried(run: Run, fake_openai: FakeOpenAI, breaker: CircuitBreaker) -> None:  # noqa: ARG001
+    fake_openai.failures["POST ChatCompletionsHandler"] = [500, 503]
+    reply = run(single_text2text_query(GenericUserTextPrompt("вопрос"), 100, 0.5, use_cache=False, policy=FAST_POLICY))
+    assert reply
+    assert fake_openai.requests["POST ChatCompletionsHandler"] == 3
+
+
+def test_stalled_stream_is_given_up(run: Run, fake_openai: FakeOpenAI, breaker: CircuitBreaker) -> None:
+    """A reply that stops midway fails after idle_timeout instead of hanging the dialog."""
+    fake_openai.profile.stall_after_chunks = 1
+    fake_openai.profile.tokens_per_second = 100
+
+    async def read() -> list[str]:
+        prompt = GenericUserTextPrompt("вопрос")
+        return [delta async for delta in stream_text2text_query(prompt, 100, 0.5, use_cache=False, policy=FAST_POLICY)]
+
+    started_at = time.perf_counter()
+    with pytest.raises(LLMUnavailableError):
+        run(read())
+    assert time.perf_counter() - started_at < 2
+    assert breaker._failures == 1  # noqa: SLF001
+
+
+def test_half_open_breaker_lets_one_probe_through(run: Run, breaker: CircuitBreaker) -> None:
+    """After reset_timeout a single call probes OpenAI, the others are rejected until it ends."""
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(breaker.reset_timeout)
+    calls: list[int] = []
+
+    async def call() -> int:
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    async def concurrently() -> list[int | BaseException]:
+        return await asyncio.gather(*(resilient_call(call, FAST_POLICY) for _ in range(5)), return_exceptions=True)
+
+    results = run(concurrently())
+    assert calls == [1]
+    assert results.count(1) == 1
+    assert sum(isinstance(result, LLMUnavailableError) for result in results) == 4
+    # the probe succeeded and closed the breaker
+    assert run(resilient_call(call, FAST_POLICY)) == 2
+
+
+def test_cancelled_probe_lets_the_next_call_probe(run: Run, breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(breaker.reset_timeout)
+
+    async def cancel_probe() -> None:
+        probe = asyncio.ensure_future(resilient_call(lambda: asyncio.sleep(10), FAST_POLICY))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    run(cancel_probe())
+    assert breaker.admit()
+
+
+def test_slow_call_is_hedged(run: Run) -> None:
+    """A second copy starts after the delay, the first success is returned and the slow copy is cancelled."""
+    started: list[asyncio.Future[None]] = []
+
+    async def call() -> int:
+        started.append(asyncio.ensure_future(asyncio.sleep(10 if not started else 0)))
+        await started[-1]
+        return len(started)
+
+    started_at = time.perf_counter()
+    assert run(_hedged(call, 0.05)) == 2
+    assert time.perf_counter() - started_at < 1
+    assert started[0].cancelled()
+
+
+def test_fast_call_is_not_hedged(run: Run) -> None:
+    calls: list[int] = []
+
+    async def call() -> int:
+        calls.append(1)
+        return len(calls)
+
+    assert run(_hedged(call, 0.5)) == 1
+    assert calls == [1]
+
+
+def test_deadline_of_the_policy_bounds_the_call(run: Run, breaker: CircuitBreaker) -> None:
+    """A call that outlives the deadline of its policy fails with LLMUnavailableError and counts as a failure."""
+    policy = CallPolicy(name="tests", deadline=0.2)
+
+    started_at = time.perf_counter()
+    with pytest.raises(LLMUnavailableError, match="tests deadline"):
+        run(resilient_call(lambda: asyncio.sleep(10), policy))
+    assert time.perf_counter() - started_at < 1
+    assert breaker._failures == 1  # noqa: SLF001
+
+
+@pytest.mark.parametrize("endpoint", ["POST ThreadsHandler", "POST FilesHandler", "POST MessagesHandler"])
+def test_assistants_calls_are_retried(
+    run: Run,
+    walk: Walk,
+    fake_openai: FakeOpenAI,
+    user: SyntheticUser,
+    endpoint: str,
+) -> None:
+    """Assistants and Files calls go around resilient_call, the SDK retries them."""
+    fake_openai.failures[endpoint] = [500]
+    run(
+        walk(
+            user,
+            Step("command", "/start"),
+            Step("callback", "PROBLEM_SOL"),
+            Step("callback", "EDA"),
+            Step("document", "dataset-1"),
+            Step("text", DATASET_QUESTIONS[0]),
+        ),
+    )
+    assert fake_openai.requests[endpoint] > 1
+    assert fake_openai.failures[endpoint] == []
@@ -0,0 +1,54 @@
+from prometheus_client import REGISTRY
+
+from tests.conftest import Run
+from utils.response_cache import ResponseCache, make_cache_key
+
+INDENTED = "def check(items):\n    for item in items:\n        if item:\n            return True\n    return False\n"
+DEDENTED = (
+    "def check(items):\n    for item in items:\n        if item:\n            return True\n        return False\n"
+)
+
+
+def _key(text: str) -> str:
+    return make_cache_key("gpt-4o", [{"role": "user", "content": [{"type": "text", "text": text}]}], 100, 0.5)
+
+
+def test_code_with_different_indentation_has_different_keys() -> None:
+    """In Python indentation changes the meaning of code, so the reply for one version is wrong for the other."""
+    assert _key(INDENTED) != _key(DEDENTED)
+    assert _key("a = 1\nb = 2") != _key("a = 1 b = 2")
+
+
+def test_indentation_of_the_first_line_is_kept() -> None:
+    """A snippet cut from the middle of a function starts indented, dedenting it changes the code."""
+    assert _key("\n    return True\nreturn False") != _key("return True\nreturn False")
+
+
+def test_trailing_whitespace_and_line_endings_do_not_matter() -> None:
+    """Copy-pasted code differs in line endings and trailing spaces, not in meaning."""
+    messy = "\n\n" + INDENTED.replace("\n", "  \r\n") + "\n"
+    assert _key(messy) == _key(INDENTED)
+
+
+def test_string_content_is_normalized_the_same_way() -> None:
+    """System prompts are plain strings and follow the same rules."""
+
+    def key(text: str) -> str:
+        return make_cache_key("gpt-4o", [{"role": "system", "content": text}], 100, 0.5)
+
+    assert key("\n  x\r\n  y \n\n") == key("  x\n  y")
+    assert key("  x\n  y") != key("x\n  y")
+    assert key("x\n  y") != key("x\ny")
+
+
+def _lookups(result: str) -> float:
+    return REGISTRY.get_sample_value("bot_response_cache_lookups_total", {"result": result}) or 0
+
+
+def test_hits_and_misses_are_exported(run: Run) -> None:
+    cache = ResponseCache(max_size=10, ttl=60)
+    hits, misses = _lookups("hit"), _lookups("miss")
+    assert run(cache.get("key")) is None
+    run(cache.set("key", "reply"))
+    assert run(cache.get("key")) == "reply"
+    assert (_lookups("hit") - hits, _lookups("miss") - misses) == (1, 1)
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from loadtest.fake_openai import FakeOpenAI
+from tests.conftest import Run
+from utils.question_bank import BankKey
+from utils.semantic_cache import SemanticCache
+
+KEY = BankKey.of("AlgoTaskMakerPrompt", "линейная регрессия", "JUNIOR", "EASY")
+
+
+def test_seen_entry_does_not_hide_the_one_reusing_its_slot(run: Run, fake_openai: FakeOpenAI) -> None:  # noqa: ARG001
+    """A user excludes entries they have seen; a new entry in the slot of an evicted one is not among them."""
+    cache = SemanticCache(capacity=1, threshold=0.8)
+    run(cache.save(KEY, "первая задача"))
+    seen_id, value = run(cache.find(KEY))
+    assert value == "первая задача"
+
+    run(cache.save(KEY, "вторая задача"))
+    found = run(cache.find(KEY, exclude=[seen_id]))
+    assert found is not None
+    assert found[0] != seen_id
+    assert found[1] == "вторая задача"
+    assert run(cache.find(KEY, exclude=[seen_id, found[0]])) is None
+
+
+def test_ids_are_not_reused_after_restart(run: Run, fake_openai: FakeOpenAI, tmp_path: Path) -> None:  # noqa: ARG001
+    path = str(tmp_path / "semantic.sqlite")
+    cache = SemanticCache(capacity=2, threshold=0.8, path=path)
+    run(cache.save(KEY, "первая задача"))
+    run(cache.save(KEY, "вторая задача"))
+
+    restarted = SemanticCache(capacity=2, threshold=0.8, path=path)
+    assert sorted(entry.id for entry in restarted.entries.values()) == [1, 2]
+    run(restarted.save(KEY, "третья задача"))
+    assert sorted(entry.id for entry in restarted.entries.values()) == [2, 3]
@@ -0,0 +1,109 @@
+import asyncio
+import random
+import typing
+
+import pytest
+from telegram import Bot, Update
+
+from config.session_store import InMemorySessionStore, SessionStore
+from config.update_processor import PerChatUpdateProcessor
+from loadtest.__main__ import LoadTest
+from loadtest.scenarios import ALGO_ANSWERS, Step, SyntheticUser
+from tests.conftest import BOT_TOKEN, Run, Walk
+
+CHATS = 20
+UPDATES_PER_CHAT = 10
+MAX_CONCURRENT = 8
+
+
+class Tracker:
+    """What the handlers saw: events per chat and how many handlers ran at once."""
+
+    def __init__(self: typing.Self):
+        self.events: dict[int, list[str]] = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def handle(self: typing.Self, chat_id: int, number: int) -> None:
+        """Record the start and the end of a handler that awaits several times in between."""
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        events = self.events.setdefault(chat_id, [])
+        events.append(f"start {number}")
+        # a handler awaits OpenAI and Telegram several times while it runs
+        for _ in range(3):
+            await asyncio.sleep(random.uniform(0, 0.01))
+        events.append(f"end {number}")
+        self.running -= 1
+
+
+async def _stress(processor: PerChatUpdateProcessor, tracker: Tracker) -> None:
+    users = [SyntheticUser(number) for number in range(CHATS)]
+    bot = Bot(BOT_TOKEN)
+    tasks = []
+    for number in range(UPDATES_PER_CHAT):
+        for user in users:
+            update = Update.de_json(user.update(Step("text", str(number))), bot)
+            coroutine = tracker.handle(user.user_id, number)
+            tasks.append(asyncio.create_task(processor.process_update(update, coroutine)))
+            # PTB starts a task per update in the order updates arrive
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.parametrize("session_store", [None, InMemorySessionStore()])
+def test_updates_of_one_chat_are_never_interleaved(run: Run, session_store: SessionStore | None) -> None:
+    """Updates of a chat are handled one after another in arrival order, chats run in parallel under the cap."""
+    processor = PerChatUpdateProcessor(MAX_CONCURRENT, session_store)
+    tracker = Tracker()
+    run(_stress(processor, tracker))
+
+    expected = [event for number in range(UPDATES_PER_CHAT) for event in (f"start {number}", f"end {number}")]
+    assert len(tracker.events) == CHATS
+    assert all(events == expected for events in tracker.events.values())
+    assert 1 < tracker.max_running <= MAX_CONCURRENT
+
+
+def test_busy_chat_does_not_hold_the_slots(run: Run) -> None:
+    """Updates waiting for their chat take no concurrency slot, so other chats are not starved."""
+    processor = PerChatUpdateProcessor(2)
+    bot = Bot(BOT_TOKEN)
+    busy, other = SyntheticUser(1), SyntheticUser(2)
+    finished: list[int] = []
+
+    async def handle(chat_id: int) -> None:
+        await asyncio.sleep(0.05)
+        finished.append(chat_id)
+
+    async def send() -> None:
+        tasks = [
+            asyncio.create_task(
+                processor.process_update(Update.de_json(user.update(Step("text", "x")), bot), handle(user.user_id)),
+            )
+            for user in [busy] * 5 + [other]
+        ]
+        await asyncio.gather(*tasks)
+
+    run(send())
+    assert finished.index(other.user_id) < 2
+
+
+def test_dialog_history_is_not_interleaved(run: Run, bot: LoadTest, walk: Walk, user: SyntheticUser) -> None:
+    """Answers sent before the previous reply arrives are recorded in order, each followed by its reply."""
+    run(
+        walk(
+            user,
+            Step("command", "/start"),
+            Step("callback", "KNOWLEDGE_GAIN"),
+            Step("callback", "ALGO_TASK"),
+            Step("text", "Хеш-таблицы"),
+        ),
+    )
+
+    async def answer_at_once() -> None:
+        await asyncio.gather(*(walk(user, Step("text", answer)) for answer in ALGO_ANSWERS))
+
+    run(answer_at_once())
+    turns = bot.application.user_data[user.user_id]["dialog"].turns
+    assert [turn["role"] for turn in turns] == ["assistant", *(["user", "assistant"] * len(ALGO_ANSWERS))]
+    assert [turn["content"] for turn in turns if turn["role"] == "user"] == list(ALGO_ANSWERS)
@@ -0,0 +1,116 @@
+import random
+import time
+import typing
+
+import pytest
+
+from utils.utils import MIN_CHUNK_SIZE, MarkdownSplitter, text_splitter
+
+MAX_CHUNK_SIZE = 4096
+WORDS = "the quick brown **fox** jumps over `lazy` dog. and then".split()
+
+
+def _baseline_splitter(text: str, max_chunk_size: int = MAX_CHUNK_SIZE) -> typing.Generator[str, None, None]:
+    """text_splitter before the Markdown-aware splitter, kept for the benchmark."""
+    chunks: list[str] = []
+    for chunk in text.split("\n"):
+        if len(chunk) <= max_chunk_size:
+            chunks.append(f"{chunk}\n")
+        else:
+            chunks.extend([f"{sentence}." for sentence in chunk.split(".")])
+            chunks[-1] = chunks[-1][:-1]
+
+    i: int = 0
+    while i < len(chunks):
+        cur_text: str = chunks[i]
+        j = i + 1
+        while j < len(chunks) and len(cur_text + chunks[j]) < max_chunk_size:
+            cur_text += chunks[j]
+            j += 1
+        yield cur_text.strip()
+        i = j
+
+
+def _reply(size: int) -> str:
+    rng = random.Random(size)
+    lines: list[str] = []
+    while sum(map(len, lines)) < size:
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 30))))
+    return "\n".join(lines)
+
+
+def _best_of(repeat: int, function: typing.Callable[[], object]) -> float:
+    timings: list[float] = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+@pytest.mark.parametrize("fence", ["```" + "a" * 5000, "```python " + "x = 1; " * 1000], ids=["word", "words"])
+def test_long_code_fence_line_is_split(fence: str) -> None:
+    """A fence line longer than a chunk used to be reopened as a whole and the splitter never advanced."""
+    chunks = list(text_splitter(fence + "\nprint(1)\n```"))
+    assert all(len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks)
+    assert all(chunk.startswith("```") and chunk.endswith("```") for chunk in chunks)
+    assert "".join(chunks).count("a") == fence.count("a")
+
+
+def test_code_block_is_reopened_with_its_language() -> None:
+    code = "```python\n" + "print(1)\n" * 1000 + "```"
+    chunks = list(text_splitter(code))
+    assert len(chunks) > 1
+    assert all(chunk.startswith("```python\n") and chunk.endswith("\n```") for chunk in chunks)
+
+
+@pytest.mark.parametrize("language", ["python", "x" * 32])
+def test_smallest_chunks_still_advance(language: str) -> None:
+    """At MIN_CHUNK_SIZE a reopened block with the longest language still has room for text."""
+    code = f"```{language}\n" + "z" * 500 + "\n```"
+    chunks = list(text_splitter(code, max_chunk_size=MIN_CHUNK_SIZE))
+    assert all(len(chunk) <= MIN_CHUNK_SIZE for chunk in chunks)
+    assert "".join(chunks).count("z") == 500
+
+
+def test_chunk_size_below_minimum_is_rejected() -> None:
+    with pytest.raises(ValueError, match="max_chunk_size"):
+        MarkdownSplitter(MIN_CHUNK_SIZE - 1)
+
+
+def test_closing_fence_fits_into_the_last_chunk() -> None:
+    """The rest of an open code block is closed in flush without going over the limit."""
+    splitter = MarkdownSplitter(MIN_CHUNK_SIZE)
+    chunks = splitter.feed("```\n" + "x" * (MIN_CHUNK_SIZE - 4))
+    last = splitter.flush()
+    assert last is not None
+    assert all(len(chunk) <= MIN_CHUNK_SIZE for chunk in [*chunks, last])
+
+
+def test_benchmark_against_baseline_splitter() -> None:
+    """100 KB reply: splitting at once costs the same, streaming it token by token is linear."""
+    reply = _reply(100_000)
+    tokens = [reply[i : i + 4] for i in range(0, len(reply), 4)]
+
+    def stream() -> None:
+        splitter = MarkdownSplitter(MAX_CHUNK_SIZE)
+        for token in tokens:
+            splitter.feed(token)
+        splitter.flush()
+
+    def baseline_stream() -> None:
+        # without an incremental splitter the accumulated text is split again on every token;
+        # only the first fifth of the reply, the whole one takes minutes
+        for end in range(1, len(tokens) // 5):
+            list(_baseline_splitter("".join(tokens[:end])))
+
+    once = _best_of(5, lambda: list(text_splitter(reply)))
+    baseline_once = _best_of(5, lambda: list(_baseline_splitter(reply)))
+    streamed = _best_of(3, stream)
+    baseline_streamed = _best_of(1, baseline_stream)
+    print(  # noqa: T201
+        f"\nat once: {baseline_once * 1000:.1f} -> {once * 1000:.1f} ms; "
+        f"streamed: {baseline_streamed * 1000:.0f} ms for 20 KB -> {streamed * 1000:.1f} ms for 100 KB",
+    )
+    assert once < baseline_once * 3
+    assert streamed * 10 < baseline_streamed
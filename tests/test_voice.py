@@ -0,0 +1,24 @@
+from prometheus_client import REGISTRY
+
+from loadtest.fake_openai import FakeOpenAI
+from loadtest.scenarios import VOICE_DURATION, Step, SyntheticUser
+from tests.conftest import Run, Walk
+
+ALGO_TASK = (Step("command", "/start"), Step("callback", "KNOWLEDGE_GAIN"), Step("callback", "ALGO_TASK"))
+
+
+def _audio_seconds_saved() -> float:
+    return REGISTRY.get_sample_value("bot_transcription_audio_seconds_saved_total") or 0
+
+
+def test_forwarded_voice_note_is_transcribed_once(run: Run, walk: Walk, fake_openai: FakeOpenAI) -> None:
+    """A voice note forwarded to another chat has the same file_unique_id and reuses the transcript."""
+    first, second = SyntheticUser(9101), SyntheticUser(9102)
+    for user in (first, second):
+        run(walk(user, *ALGO_TASK, Step("text", "Хеш-таблицы")))
+    saved = _audio_seconds_saved()
+
+    run(walk(first, Step("voice", "voice-1")))
+    run(walk(second, Step("voice", "voice-1")))
+    assert fake_openai.requests["POST TranscriptionsHandler"] == 1
+    assert _audio_seconds_saved() - saved == VOICE_DURATION
@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import json
+import typing
+
+import httpx
+import pytest
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from config.settings import WEBHOOK_PATH
+from config.webhook import SECRET_TOKEN_HEADER, make_metrics_app, make_web_app, serve
+from exceptions.missing_setting_error import MissingSettingError
+from loadtest.__main__ import LoadTest
+from loadtest.scenarios import Step, SyntheticUser
+from tests.conftest import Run
+
+SECRET = "tests-secret"
+
+
+@contextlib.asynccontextmanager
+async def _client(bot: LoadTest, *, public: bool = True) -> typing.AsyncIterator[httpx.AsyncClient]:
+    server = HTTPServer(make_web_app(bot.application, SECRET) if public else make_metrics_app(bot.application))
+    sockets = bind_sockets(0, "127.0.0.1")
+    server.add_sockets(sockets)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{sockets[0].getsockname()[1]}") as http:
+            yield http
+    finally:
+        server.stop()
+
+
+async def _get(bot: LoadTest, path: str, *, public: bool) -> httpx.Response:
+    async with _client(bot, public=public) as http:
+        return await http.get(path)
+
+
+async def _post(bot: LoadTest, body: bytes, secret: str = SECRET) -> httpx.Response:
+    async with _client(bot) as http:
+        return await http.post(WEBHOOK_PATH, content=body, headers={SECRET_TOKEN_HEADER: secret})
+
+
+def test_recorded_update_is_handled(run: Run, bot: LoadTest, user: SyntheticUser) -> None:
+    """A recorded update POSTed to the webhook goes through the same handlers as a polled one."""
+    data: dict[str, typing.Any] = user.update(Step("command", "/start"))
+
+    async def post_and_wait() -> int:
+        handled: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        bot.recorder.pending[data["update_id"]] = handled
+        response = await _post(bot, json.dumps(data).encode())
+        await asyncio.wait_for(handled, 10)
+        return response.status_code
+
+    assert run(post_and_wait()) == 200
+    assert data["update_id"] not in bot.recorder.failed
+
+
+def test_update_with_wrong_secret_is_rejected(run: Run, bot: LoadTest, user: SyntheticUser) -> None:
+    body = json.dumps(user.update(Step("command", "/start"))).encode()
+    assert run(_post(bot, body, secret="wrong")).status_code == 403
+
+
+@pytest.mark.parametrize(
+    "body",
+    [b"{not json", b"\xff", b"[1, 2]", b'"message"', b'{"update_id": 1, "message": "text"}', b'{"message": {}}'],
+)
+def test_malformed_body_is_rejected(run: Run, bot: LoadTest, body: bytes) -> None:
+    """Bodies that are not an update get 400 instead of an error in the handler."""
+    assert run(_post(bot, body)).status_code == 400
+
+
+def test_webhook_mode_requires_secret(run: Run, bot: LoadTest) -> None:
+    with pytest.raises(MissingSettingError):
+        run(serve(bot.application, webhook=True, register=False, secret_token=""))
+
+
+@pytest.mark.parametrize("public", [True, False], ids=["webhook-port", "metrics-port"])
+def test_healthz_is_served_on_both_ports(run: Run, bot: LoadTest, public: bool) -> None:  # noqa: FBT001
+    response = run(_get(bot, "/healthz", public=public))
+    assert response.status_code == 200
+    assert response.text == "ok"
+
+
+def test_metrics_are_not_served_on_the_webhook_port(run: Run, bot: LoadTest) -> None:
+    """Only the internal port exposes /metrics, only the public one accepts updates."""
+    assert run(_get(bot, "/metrics", public=True)).status_code == 404
+    assert run(_get(bot, WEBHOOK_PATH, public=True)).status_code == 405
+    assert run(_get(bot, "/metrics", public=False)).status_code == 200
+    assert run(_get(bot, WEBHOOK_PATH, public=False)).status_code == 404
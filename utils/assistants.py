@@ -0,0 +1,89 @@
+"""OpenAI assistants registry."""
+
+import asyncio
+import typing
+
+from loguru import logger
+from openai.types.beta.assistant import Assistant
+from openai.types.beta.assistant_tool_param import AssistantToolParam
+
+from config.openai_client import assistants_client
+from utils.constants import ModelName
+from utils.prompts import EDA_ASSISTANT_INSTRUCTIONS
+
+# the lookup runs at startup: assistants of the organization older than this many are not searched
+ASSISTANT_SEARCH_LIMIT: typing.Final[int] = 500
+ASSISTANTS_PAGE_SIZE: typing.Final[int] = 100
+ASSISTANT_WARM_UP_TIMEOUT: typing.Final[float] = 30.0
+
+
+class AssistantRegistry:
+    """Looks up or creates an assistant once and keeps it for the lifetime of the process."""
+
+    def __init__(
+        self: typing.Self,
+        name: str,
+        instructions: str,
+        model: ModelName,
+        tools: list[AssistantToolParam],
+    ):
+        self.name = name
+        self.instructions = instructions
+        self.model = model
+        self.tools = tools
+        self._assistant: Assistant | None = None
+        self._lock = asyncio.Lock()
+
+    async def get(self: typing.Self) -> Assistant:
+        """Return cached assistant, creating it on first call."""
+        if self._assistant is not None:
+            return self._assistant
+        async with self._lock:
+            if self._assistant is None:
+                self._assistant = await self._find() or await self._create()
+        return self._assistant
+
+    async def warm_up(self: typing.Self) -> None:
+        """Look the assistant up in advance; if OpenAI is unavailable, the first use looks it up again."""
+        try:
+            await asyncio.wait_for(self.get(), ASSISTANT_WARM_UP_TIMEOUT)
+        except Exception as error:  # noqa: BLE001
+            logger.warning(f"Assistant {self.name} is not ready, it will be looked up on first use: {error!r}")
+
+    async def _find(self: typing.Self) -> Assistant | None:
+        searched: int = 0
+        # newest first: an assistant created by an earlier run is found on the first pages
+        async for assistant in assistants_client.beta.assistants.list(order="desc", limit=ASSISTANTS_PAGE_SIZE):
+            searched += 1
+            if searched > ASSISTANT_SEARCH_LIMIT:
+                logger.info(f"Assistant {self.name} is not among the {ASSISTANT_SEARCH_LIMIT} newest ones")
+                return None
+            if assistant.name != self.name:
+                continue
+            logger.info(f"Reuse assistant {self.name}: {assistant.id}")
+            if assistant.instructions == self.instructions and assistant.model == self.model:
+                return assistant
+            return await assistants_client.beta.assistants.update(
+                assistant_id=assistant.id,
+                instructions=self.instructions,
+                model=self.model,
+                tools=self.tools,
+            )
+        return None
+
+    async def _create(self: typing.Self) -> Assistant:
+        logger.info(f"Create assistant {self.name}")
+        return await assistants_client.beta.assistants.create(
+            name=self.name,
+            instructions=self.instructions,
+            model=self.model,
+            tools=self.tools,
+        )
+
+
+eda_assistant_registry = AssistantRegistry(
+    name="ds-newcomer-bot-eda",
+    instructions=EDA_ASSISTANT_INSTRUCTIONS,
+    model=ModelName.GPT_4O,
+    tools=[{"type": "code_interpreter"}],
+)
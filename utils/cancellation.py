@@ -0,0 +1,40 @@
+"""Cancellation of long-running per-chat operations."""
+
+import asyncio
+import contextlib
+import typing
+
+FINISH_DIALOG_COMMAND: typing.Final[str] = "/finish_dialog"
+
+
+class CancelScopes:
+    """Per-chat cancellation flags for long operations (e.g. EDA runs).
+
+    Updates of one chat are processed sequentially, so a cancel command would wait until
+    the operation it is meant to stop finishes. The update processor therefore sets the flag
+    as soon as the command arrives, before the update waits for its turn.
+    """
+
+    def __init__(self: typing.Self):
+        self._events: dict[int, asyncio.Event] = {}
+
+    @contextlib.contextmanager
+    def scope(self: typing.Self, chat_id: int) -> typing.Iterator[asyncio.Event]:
+        """Register a cancellable operation for the chat."""
+        event = asyncio.Event()
+        self._events[chat_id] = event
+        try:
+            yield event
+        finally:
+            if self._events.get(chat_id) is event:
+                del self._events[chat_id]
+
+    def cancel(self: typing.Self, chat_id: int) -> bool:
+        """Cancel operation running in the chat, return whether there was one."""
+        if (event := self._events.get(chat_id)) is None:
+            return False
+        event.set()
+        return True
+
+
+cancel_scopes = CancelScopes()
@@ -1,17 +1,23 @@
 """Constants."""
 
 import typing
-from enum import Enum
+from enum import Enum, StrEnum
 
 MAX_TOKENS: typing.Final[int] = 4_096
 MAX_TELEGRM_MESSAGE_LEN: int = 4000
 TEMPERATURE: typing.Final[float] = 0.5
+# Token budget for dialog history (system prompt excluded) sent to LLM
+DIALOG_TOKEN_BUDGET: typing.Final[int] = 3_000
+# Telegram allows roughly one edit of a message per second
+STREAM_EDIT_INTERVAL: typing.Final[float] = 1.0
+STREAM_PLACEHOLDER: typing.Final[str] = "..."
 
 
-class ModelName(str, Enum):
+class ModelName(StrEnum):
     """Model names."""
 
     GPT_4O = "gpt-4o"
+    GPT_4O_MINI = "gpt-4o-mini"
 
 
 class CodePromptMode(str, Enum):
@@ -0,0 +1,185 @@
+"""Compaction of an uploaded CSV before it is given to the code interpreter.
+
+Large files are slow to upload and to load in the interpreter. Guided by the profile of the whole file,
+the compaction drops constant and ID-like columns, samples rows with stratification by a target-like
+column when the file is large, and packs the result into a deflated ZIP with a UTF-8, comma-separated CSV
+inside. Everything that was done is described in a note for the assistant.
+"""
+
+import csv
+import io
+import random
+import re
+import typing
+import zipfile
+from dataclasses import dataclass
+
+from config.settings import DATASET_SAMPLE_ROWS, DATASET_SAMPLE_THRESHOLD_MB, DATASET_ZIP_THRESHOLD_MB
+from utils.dataset_profile import NULL_TOKENS, ColumnProfile, DatasetProfile
+
+# names of columns that identify rows rather than describe them
+ID_NAME: typing.Final[re.Pattern[str]] = re.compile(r"^(id|uuid|guid|index|unnamed: ?\d+)$|(^|[_ ])id$", re.IGNORECASE)
+# names that usually mark the target of a dataset
+TARGET_NAME: typing.Final[re.Pattern[str]] = re.compile(
+    r"target|label|class|churn|default|fraud|outcome|survived|^y$",
+    re.IGNORECASE,
+)
+MAX_STRATA: typing.Final[int] = 20
+# rare classes keep up to this many rows, so that they do not vanish from the sample
+MIN_STRATUM_ROWS: typing.Final[int] = 100
+ARCHIVE_MEMBER: typing.Final[str] = "dataset.csv"
+BYTES_IN_MB: typing.Final[int] = 1024 * 1024
+# the same file is always sampled the same way
+SAMPLE_SEED: typing.Final[int] = 42
+
+
+@dataclass
+class CompactedDataset:
+    """File to upload and what was done to it."""
+
+    name: str
+    content: bytes
+    note: str
+
+
+@dataclass
+class _Stratum:
+    """Selection sampling state of one stratum: take exactly `quota` of `size` rows."""
+
+    quota: int
+    size: int
+    seen: int = 0
+    taken: int = 0
+
+    def take(self: typing.Self, rng: random.Random) -> bool:
+        """Decide on the next row of the stratum (Knuth's algorithm S)."""
+        take: bool = rng.random() * (self.size - self.seen) < self.quota - self.taken
+        self.seen += 1
+        self.taken += take
+        return take
+
+
+def _is_constant(column: ColumnProfile) -> bool:
+    return column.kind == "empty" or (not column.overflow and len(column.values) == 1 and not column.nulls)
+
+
+def _is_id_like(column: ColumnProfile, rows: int) -> bool:
+    if column.nulls:
+        return False
+    # a row counter: consecutive integers, one per row
+    counter: bool = column.kind == "int" and column.maximum - column.minimum + 1 == rows
+    # distinct values are only counted up to MAX_TRACKED_VALUES, past that only a counter is taken as unique
+    all_distinct: bool = counter if column.overflow else len(column.values) == rows
+    if ID_NAME.search(column.name):
+        return all_distinct
+    return column.overflow and counter
+
+
+def _stratify_column(columns: list[ColumnProfile]) -> ColumnProfile | None:
+    candidates = [column for column in columns if not column.overflow and 1 < len(column.values) <= MAX_STRATA]
+    named = [column for column in candidates if TARGET_NAME.search(column.name)]
+    # targets are usually the last columns of a dataset
+    pool = named or candidates
+    return pool[-1] if pool else None
+
+
+def _stratum_key(value: str) -> str:
+    value = value.strip()
+    return "" if value.lower() in NULL_TOKENS else value
+
+
+def _strata(column: ColumnProfile | None, rows: int, sample_rows: int) -> dict[str, _Stratum]:
+    if column is None:
+        return {"": _Stratum(quota=sample_rows, size=rows)}
+    sizes: dict[str, int] = dict(column.values)
+    if column.nulls:
+        sizes[""] = sizes.get("", 0) + column.nulls
+    fraction: float = sample_rows / rows
+    return {
+        value: _Stratum(quota=max(round(size * fraction), min(size, MIN_STRATUM_ROWS)), size=size)
+        for value, size in sizes.items()
+    }
+
+
+def _rewrite(
+    stream: typing.BinaryIO,
+    profile: DatasetProfile,
+    keep: list[int],
+    stratify: int | None,
+    strata: dict[str, _Stratum] | None,
+) -> tuple[bytes, int]:
+    """Write kept rows and columns as a zipped UTF-8 CSV, return it with the number of rows."""
+    rng = random.Random(SAMPLE_SEED)  # noqa: S311 - the sample does not need to be unpredictable
+    written: int = 0
+    archive = io.BytesIO()
+    source = io.TextIOWrapper(stream, encoding=profile.encoding, newline="")
+    try:
+        with (
+            zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as package,
+            package.open(ARCHIVE_MEMBER, "w") as member,
+            io.TextIOWrapper(member, encoding="utf-8", newline="") as target,
+        ):
+            reader = csv.reader(source, delimiter=profile.delimiter)
+            writer = csv.writer(target)
+            header: list[str] = next(reader)
+            writer.writerow([profile.columns[index].name for index in keep])
+            for row in reader:
+                # malformed rows were skipped by the profile too
+                if len(row) != len(header):
+                    continue
+                if strata is not None:
+                    stratum = strata.get(_stratum_key(row[stratify]) if stratify is not None else "")
+                    if stratum is None or not stratum.take(rng):
+                        continue
+                writer.writerow([row[index] for index in keep])
+                written += 1
+    finally:
+        source.detach()
+    return archive.getvalue(), written
+
+
+def compact_dataset(stream: typing.BinaryIO, profile: DatasetProfile, name: str) -> CompactedDataset:
+    """Prepare the dataset for upload; small files without useless columns are uploaded as they are.
+
+    Blocking, run it in a worker thread. The stream is left open.
+    """
+    size: int = stream.seek(0, io.SEEK_END)
+    stream.seek(0)
+    dropped: list[tuple[str, str]] = []
+    keep: list[int] = []
+    for index, column in enumerate(profile.columns):
+        if _is_constant(column):
+            dropped.append((column.name, "constant"))
+        elif _is_id_like(column, profile.rows):
+            dropped.append((column.name, "row identifier"))
+        else:
+            keep.append(index)
+    if not keep:
+        keep, dropped = list(range(len(profile.columns))), []
+
+    sample: bool = size > DATASET_SAMPLE_THRESHOLD_MB * BYTES_IN_MB and profile.rows > DATASET_SAMPLE_ROWS
+    if not dropped and not sample and size <= DATASET_ZIP_THRESHOLD_MB * BYTES_IN_MB:
+        return CompactedDataset(name=name, content=stream.read(), note=f"The attached file is {name} as uploaded.")
+
+    stratify_column: ColumnProfile | None = _stratify_column(profile.columns) if sample else None
+    strata = _strata(stratify_column, profile.rows, DATASET_SAMPLE_ROWS) if sample else None
+    stratify: int | None = profile.columns.index(stratify_column) if stratify_column is not None else None
+    content, rows = _rewrite(stream, profile, keep, stratify, strata)
+
+    notes: list[str] = [
+        f"The attached file is a ZIP archive with {ARCHIVE_MEMBER} inside (UTF-8, comma-separated), "
+        f"prepared from {name}: read it with pandas.read_csv(path, compression='zip').",
+    ]
+    if dropped:
+        notes.append("Dropped columns: " + ", ".join(f"{column} ({reason})" for column, reason in dropped) + ".")
+    if sample:
+        notes.append(
+            f"It is a sample of {rows} of {profile.rows} rows: the original file is {size / BYTES_IN_MB:.0f} MB. "
+            "Statistics in the dataset profile are computed on all rows.",
+        )
+        if stratify_column is not None:
+            notes.append(
+                f"The sample is stratified by {stratify_column.name!r}; every class keeps at least {MIN_STRATUM_ROWS} "
+                "rows (or all of them), so rare classes are over-represented compared to the full data.",
+            )
+    return CompactedDataset(name=f"{name.rsplit('.', 1)[0]}.zip", content=content, note=" ".join(notes))
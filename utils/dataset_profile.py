@@ -0,0 +1,237 @@
+"""Local profile of an uploaded CSV dataset: schema, types, missing values, cardinality and numeric summaries.
+
+The file is read as a stream in chunks of rows, every column of a chunk is processed with NumPy, so memory
+does not depend on the file size. The profile goes to the EDA assistant as text: the overview of the
+dataset is written from it without running code.
+"""
+
+import codecs
+import csv
+import io
+import typing
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from exceptions.bad_dataset_error import BadDatasetError
+
+CHUNK_ROWS: typing.Final[int] = 10_000
+# enough for the header and a few dozen rows
+SAMPLE_BYTES: typing.Final[int] = 64 * 1024
+DELIMITERS: typing.Final[str] = ",;\t|"
+# utf-8-sig reads plain UTF-8 too; Excel in Russian locale saves CSV in cp1251
+ENCODINGS: typing.Final[tuple[str, ...]] = ("utf-8-sig", "cp1251")
+NULL_TOKENS: typing.Final[tuple[str, ...]] = ("", "na", "n/a", "nan", "null", "none")
+# rows with a wrong number of fields beyond this share make the file malformed
+MAX_BAD_ROWS_SHARE: typing.Final[float] = 0.01
+MIN_BAD_ROWS: typing.Final[int] = 10
+MAX_COLUMNS: typing.Final[int] = 1_000
+# distinct values are counted exactly up to this number
+MAX_TRACKED_VALUES: typing.Final[int] = 1_000
+# text columns with at most this many distinct values are categorical
+MAX_CATEGORIES: typing.Final[int] = 50
+TOP_VALUES: typing.Final[int] = 3
+MAX_VALUE_LEN: typing.Final[int] = 30
+# columns described in the prompt, the rest are only counted
+MAX_PROMPT_COLUMNS: typing.Final[int] = 100
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Return the first encoding that decodes the sample."""
+    if b"\x00" in sample:
+        msg: str = "файл бинарный, а не текстовый"
+        raise BadDatasetError(msg)
+    for encoding in ENCODINGS:
+        try:
+            # the sample may end in the middle of a character
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    msg = "неизвестная кодировка"
+    raise BadDatasetError(msg)
+
+
+def detect_delimiter(sample: str) -> str:
+    """Guess the delimiter from the first lines, a single-column file gets a comma."""
+    lines: list[str] = sample.splitlines()
+    # the last line of the sample is usually cut
+    text: str = "\n".join(lines[:-1] if len(lines) > 1 else lines)
+    try:
+        return csv.Sniffer().sniff(text, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        return ","
+
+
+@dataclass
+class ColumnProfile:
+    """Statistics of one column, updated chunk by chunk."""
+
+    name: str
+    count: int = 0
+    nulls: int = 0
+    numeric: bool = True
+    integer: bool = True
+    # running mean and sum of squared deviations, merged per chunk
+    mean: float = 0.0
+    m2: float = 0.0
+    minimum: float = float("inf")
+    maximum: float = float("-inf")
+    values: Counter[str] = field(default_factory=Counter)
+    # more than MAX_TRACKED_VALUES distinct values
+    overflow: bool = False
+
+    def update(self: typing.Self, cells: typing.Sequence[str], decimal_comma: bool) -> None:  # noqa: FBT001
+        """Add a chunk of raw cells."""
+        stripped = np.char.strip(np.asarray(cells, dtype=str))
+        null = np.isin(np.char.lower(stripped), NULL_TOKENS)
+        present = stripped[~null]
+        self.nulls += int(null.sum())
+        if not present.size:
+            return
+
+        if self.numeric:
+            try:
+                numbers = (np.char.replace(present, ",", ".") if decimal_comma else present).astype(np.float64)
+            except ValueError:
+                self.numeric = False
+            else:
+                self._merge_numbers(numbers)
+
+        if not self.overflow:
+            distinct, counts = np.unique(present, return_counts=True)
+            self.values.update(dict(zip(distinct.tolist(), counts.tolist(), strict=True)))
+            if len(self.values) > MAX_TRACKED_VALUES:
+                self.overflow = True
+                self.values.clear()
+        self.count += int(present.size)
+
+    def _merge_numbers(self: typing.Self, numbers: np.ndarray) -> None:
+        # Chan et al. parallel variance: merge chunk statistics into the running ones
+        size: int = numbers.size
+        chunk_mean = float(numbers.mean())
+        chunk_m2 = float(((numbers - chunk_mean) ** 2).sum())
+        total: int = self.count + size
+        delta: float = chunk_mean - self.mean
+        self.mean += delta * size / total
+        self.m2 += chunk_m2 + delta * delta * self.count * size / total
+        self.minimum = min(self.minimum, float(numbers.min()))
+        self.maximum = max(self.maximum, float(numbers.max()))
+        self.integer = self.integer and bool(np.all(np.mod(numbers, 1) == 0))
+
+    @property
+    def cardinality(self: typing.Self) -> str:
+        """Number of distinct values."""
+        return f">{MAX_TRACKED_VALUES}" if self.overflow else str(len(self.values))
+
+    @property
+    def kind(self: typing.Self) -> str:
+        """Inferred type of the column."""
+        if not self.count:
+            return "empty"
+        if self.numeric:
+            return "int" if self.integer else "float"
+        if not self.overflow and len(self.values) <= MAX_CATEGORIES:
+            return "category"
+        return "text"
+
+    def describe(self: typing.Self, rows: int) -> str:
+        """One line of the profile."""
+        parts: list[str] = [f"{self.kind}", f"nulls {self.nulls / max(rows, 1):.1%}", f"unique {self.cardinality}"]
+        if self.count and self.numeric:
+            std: float = (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+            parts.append(f"min {self.minimum:g}, max {self.maximum:g}, mean {self.mean:.4g}, std {std:.4g}")
+        elif self.values:
+            top = self.values.most_common(TOP_VALUES)
+            shares = (f"{value[:MAX_VALUE_LEN]!r} {count / self.count:.0%}" for value, count in top)
+            parts.append("top: " + ", ".join(shares))
+        return f"- {self.name}: " + ", ".join(parts)
+
+
+@dataclass
+class DatasetProfile:
+    """Profile of a whole dataset."""
+
+    encoding: str
+    delimiter: str
+    columns: list[ColumnProfile]
+    rows: int = 0
+    bad_rows: int = 0
+
+    def to_prompt(self: typing.Self) -> str:
+        """Compact text for the assistant."""
+        lines: list[str] = [
+            f"Dataset profile: {self.rows} rows, {len(self.columns)} columns, "
+            f"delimiter {self.delimiter!r}, encoding {self.encoding}, skipped malformed rows: {self.bad_rows}",
+        ]
+        lines.extend(column.describe(self.rows) for column in self.columns[:MAX_PROMPT_COLUMNS])
+        if len(self.columns) > MAX_PROMPT_COLUMNS:
+            lines.append(f"... and {len(self.columns) - MAX_PROMPT_COLUMNS} more columns")
+        return "\n".join(lines)
+
+
+def _header(reader: typing.Iterator[list[str]]) -> list[str]:
+    header: list[str] | None = next(reader, None)
+    if not header or not any(name.strip() for name in header):
+        msg: str = "файл пустой или без заголовка"
+        raise BadDatasetError(msg)
+    if len(header) > MAX_COLUMNS:
+        msg = f"больше {MAX_COLUMNS} столбцов"
+        raise BadDatasetError(msg)
+    return [name.strip() or f"column_{index}" for index, name in enumerate(header)]
+
+
+def _check_rows(profile: DatasetProfile, pending: int = 0) -> None:
+    if profile.bad_rows > max(MIN_BAD_ROWS, MAX_BAD_ROWS_SHARE * (profile.rows + pending + profile.bad_rows)):
+        msg: str = f"в {profile.bad_rows} строках число полей не совпадает с заголовком"
+        raise BadDatasetError(msg)
+
+
+def profile_dataset(stream: typing.BinaryIO) -> DatasetProfile:
+    """Profile a CSV stream; malformed files are rejected as early as possible.
+
+    Blocking, run it in a worker thread. The stream is left open.
+    """
+    sample: bytes = stream.read(SAMPLE_BYTES)
+    stream.seek(0)
+    encoding: str = detect_encoding(sample)
+    delimiter: str = detect_delimiter(sample.decode(encoding, errors="ignore"))
+
+    text = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    try:
+        reader = csv.reader(text, delimiter=delimiter)
+        header: list[str] = _header(reader)
+        columns: list[ColumnProfile] = [ColumnProfile(name) for name in header]
+        profile = DatasetProfile(encoding=encoding, delimiter=delimiter, columns=columns)
+        # "1,5" is a number when commas do not separate fields
+        decimal_comma: bool = delimiter != ","
+        chunk: list[list[str]] = []
+        for row in reader:
+            if len(row) != len(header):
+                # blank lines are not rows
+                profile.bad_rows += any(cell.strip() for cell in row)
+                _check_rows(profile, len(chunk))
+                continue
+            chunk.append(row)
+            if len(chunk) == CHUNK_ROWS:
+                _add_chunk(profile, chunk, decimal_comma)
+                chunk = []
+        _add_chunk(profile, chunk, decimal_comma)
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise BadDatasetError(str(error)) from error
+    finally:
+        text.detach()
+
+    if not profile.rows:
+        msg: str = "в файле нет строк с данными"
+        raise BadDatasetError(msg)
+    return profile
+
+
+def _add_chunk(profile: DatasetProfile, chunk: list[list[str]], decimal_comma: bool) -> None:  # noqa: FBT001
+    if chunk:
+        for column, cells in zip(profile.columns, zip(*chunk, strict=True), strict=True):
+            column.update(cells, decimal_comma)
+        profile.rows += len(chunk)
+    _check_rows(profile)
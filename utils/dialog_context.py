@@ -1,11 +1,129 @@
-from typing import Any
+import functools
+import typing
+
+import tiktoken
+from loguru import logger
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from utils.constants import DIALOG_TOKEN_BUDGET, ModelName
+
+# служебные токены, которые OpenAI добавляет к каждому сообщению
+MESSAGE_OVERHEAD_TOKENS: typing.Final[int] = 4
+# оценка стоимости одной картинки в режиме detail=high
+IMAGE_TOKENS: typing.Final[int] = 765
+# грубая оценка, если словарь tiktoken не скачать (например, бот запущен без доступа в интернет)
+CHARS_PER_TOKEN: typing.Final[int] = 4
+
+Summarizer = typing.Callable[[str, list[ChatCompletionMessageParam]], typing.Awaitable[str]]
+
+
+@functools.lru_cache
+def _encoding(model: str) -> tiktoken.Encoding | None:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:  # noqa: BLE001
+        logger.warning("Словарь tiktoken недоступен, токены считаются приблизительно")
+        return None
+
+
+def _text_tokens(encoding: tiktoken.Encoding | None, text: str) -> int:
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+
+def count_tokens(messages: typing.Iterable[ChatCompletionMessageParam], model: str = ModelName.GPT_4O) -> int:
+    """Локально считает, сколько токенов займут сообщения в запросе."""
+    encoding = _encoding(model)
+    total: int = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            total += _text_tokens(encoding, content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                total += _text_tokens(encoding, part["text"])  # type: ignore[typeddict-item]
+            else:
+                total += IMAGE_TOKENS
+    return total
+
+
+class ConversationMemory:
+    """Память диалога с бюджетом по токенам.
+
+    Закреплённые сообщения (например, картинка мема) отправляются всегда. За ними идёт сводка
+    старых реплик и скользящее окно последних реплик, которые вместе укладываются в token_budget.
+    """
+
+    def __init__(self, token_budget: int = DIALOG_TOKEN_BUDGET, model: str = ModelName.GPT_4O):
+        self.token_budget = token_budget
+        self.model = model
+        self.pinned: list[ChatCompletionMessageParam] = []
+        self.turns: list[ChatCompletionMessageParam] = []
+        self.summary: str = ""
+
+    def __len__(self) -> int:
+        """Число реплик, которые ещё не свёрнуты в сводку."""
+        return len(self.turns)
+
+    def __iter__(self) -> typing.Iterator[ChatCompletionMessageParam]:
+        """Перебирает сообщения окна, которые уходят в модель."""
+        return iter(self.window())
+
+    def pin(self, *messages: ChatCompletionMessageParam) -> None:
+        """Закрепляет сообщения, которые не вытесняются из памяти."""
+        self.pinned.extend(messages)
+
+    def append(self, *messages: ChatCompletionMessageParam) -> None:
+        """Добавляет реплики в конец диалога."""
+        self.turns.extend(messages)
+
+    @property
+    def _summary_messages(self) -> list[ChatCompletionMessageParam]:
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": f"Краткое содержание предыдущей части диалога:\n{self.summary}"}]
+
+    def _window_start(self) -> int:
+        """Индекс первой реплики окна: последние реплики, которые вместе с текущей сводкой укладываются в бюджет.
+
+        Закреплённые сообщения в бюджет не входят. Сводка берётся такой, какая она сейчас: после compact
+        она станет длиннее, и окно при следующем вызове может сдвинуться.
+        """
+        used: int = count_tokens(self._summary_messages, self.model)
+        start: int = len(self.turns)
+        while start > 0:
+            used += count_tokens(self.turns[start - 1 : start], self.model)
+            if used > self.token_budget:
+                break
+            start -= 1
+        # последняя реплика остаётся в окне, даже если одна не влезает в бюджет: перед запросом это вопрос
+        # пользователя, после ответа (в compact) — ответ ассистента
+        return min(start, len(self.turns) - 1) if self.turns else 0
+
+    def window(self) -> list[ChatCompletionMessageParam]:
+        """Сообщения, которые нужно отправить в модель."""
+        return [*self.pinned, *self._summary_messages, *self.turns[self._window_start() :]]
+
+    async def compact(self, summarize: Summarizer) -> None:
+        """Сворачивает вытесненные из окна реплики в сводку."""
+        start: int = self._window_start()
+        if start == 0:
+            return
+        self.summary = await summarize(self.summary, self.turns[:start])
+        del self.turns[:start]
 
 
 class DialogContext:
     """Модель диалога с ChatGPT."""
 
-    def __init__(self, model: str, max_tokens: int, temperature: float):
+    def __init__(self, model: str, max_tokens: int, temperature: float, token_budget: int = DIALOG_TOKEN_BUDGET):
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
-        self.messages: Any = []
+        self.messages: ConversationMemory = ConversationMemory(token_budget=token_budget, model=model)
@@ -1,33 +1,75 @@
 """Helper functions."""
 
+import asyncio
+import dataclasses
+import time
 import typing
 
 from loguru import logger
 from openai.types.beta.assistant import Assistant
-from openai.types.beta.thread import Thread
-from openai.types.beta.threads import TextContentBlock
-from telegram.error import NetworkError
+from openai.types.beta.threads import TextDeltaBlock
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from telegram.ext import CallbackContext
 
-from config.openai_client import client
-from utils.constants import ModelName
-from utils.prompts import Prompt
-from utils.utils import text_splitter
+from config.openai_client import assistants_client, client
+from utils.constants import DIALOG_TOKEN_BUDGET, TEMPERATURE, ModelName
+from utils.metrics import LLM_LATENCY, LLM_TIME_TO_FIRST_TOKEN, observe_llm_usage
+from utils.model_router import model_router
+from utils.prompts import DialogSummaryPrompt, Prompt
+from utils.resilience import CHAT_POLICY, SUMMARY_POLICY, CallPolicy, next_chunk, resilient_call
+from utils.response_cache import make_cache_key, response_cache
 
 if typing.TYPE_CHECKING:
     from openai.types.chat.chat_completion import ChatCompletion
 
+T = typing.TypeVar("T")
 
-def single_text2text_query(model: ModelName, prompt: Prompt, max_tokens: int, temperature: float) -> str:
-    """Make a query to an LLM model and return its reply."""
-    response: ChatCompletion = client.chat.completions.create(
-        model=model,
-        messages=prompt.messages,
-        max_tokens=max_tokens,
-        temperature=temperature,
+FINAL_RUN_STATUSES: typing.Final[frozenset[str]] = frozenset(
+    {"completed", "failed", "cancelled", "expired", "incomplete"},
+)
+# a cancelled run stays in the cancelling status for a few seconds and blocks the thread meanwhile
+RUN_POLL_INTERVAL: typing.Final[float] = 0.5
+RUN_STOP_TIMEOUT: typing.Final[float] = 30.0
+
+
+async def single_text2text_query(  # noqa: PLR0913
+    prompt: Prompt,
+    max_tokens: int,
+    temperature: float,
+    use_cache: bool = True,  # noqa: FBT001, FBT002
+    policy: CallPolicy = CHAT_POLICY,
+    model: ModelName | None = None,
+) -> str:
+    """Make a query to an LLM model and return its reply.
+
+    The model is picked by model_router unless given. Set use_cache=False for scenarios where the same
+    prompt should produce a fresh answer.
+    """
+    messages = list(prompt.messages)
+    prompt_class: str = type(prompt).__name__
+    model = model or model_router.pick(prompt_class, messages)
+    cache_key: str = make_cache_key(model, messages, max_tokens, temperature)
+    if use_cache and (cached := await response_cache.get(cache_key)) is not None:
+        return cached
+
+    started_at: float = time.perf_counter()
+    response: ChatCompletion = await resilient_call(
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ),
+        policy,
     )
+    latency: float = time.perf_counter() - started_at
+    LLM_LATENCY.labels(model, prompt_class).observe(latency)
+    model_router.record(model, prompt_class, latency, streamed=False)
+    observe_llm_usage(model, prompt_class, response.usage)
 
     if reply := response.choices[0].message.content:
+        if use_cache:
+            await response_cache.set(cache_key, reply.strip())
         return reply.strip()
 
     msg: str = "Empty OpenAI response context"
@@ -35,26 +77,147 @@ def single_text2text_query(model: ModelName, prompt: Prompt, max_tokens: int, te
     raise ValueError(msg)
 
 
+async def stream_text2text_query(  # noqa: PLR0913
+    prompt: Prompt,
+    max_tokens: int,
+    temperature: float,
+    use_cache: bool = True,  # noqa: FBT001, FBT002
+    policy: CallPolicy = CHAT_POLICY,
+    model: ModelName | None = None,
+) -> typing.AsyncGenerator[str, None]:
+    """Make a streaming query to an LLM model and yield its reply piece by piece.
+
+    The model is picked by model_router unless given. A cached reply is yielded at once, a fresh one
+    is cached after the stream is over.
+    """
+    messages = list(prompt.messages)
+    prompt_class: str = type(prompt).__name__
+    model = model or model_router.pick(prompt_class, messages, streamed=True)
+    cache_key: str = make_cache_key(model, messages, max_tokens, temperature)
+    if use_cache and (cached := await response_cache.get(cache_key)) is not None:
+        yield cached
+        return
+
+    started_at: float = time.perf_counter()
+    # only opening the stream is retried: a reply broken midway is already partly shown to the user
+    stream = await resilient_call(
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        ),
+        dataclasses.replace(policy, hedge=False),
+    )
+    pieces: list[str] = []
+    chunks = aiter(stream)
+    try:
+        # the deadline covers opening the stream only, a reply that stops midway is cut by the idle timeout
+        while (chunk := await next_chunk(chunks, policy)) is not None:
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                if not pieces:
+                    time_to_first_token: float = time.perf_counter() - started_at
+                    LLM_TIME_TO_FIRST_TOKEN.labels(model, prompt_class).observe(time_to_first_token)
+                    model_router.record(model, prompt_class, time_to_first_token, streamed=True)
+                pieces.append(delta)
+                yield delta
+            # with include_usage the last chunk carries token counts and no choices
+            observe_llm_usage(model, prompt_class, chunk.usage)
+    finally:
+        await stream.close()
+    LLM_LATENCY.labels(model, prompt_class).observe(time.perf_counter() - started_at)
+
+    if use_cache and (reply := "".join(pieces).strip()):
+        await response_cache.set(cache_key, reply)
+
+
+async def summarize_dialog(summary: str, turns: list[ChatCompletionMessageParam]) -> str:
+    """Fold old dialog turns into the rolling summary."""
+    return await single_text2text_query(
+        prompt=DialogSummaryPrompt(summary=summary, turns=turns),
+        # keep the summary short enough to leave room for recent turns
+        max_tokens=DIALOG_TOKEN_BUDGET // 3,
+        temperature=TEMPERATURE,
+        policy=SUMMARY_POLICY,
+    )
+
+
 def check_user_settings(context: CallbackContext) -> bool:
     """проверка если настройки пользвателя заданы."""
     return context.user_data["interview_hard"] and context.user_data["questions_hard"]  # type: ignore  # noqa: PGH003
 
 
-def gen_messages_from_eda_stream(thread: Thread, eda_assistant: Assistant) -> typing.Generator[str, None, None]:
-    """Get messages from stream for dataset processing."""
-    with client.beta.threads.runs.stream(
-        thread_id=thread.id,
+async def gen_eda_text_deltas(
+    thread_id: str,
+    eda_assistant: Assistant,
+    on_progress: typing.Callable[[str], typing.Awaitable[None]] | None = None,
+    cancelled: asyncio.Event | None = None,
+    allow_code: bool = True,  # noqa: FBT001, FBT002
+) -> typing.AsyncGenerator[str, None]:
+    """Run the EDA assistant on the thread and yield its text as it is generated.
+
+    Code interpreter steps are reported through on_progress. When cancelled is set, the run is
+    cancelled on the OpenAI side at once, without waiting for the next event, and the generator ends
+    once the run has stopped, so the thread takes new messages. With allow_code=False the assistant
+    answers from the thread messages only.
+    """
+    async with assistants_client.beta.threads.runs.stream(
+        thread_id=thread_id,
         assistant_id=eda_assistant.id,
+        tool_choice="auto" if allow_code else "none",
     ) as stream:
-        for event in stream:
-            if event.event == "thread.message.completed":
-                for content in event.data.content:
-                    if isinstance(content, TextContentBlock):
-                        text: str = content.text.value
-                        logger.debug(f"{text=}")
-                        for chunk in text_splitter(text=text):
-                            try:
-                                logger.debug(f"{chunk=}")
-                                yield chunk
-                            except NetworkError:
-                                yield "Извините, ответ не может быть выведен в сообщении в Телеграм."
+        events = aiter(stream)
+        # a code interpreter step may send no events for minutes, so cancellation does not wait for the next one
+        while (event := await _next_unless_cancelled(events, cancelled)) is not None:
+            if event.event == "thread.message.delta":
+                for delta in event.data.delta.content or []:
+                    if isinstance(delta, TextDeltaBlock) and delta.text and delta.text.value:
+                        yield delta.text.value
+            elif event.event == "thread.message.completed":
+                yield "\n\n"
+            elif event.event == "thread.run.step.created" and on_progress is not None:
+                if event.data.step_details.type == "tool_calls":
+                    await on_progress("Запускаю код для анализа датасета...")
+                else:
+                    await on_progress("Формулирую ответ...")
+        run = stream.current_run
+        if cancelled is not None and cancelled.is_set() and run is not None and run.status not in FINAL_RUN_STATUSES:
+            logger.info(f"Cancel EDA run {run.id}")
+            await assistants_client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+            await _wait_until_stopped(thread_id, run.id)
+
+
+async def _wait_until_stopped(thread_id: str, run_id: str) -> None:
+    """Poll the run until it reaches a final status."""
+    try:
+        async with asyncio.timeout(RUN_STOP_TIMEOUT):
+            while True:
+                run = await assistants_client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+                if run.status in FINAL_RUN_STATUSES:
+                    return
+                await asyncio.sleep(RUN_POLL_INTERVAL)
+    except TimeoutError:
+        logger.warning(f"EDA run {run_id} has not stopped in {RUN_STOP_TIMEOUT}s")
+
+
+async def _next_unless_cancelled(
+    events: typing.AsyncIterator[T],
+    cancelled: asyncio.Event | None,
+) -> T | None:
+    """Next item of an async iterator, None when it is exhausted or cancelled is set first."""
+    if cancelled is None:
+        return await anext(events, None)
+    if cancelled.is_set():
+        return None
+    next_event: asyncio.Future[T | None] = asyncio.ensure_future(anext(events, None))
+    cancel_wait: asyncio.Future[typing.Literal[True]] = asyncio.ensure_future(cancelled.wait())
+    try:
+        await asyncio.wait((next_event, cancel_wait), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        cancel_wait.cancel()
+    if cancelled.is_set():
+        next_event.cancel()
+        return None
+    return next_event.result()
@@ -0,0 +1,54 @@
+"""Image preparation for vision requests."""
+
+import base64
+import io
+import typing
+from dataclasses import dataclass
+
+from PIL import Image
+from telegram import PhotoSize
+
+from config.settings import IMAGE_JPEG_QUALITY, IMAGE_MAX_SIDE
+
+# OpenAI processes images up to 512x512 in a single low-detail tile
+LOW_DETAIL_MAX_SIDE: typing.Final[int] = 512
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """Image re-encoded for a vision request."""
+
+    data_url: str
+    detail: typing.Literal["low", "high"]
+    size: tuple[int, int]
+
+
+def pick_photo_size(photo: typing.Sequence[PhotoSize], max_side: int = IMAGE_MAX_SIDE) -> PhotoSize:
+    """Pick the smallest Telegram photo size that is still not smaller than max_side."""
+    for size in sorted(photo, key=lambda size: size.width * size.height):
+        if max(size.width, size.height) >= max_side:
+            return size
+    return photo[-1]
+
+
+def prepare_image(
+    image: bytes,
+    max_side: int = IMAGE_MAX_SIDE,
+    quality: int = IMAGE_JPEG_QUALITY,
+) -> PreparedImage:
+    """Downscale image, re-encode it to JPEG and build its data URL.
+
+    CPU-bound, so call it in a worker thread.
+    """
+    with Image.open(io.BytesIO(image)) as source:
+        converted = source.convert("RGB")
+    converted.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    converted.save(buffer, format="JPEG", quality=quality, optimize=True)
+    encoded: str = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return PreparedImage(
+        data_url=f"data:image/jpeg;base64,{encoded}",
+        detail="low" if max(converted.size) <= LOW_DETAIL_MAX_SIDE else "high",
+        size=converted.size,
+    )
@@ -0,0 +1,154 @@
+"""Cache of meme explanations keyed by perceptual image hash."""
+
+import asyncio
+import io
+import sqlite3
+import typing
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from loguru import logger
+from PIL import Image
+
+from config.settings import (
+    MEME_CACHE_PATH,
+    MEME_CACHE_SIZE,
+    MEME_DETAIL_HASH_MAX_DISTANCE,
+    MEME_HASH_MAX_DISTANCE,
+)
+from utils.metrics import MEME_CACHE_LOOKUPS
+
+HASH_SIZE: typing.Final[int] = 8
+# memes made from one template differ only in the caption, which the coarse hash barely sees
+DETAIL_HASH_SIZE: typing.Final[int] = 16
+
+
+def _dhash(image: Image.Image, size: int) -> int:
+    """Difference hash of size * size bits that survives resizing and recompression."""
+    pixels = list(image.resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    result: int = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            result = (result << 1) | (left > right)
+    return result
+
+
+@dataclass(frozen=True)
+class MemeHash:
+    """Perceptual hashes of a meme: the coarse one finds candidates, the detail one confirms them."""
+
+    coarse: int
+    detail: int
+
+    def to_hex(self: typing.Self) -> str:
+        """Text form for the SQLite key."""
+        return f"{self.coarse:016x}:{self.detail:064x}"
+
+    @classmethod
+    def from_hex(cls: type[typing.Self], text: str) -> typing.Self:
+        """Parse the text form."""
+        coarse, detail = text.split(":")
+        return cls(int(coarse, 16), int(detail, 16))
+
+
+def image_hash(image: bytes) -> MemeHash:
+    """64-bit and 256-bit difference hashes (dHash) of an image."""
+    with Image.open(io.BytesIO(image)) as source:
+        gray = source.convert("L")
+    return MemeHash(coarse=_dhash(gray, HASH_SIZE), detail=_dhash(gray, DETAIL_HASH_SIZE))
+
+
+@dataclass
+class MemeCacheEntry:
+    """Stored answers for one meme."""
+
+    explanation: str
+    reaction: str | None = None
+
+
+class MemeCache:
+    """Bounded LRU of meme answers with nearest-hash lookup and optional SQLite persistence."""
+
+    def __init__(self: typing.Self, max_size: int, max_distance: int, max_detail_distance: int, path: str = ""):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.max_detail_distance = max_detail_distance
+        self._entries: OrderedDict[MemeHash, MemeCacheEntry] = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+        if path:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS memes (hash TEXT PRIMARY KEY, explanation TEXT NOT NULL, reaction TEXT)",
+            )
+            # rows are replaced on every save, so the newest rowids are the most recently saved memes;
+            # evicted rows are deleted on save, older ones are left only if max_size was lowered
+            self._connection.execute(
+                "DELETE FROM memes WHERE rowid NOT IN (SELECT rowid FROM memes ORDER BY rowid DESC LIMIT ?)",
+                (max_size,),
+            )
+            self._connection.commit()
+            for hash_hex, explanation, reaction in self._connection.execute(
+                "SELECT hash, explanation, reaction FROM memes ORDER BY rowid",
+            ):
+                self._remember(MemeHash.from_hex(hash_hex), MemeCacheEntry(explanation=explanation, reaction=reaction))
+
+    def _remember(self: typing.Self, key: MemeHash, entry: MemeCacheEntry) -> list[MemeHash]:
+        """Store the entry in memory and return the hashes evicted to make room for it."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        evicted: list[MemeHash] = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False)[0])
+        return evicted
+
+    def _closest(self: typing.Self, key: MemeHash, candidates: list[MemeHash]) -> tuple[MemeHash, int] | None:
+        best: MemeHash | None = None
+        best_distance: int = self.max_distance + 1
+        for stored_key in candidates:
+            distance: int = (stored_key.coarse ^ key.coarse).bit_count()
+            if distance < best_distance and (stored_key.detail ^ key.detail).bit_count() <= self.max_detail_distance:
+                best, best_distance = stored_key, distance
+        return None if best is None else (best, best_distance)
+
+    async def find(self: typing.Self, key: MemeHash) -> tuple[MemeHash, MemeCacheEntry] | None:
+        """Return the closest stored meme within max_distance, confirmed by the detail hash, and its hash."""
+        # the scan runs in a worker thread over a snapshot, the entries are changed on the event loop only
+        found = await asyncio.to_thread(self._closest, key, list(self._entries))
+        if found is None or (entry := self._entries.get(found[0])) is None:
+            MEME_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        stored_key, distance = found
+        self._entries.move_to_end(stored_key)
+        MEME_CACHE_LOOKUPS.labels("hit").inc()
+        logger.info(f"Meme cache hit (distance={distance})")
+        return stored_key, entry
+
+    def get(self: typing.Self, key: MemeHash) -> MemeCacheEntry | None:
+        """Return entry stored exactly under the hash."""
+        return self._entries.get(key)
+
+    async def save(self: typing.Self, key: MemeHash, entry: MemeCacheEntry) -> None:
+        """Store answers for the meme, deleting the rows of memes evicted from the cache."""
+        evicted: list[MemeHash] = self._remember(key, entry)
+        if self._connection is not None:
+            await asyncio.to_thread(self._persist, key, entry, evicted)
+
+    def _persist(self: typing.Self, key: MemeHash, entry: MemeCacheEntry, evicted: list[MemeHash]) -> None:
+        if self._connection is None:
+            return
+        self._connection.execute(
+            "INSERT OR REPLACE INTO memes (hash, explanation, reaction) VALUES (?, ?, ?)",
+            (key.to_hex(), entry.explanation, entry.reaction),
+        )
+        self._connection.executemany("DELETE FROM memes WHERE hash = ?", [(stored.to_hex(),) for stored in evicted])
+        self._connection.commit()
+
+
+meme_cache = MemeCache(
+    max_size=MEME_CACHE_SIZE,
+    max_distance=MEME_HASH_MAX_DISTANCE,
+    max_detail_distance=MEME_DETAIL_HASH_MAX_DISTANCE,
+    path=MEME_CACHE_PATH,
+)
@@ -0,0 +1,186 @@
+"""Prometheus metrics of handlers, conversation states, OpenAI and Telegram calls."""
+
+import functools
+import time
+import typing
+from collections import Counter as CounterDict
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from telegram import Update
+from telegram.ext import BaseHandler, CallbackContext, ConversationHandler
+
+if typing.TYPE_CHECKING:
+    from openai.types.completion_usage import CompletionUsage
+
+T = typing.TypeVar("T")
+
+# handlers wait for LLM replies, so buckets go up to a couple of minutes
+SLOW_BUCKETS: typing.Final[tuple[float, ...]] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+FAST_BUCKETS: typing.Final[tuple[float, ...]] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_latency_seconds",
+    "Time spent in a conversation handler.",
+    ["handler", "state"],
+    buckets=SLOW_BUCKETS,
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Exceptions raised by conversation handlers.",
+    ["handler", "state", "error"],
+)
+LLM_LATENCY = Histogram(
+    "bot_llm_request_latency_seconds",
+    "Time until an OpenAI reply is complete.",
+    ["model", "prompt"],
+    buckets=SLOW_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "bot_llm_time_to_first_token_seconds",
+    "Time until the first token of a streamed OpenAI reply.",
+    ["model", "prompt"],
+    buckets=SLOW_BUCKETS,
+)
+TIME_TO_FIRST_VISIBLE_TOKEN = Histogram(
+    "bot_time_to_first_visible_token_seconds",
+    "Time until the first edit of a streamed reply shows the user some text.",
+    buckets=SLOW_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "bot_llm_tokens_total",
+    "Tokens billed by OpenAI.",
+    ["model", "prompt", "kind"],
+)
+LLM_FALLBACKS = Counter(
+    "bot_llm_fallbacks_total",
+    "Requests routed to a fallback model because the primary breached its latency SLO.",
+    ["prompt", "model"],
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "bot_response_cache_lookups_total",
+    "LLM replies looked up in the response cache by the exact request.",
+    ["result"],
+)
+TRANSCRIPTION_CACHE_LOOKUPS = Counter(
+    "bot_transcription_cache_lookups_total",
+    "Voice notes looked up in the transcription cache by Telegram file_unique_id.",
+    ["result"],
+)
+TRANSCRIPTION_AUDIO_SECONDS_SAVED = Counter(
+    "bot_transcription_audio_seconds_saved_total",
+    "Seconds of voice notes answered from the transcription cache instead of Whisper.",
+)
+MEME_CACHE_LOOKUPS = Counter(
+    "bot_meme_cache_lookups_total",
+    "Memes looked up in the meme cache by perceptual hash.",
+    ["result"],
+)
+QUESTION_BANK_LOOKUPS = Counter(
+    "bot_question_bank_lookups_total",
+    "Opening tasks looked up in the pre-generated question bank.",
+    ["prompt", "result"],
+)
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "bot_semantic_cache_lookups_total",
+    "Opening tasks and roadmaps looked up in the semantic cache by topic similarity.",
+    ["prompt", "result"],
+)
+TELEGRAM_SEND_LATENCY = Histogram(
+    "bot_telegram_send_latency_seconds",
+    "Bot API request latency, rate limiter waits excluded.",
+    ["endpoint"],
+    buckets=FAST_BUCKETS,
+)
+TELEGRAM_SEND_QUEUE_DEPTH = Gauge(
+    "bot_telegram_send_queue_depth",
+    "Bot API requests queued in the rate limiter, including the ones being sent.",
+)
+TELEGRAM_SEND_ERRORS = Counter(
+    "bot_telegram_send_errors_total",
+    "Failed Bot API requests.",
+    ["endpoint", "error"],
+)
+
+
+def observe_llm_usage(model: str, prompt: str, usage: "CompletionUsage | None") -> None:
+    """Count tokens of an OpenAI reply."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, prompt, "prompt").inc(usage.prompt_tokens)
+    LLM_TOKENS.labels(model, prompt, "completion").inc(usage.completion_tokens)
+
+
+async def timed_send(
+    endpoint: str,
+    send: typing.Callable[[], typing.Awaitable[T]],
+) -> T:
+    """Send a Bot API request, recording its latency and error type."""
+    started_at: float = time.perf_counter()
+    try:
+        return await send()
+    except Exception as error:
+        TELEGRAM_SEND_ERRORS.labels(endpoint, type(error).__name__).inc()
+        raise
+    finally:
+        TELEGRAM_SEND_LATENCY.labels(endpoint).observe(time.perf_counter() - started_at)
+
+
+def _timed_handler(handler: BaseHandler, state: str) -> None:
+    callback = handler.callback
+    name: str = getattr(callback, "__name__", type(callback).__name__)
+
+    @functools.wraps(callback)
+    async def timed(update: Update, context: CallbackContext) -> object:
+        started_at: float = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as error:
+            HANDLER_ERRORS.labels(name, state, type(error).__name__).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name, state).observe(time.perf_counter() - started_at)
+
+    # the callback is annotated with an unbound return type variable, so no concrete wrapper matches it
+    handler.callback = typing.cast(typing.Callable[..., typing.Coroutine[typing.Any, typing.Any, typing.Any]], timed)
+
+
+class ActiveConversationsCollector(Collector):
+    """Counts conversations per state at scrape time.
+
+    The conversation handler is the source of truth, including conversations restored from persistence.
+    """
+
+    def __init__(self, conv_handler: ConversationHandler, state_names: dict[object, str]):
+        self.conv_handler = conv_handler
+        self.state_names = state_names
+
+    def collect(self) -> typing.Iterator[GaugeMetricFamily]:
+        """Yield the number of conversations in every state."""
+        gauge = GaugeMetricFamily("bot_active_conversations", "Conversations per state.", labels=["state"])
+        counts = CounterDict(self.conv_handler._conversations.values())  # noqa: SLF001
+        for state, name in self.state_names.items():
+            gauge.add_metric([name], counts.get(state, 0))
+        yield gauge
+
+
+def instrument_conversation(conv_handler: ConversationHandler, state_names: dict[object, str]) -> None:
+    """Wrap every handler of the conversation with latency metrics and export active conversations.
+
+    state_names maps states to metric labels, states missing from it are labelled by their value.
+    """
+    for handler in conv_handler.entry_points:
+        _timed_handler(handler, "entry")
+    for state, handlers in conv_handler.states.items():
+        for handler in handlers:
+            _timed_handler(handler, state_names.get(state, str(state)))
+    for handler in conv_handler.fallbacks:
+        _timed_handler(handler, "fallback")
+
+    REGISTRY.register(
+        ActiveConversationsCollector(
+            conv_handler,
+            {state: state_names.get(state, str(state)) for state in conv_handler.states},
+        ),
+    )
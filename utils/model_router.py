@@ -0,0 +1,117 @@
+"""Choice of the model for a request by prompt class, turn size and live latency."""
+
+import random
+import typing
+from dataclasses import dataclass
+
+from loguru import logger
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from utils.constants import ModelName
+from utils.dialog_context import count_tokens
+from utils.metrics import LLM_FALLBACKS
+from utils.resilience import LatencyTracker
+
+# share of requests still sent to a primary that breaches its SLO, so that its latency stats recover
+PROBE_SHARE: typing.Final[float] = 0.1
+# latencies older than this are forgotten, seconds: with few probes a full window of slow samples
+# would otherwise keep a recovered primary on the fallback for thousands of requests
+LATENCY_MAX_AGE: typing.Final[float] = 300.0
+
+
+@dataclass(frozen=True)
+class Route:
+    """Models for one prompt class."""
+
+    primary: ModelName
+    # used while the primary's p95 latency is above the SLO
+    fallback: ModelName | None = ModelName.GPT_4O_MINI
+    # SLO of a streamed reply: time to its first token, seconds
+    latency_slo: float = 8.0
+    # SLO of a plain reply: time until it arrives whole, seconds
+    reply_slo: float = 30.0
+    # cheaper model for short follow-up turns of a dialog
+    follow_up: ModelName | None = None
+    # a follow-up turn is short if the last user message is at most this many tokens
+    short_turn_tokens: int = 60
+
+
+DEFAULT_ROUTE: typing.Final[Route] = Route(primary=ModelName.GPT_4O)
+# keys are prompt class names
+ROUTES: typing.Final[dict[str, Route]] = {
+    # code review and fixes need the strongest model, only a slow primary is replaced
+    "CodePrompt": Route(primary=ModelName.GPT_4O, latency_slo=10),
+    "TaskPrompt": Route(primary=ModelName.GPT_4O, latency_slo=10),
+    "AlgoTaskMakerPrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "MLTaskMakerPrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "InterviewMakerPrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "TestMakerPrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "RoadMapMakerPrompt": Route(primary=ModelName.GPT_4O),
+    "PsychoHelpPrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "MemeImagePrompt": Route(primary=ModelName.GPT_4O, follow_up=ModelName.GPT_4O_MINI),
+    "MemeNeedReactionPrompt": Route(primary=ModelName.GPT_4O_MINI, fallback=None),
+    "GenericUserTextPrompt": Route(primary=ModelName.GPT_4O_MINI, fallback=None),
+    "DialogSummaryPrompt": Route(primary=ModelName.GPT_4O_MINI, fallback=None),
+}
+
+
+def _is_short_follow_up(messages: list[ChatCompletionMessageParam], route: Route) -> bool:
+    if not any(message["role"] == "assistant" for message in messages):
+        return False
+    last = messages[-1]
+    return last["role"] == "user" and count_tokens([last]) <= route.short_turn_tokens
+
+
+def _latency_key(model: str, prompt_class: str, streamed: bool) -> str:  # noqa: FBT001
+    return f"{model}:{prompt_class}:{'first-token' if streamed else 'reply'}"
+
+
+class ModelRouter:
+    """Picks a model per request from the routes table.
+
+    Streamed requests are checked against the time to first token and latency_slo, plain ones against
+    the time of the whole reply and reply_slo; the two are kept apart, so long plain replies do not push
+    streamed ones to the fallback. Latencies are kept per model and prompt class, since prompt classes
+    differ a lot in size.
+    """
+
+    def __init__(self: typing.Self, routes: dict[str, Route], default: Route = DEFAULT_ROUTE):
+        self.routes = routes
+        self.default = default
+        self.latency = LatencyTracker(max_age=LATENCY_MAX_AGE)
+
+    def record(self: typing.Self, model: str, prompt_class: str, latency: float, *, streamed: bool) -> None:
+        """Store the latency of a request: to the first token if it was streamed, to the whole reply if not."""
+        self.latency.record(_latency_key(model, prompt_class, streamed), latency)
+
+    def slo_breached(self: typing.Self, model: str, prompt_class: str, slo: float, *, streamed: bool) -> bool:
+        """Check that the model's p95 latency for the prompt class is known and above the SLO."""
+        p95 = self.latency.p95(_latency_key(model, prompt_class, streamed))
+        return p95 is not None and p95 > slo
+
+    def pick(
+        self: typing.Self,
+        prompt_class: str,
+        messages: list[ChatCompletionMessageParam],
+        *,
+        streamed: bool = False,
+    ) -> ModelName:
+        """Return the model for the request."""
+        route = self.routes.get(prompt_class, self.default)
+        model = route.primary
+        if route.follow_up is not None and _is_short_follow_up(messages, route):
+            model = route.follow_up
+        slo: float = route.latency_slo if streamed else route.reply_slo
+        if (
+            model == route.primary
+            and route.fallback is not None
+            and self.slo_breached(model, prompt_class, slo, streamed=streamed)
+            and random.random() >= PROBE_SHARE  # noqa: S311
+        ):
+            logger.debug(f"{model} breaches {slo}s SLO, route {prompt_class} to {route.fallback}")
+            LLM_FALLBACKS.labels(prompt_class, route.fallback).inc()
+            model = route.fallback
+        return model
+
+
+model_router = ModelRouter(ROUTES)
@@ -0,0 +1,77 @@
+"""Prompt templates compiled once at import time.
+
+Templates are written as indented triple-quoted strings for readability; the indentation, blank lines
+and repeated spaces cost tokens on every request, so they are stripped once. Per-user parameters are
+appended after the static instructions, so the instructions are the same text for every user.
+
+Run `python -m utils.prompt_compiler` to see token counts of every template before and after compilation.
+"""
+
+import typing
+from dataclasses import dataclass
+
+from utils.dialog_context import count_tokens
+
+
+def minify(text: str) -> str:
+    """Strip indentation and trailing spaces, collapse repeated spaces and blank lines."""
+    lines: list[str] = []
+    for line in text.strip().splitlines():
+        compact = " ".join(line.split())
+        if compact or (lines and lines[-1]):
+            lines.append(compact)
+    return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A compiled system prompt: static instructions followed by per-user parameters."""
+
+    name: str
+    source: str
+    text: str
+    params_header: str = "Параметры:"
+
+    def render(self: typing.Self, params: dict[str, str] | None = None) -> str:
+        """Append parameters to the instructions."""
+        if not params:
+            return self.text
+        lines = "\n".join(f"{label}: {value}" for label, value in params.items())
+        return f"{self.text}\n\n{self.params_header}\n{lines}"
+
+
+TEMPLATES: list[PromptTemplate] = []
+
+
+def compile_prompt(name: str, source: str, params_header: str = "Параметры:") -> PromptTemplate:
+    """Compile a template and register it for the token report."""
+    template = PromptTemplate(name=name, source=source, text=minify(source), params_header=params_header)
+    TEMPLATES.append(template)
+    return template
+
+
+def token_report() -> list[tuple[str, int, int]]:
+    """Token counts of every registered template: name, before and after compilation."""
+    return [
+        (
+            template.name,
+            count_tokens([{"role": "system", "content": template.source}]),
+            count_tokens([{"role": "system", "content": template.text}]),
+        )
+        for template in TEMPLATES
+    ]
+
+
+if __name__ == "__main__":
+    # importing the prompts registers their templates in the importable copy of this module
+    import utils.prompts  # noqa: F401
+    from utils.prompt_compiler import token_report as report
+
+    rows = report()
+    width: int = max(len(name) for name, _, _ in rows)
+    lines: list[str] = [f"{'template':<{width}}  before  after  saved"]
+    for name, before, after in rows:
+        lines.append(f"{name:<{width}}  {before:>6}  {after:>5}  {1 - after / before:>5.0%}")
+    total_before, total_after = sum(row[1] for row in rows), sum(row[2] for row in rows)
+    lines.append(f"{'total':<{width}}  {total_before:>6}  {total_after:>5}  {1 - total_after / total_before:>5.0%}")
+    print("\n".join(lines))  # noqa: T201 - the report is the output of the command
@@ -1,6 +1,5 @@
 """Prompt builders."""
 
-import base64
 import typing
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
@@ -8,40 +7,44 @@ from dataclasses import dataclass
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
 from utils.constants import CodePromptMode, TaskPromptMode
-
-
-@dataclass
-class Prompt(ABC):
-    """Prompt builder."""
-
-    @property
-    @abstractmethod
-    def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
-        """Final message history to be sent to LLM."""
-        raise NotImplementedError
-
-
-@dataclass
-class CodePrompt(Prompt):
-    """Prompt builder for code explanation scenario."""
-
-    code: str
-    mode: CodePromptMode
-
-    @property
-    def _instruction(self: typing.Self) -> str:
-        if self.mode == CodePromptMode.EXPLAIN:
-            return """You should analyse, explain and interpret it.
+from utils.dialog_context import ConversationMemory
+from utils.images import PreparedImage
+from utils.prompt_compiler import PromptTemplate, compile_prompt
+
+EDA_ASSISTANT_INSTRUCTIONS: typing.Final[str] = compile_prompt(
+    "EDA_ASSISTANT_INSTRUCTIONS",
+    """
+        You are an excellent senior Data Scientist with 10 years of experience.
+        You make Exploratory Data Analysis for recieved datasets.
+        Probably dataset will be in csv format.
+
+        Output formatting:
+        - Give anwser on russian except of column names or terms. It's important!
+        - Give answer in correct Markdown format (use only Markdown's secial symbols)
+        - For all headers use Telegram's "*text example*" for bold, and "`text example`" for code
+        formatiing instead of Markdown's "#", "##"
+        - Must be possible to pretty display answer in Telegram message
+        - Don't use tables in response
+        - Answer that you can't plot any graph and image yet
+        """,
+).text
+
+CODE_TEMPLATES: typing.Final[dict[str, PromptTemplate]] = {
+    CodePromptMode.EXPLAIN.value: compile_prompt(
+        "CodePrompt.explain",
+        """You are a virtual assistant for a data scientist. They will send you some code.
+            You should analyse, explain and interpret it.
 
             Your response should consist of two parts:
             1. Textual description of what the code does in general.
             2. The very same code with inline comments where you explain everything step by step.
 
             Your response should be in Russian except for the code.
-            """
-
-        if self.mode == CodePromptMode.FIND_BUG:
-            return """Analyse it.
+            """,
+    ),
+    CodePromptMode.FIND_BUG.value: compile_prompt(
+        "CodePrompt.find_bug",
+        """You are a virtual assistant for a data scientist. They will send you some code. Analyse it.
 
             Your response instructions:
             1. If there are no bugs, confirm to the user that you have not found any potential problems in the code.
@@ -50,10 +53,12 @@ class CodePrompt(Prompt):
                 - Provide the fixed version of the code with inline comments about what you have changed
 
             Your response should be in Russian except for the code.
-            """
-
-        if self.mode == CodePromptMode.REFACTOR:
-            return """Refactor it to improve readability, efficiency, and maintainability.
+            """,
+    ),
+    CodePromptMode.REFACTOR.value: compile_prompt(
+        "CodePrompt.refactor",
+        """You are a virtual assistant for a data scientist. They will send you some code.
+            Refactor it to improve readability, efficiency, and maintainability.
             Identify areas where the code can be simplified, optimized, and made more efficient.
             Consider breaking down complex functions into smaller, more modular ones,
             eliminating redundant code, and adhering to best practices and coding conventions.
@@ -64,10 +69,12 @@ class CodePrompt(Prompt):
             2. Refactored version of the code.
 
             Your response should be in Russian except for the code.
-            """
-
-        if self.mode == CodePromptMode.REVIEW:
-            return """Review the code and provide detailed feedback on the following aspects:
+            """,
+    ),
+    CodePromptMode.REVIEW.value: compile_prompt(
+        "CodePrompt.review",
+        """You are a virtual assistant for a data scientist. They will send you some code.
+            Review the code and provide detailed feedback on the following aspects:
             - Syntax and logic errors
             - Performance bottlenecks
             - Security vulnerabilities
@@ -83,35 +90,16 @@ class CodePrompt(Prompt):
             This list is not exhaustive. Provide a thorough analysis and any recommendations for improvements.
 
             Your response should be in Russian except for the code.
-            """
-
-        msg: str = f"Unknown mode: {self.mode}"
-        raise NotImplementedError(msg)
-
-    @property
-    def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
-        """Message history with a prompt to retrieve code explanation."""
-        prompt: str = (
-            f"You are a virtual assistant for a data scientist. They will send you some code. {self._instruction}"
-        )
-
-        return [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": self.code},
-        ]
-
-
-@dataclass
-class TaskPrompt(Prompt):
-    """Prompt builder for code explanation scenario."""
-
-    task: str
-    mode: TaskPromptMode
-
-    @property
-    def _instruction(self: typing.Self) -> str:
-        if self.mode == TaskPromptMode.INSTRUCT:
-            return """Based on the task description, generate a set of clear, concise, and actionable instructions
+            """,
+    ),
+}
+
+TASK_TEMPLATES: typing.Final[dict[str, PromptTemplate]] = {
+    TaskPromptMode.INSTRUCT.value: compile_prompt(
+        "TaskPrompt.instruct",
+        """You are a virtual assistant for a data scientist.
+            In their message, they will send you a description of their task.
+            Based on the task description, generate a set of clear, concise, and actionable instructions
             that will guide someone through the completion of the task. The instructions should be easy to follow
             and should cover all necessary steps, tools, and considerations to ensure successful completion.
 
@@ -124,10 +112,13 @@ class TaskPrompt(Prompt):
             6. Ensure the instructions are logically ordered and easy to understand.
 
             Your response should be in Russian.
-            """
-
-        if self.mode == TaskPromptMode.IMPLEMENT:
-            return """Your should write code based on this description.
+            """,
+    ),
+    TaskPromptMode.IMPLEMENT.value: compile_prompt(
+        "TaskPrompt.implement",
+        """You are a virtual assistant for a data scientist.
+            In their message, they will send you a description of their task.
+            Your should write code based on this description.
 
             Ensure the following:
             1. Your code is clean, well-documented, and adheres to best practices
@@ -141,21 +132,147 @@ class TaskPrompt(Prompt):
             7. You have included a set of test cases or a simple testing framework to validate the functionality.
 
             If you add any textual comments, give them in Russian.
-            """
+            """,
+    ),
+}
+
+# уровень кандидата, тема и сложность стоят в конце промпта, чтобы начало было общим для всех пользователей
+ALGO_TASK_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "AlgoTaskMakerPrompt",
+    """
+                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
+                с кандидатом на позицию DS-разработчика (уровень кандидата указан в параметрах).
+                Сформулируй задачу на алгоритмы (описание условий, пример данных на вход и выход)
+                и задай по ней вопросы (память и время выполнения) на тему и уровня сложности из параметров
+                без подсказок и не показывай правильный ответ пока пользователь не отправит свое решение.
+                Разбери решение пользователя когда он тебе ответит
+        """,
+)
+ML_TASK_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "MLTaskMakerPrompt",
+    """
+                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
+                с кандидатом на позицию DS-разработчика (уровень кандидата указан в параметрах).
+                Сформулируй задачу на алгоритмы (описание условий, пример данных на вход и выход)
+                и задай по ней вопросы (память и время выполнения) на тему и уровня сложности из параметров
+                без подсказок и не показывай правильный ответ пока пользователь не отправит свое решение.
+                Разбери решение пользователя когда он тебе ответит
+        """,
+)
+INTERVIEW_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "InterviewMakerPrompt",
+    """
+                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
+                с кандидатом на позицию DS-разработчика (уровень кандидата указан в параметрах).
+                Вопросы должны быть по теме из параметров.
+                Сформулируй две задачи на алгоритмы (описание условий, пример данных на вход и выход)
+                и серию вопросов уровня сложности из параметров
+                без подсказок и не показывай правильный ответ пока пользователь не отправит свое решение
+                Разбери решение пользователя когда он тебе ответит
+        """,
+)
+TEST_MAKER_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "TestMakerPrompt",
+    """
+                Выступая в роли опытного IT-рекрутера, вы столкнулись с задачей помочь
+                DS-разработчику (его уровень указан в параметрах) в подготовке к теме из параметров
+                с уровнем сложности из параметров. Вам необходимо предоставить тест с вариантами ответов,
+                который поможет им оценить свои знания и умения.
+                Важно, чтобы тест был разнообразным и не требовал подсказок.
+                Правильные ответы не следует показывать до тех пор, пока пользователь не отправит свое решение.
+                Разбери решение пользователя когда он тебе ответит
+        """,
+)
+ROADMAP_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "RoadMapMakerPrompt",
+    """
+                    Выступая в роли опытного IT-рекрутера, вы столкнулись с задачей помочь
+                    DS-разработчику (его уровень указан в параметрах) в подготовке к теме из параметров
+                    с уровнем сложности из параметров. Вам необходимо предоставить план с пунктами, которые
+                    помогут им освоить эту тему. Важно, чтобы пункты были разнообразными и не требовали ссылок.
+        """,
+)
+PSYCHO_HELP_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "PsychoHelpPrompt",
+    """
+                Представь, что ты опытный психолог, и к тебе пришел DS-разработчик.
+                И просит помочь ему подготовиться к собеседованию.
+                Ответь на его вопросы и помоги ему
+        """,
+)
+MEME_IMAGE_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "MemeImagePrompt",
+    """Представь, что ты столкнулся с мемом, который вызывает у тебя смех. Важно не описать
+         картинку, а понять, почему этот мем смешной. Ответь коротко на следующие вопросы: Какие элементы мема
+         вызывают смех? Какая основная идея или шутка заложена в меме? Есть ли какие-либо культурные или
+         интернет-отсылки, которые следует знать, чтобы понять мем? Ответ не структурируй.""",
+)
+MEME_NEED_REACTION_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "MemeNeedReactionPrompt",
+    """Представьте, что вам прислали в чат мем. Вам нужно отреагировать на него в чате так, чтобы
+         показать, что вы его поняли.""",
+)
+DIALOG_SUMMARY_TEMPLATE: typing.Final[PromptTemplate] = compile_prompt(
+    "DialogSummaryPrompt",
+    """Ты ведёшь краткий конспект диалога пользователя с ассистентом.
+        Дополни имеющийся конспект новыми репликами. Сохрани тему, условия задач, ответы пользователя
+        и оценки ассистента, опусти приветствия и повторы. Ответь только обновлённым конспектом.""",
+)
+
+
+def _interview_params(interview_hard: str, topic: str, questions_hard: str) -> dict[str, str]:
+    return {"Уровень кандидата": interview_hard, "Тема": topic, "Уровень сложности": questions_hard}
 
-        msg: str = f"Unknown mode: {self.mode}"
-        raise NotImplementedError(msg)
+
+@dataclass
+class Prompt(ABC):
+    """Prompt builder."""
+
+    @property
+    @abstractmethod
+    def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
+        """Final message history to be sent to LLM."""
+        raise NotImplementedError
+
+
+@dataclass
+class CodePrompt(Prompt):
+    """Prompt builder for code explanation scenario."""
+
+    code: str
+    mode: CodePromptMode
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt to retrieve code explanation."""
-        prompt: str = f"""You are a virtual assistant for a data scientist.
-        In their message, they will send you a description of their task.
-        {self._instruction}
-        """
+        template = CODE_TEMPLATES.get(str(getattr(self.mode, "value", self.mode)))
+        if template is None:
+            msg: str = f"Unknown mode: {self.mode}"
+            raise NotImplementedError(msg)
 
         return [
-            {"role": "system", "content": prompt},
+            {"role": "system", "content": template.render()},
+            {"role": "user", "content": self.code},
+        ]
+
+
+@dataclass
+class TaskPrompt(Prompt):
+    """Prompt builder for code explanation scenario."""
+
+    task: str
+    mode: TaskPromptMode
+
+    @property
+    def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
+        """Message history with a prompt to retrieve code explanation."""
+        template = TASK_TEMPLATES.get(str(getattr(self.mode, "value", self.mode)))
+        if template is None:
+            msg: str = f"Unknown mode: {self.mode}"
+            raise NotImplementedError(msg)
+
+        return [
+            {"role": "system", "content": template.render()},
             {"role": "user", "content": self.task},
         ]
 
@@ -167,19 +284,12 @@ class AlgoTaskMakerPrompt(Prompt):
     questions_hard: str
     interview_hard: str
     topic: str
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for algo scenario."""
-        prompt: str = f"""
-                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
-                с кандидатом на позицию {self.interview_hard} DS-разработчика.
-                Сформулируй задачу на алгоритмы (описание условий, пример данных на вход и выход)
-                и задай по ней вопросы(память и время выполнение) на тему {self.topic} уровня {self.questions_hard}
-                без подсказок и не показывай правильный ответ пока пользователь не отправит свое решение.
-                Разбери решение пользователя когда он тебе ответит
-        """
+        prompt: str = ALGO_TASK_TEMPLATE.render(_interview_params(self.interview_hard, self.topic, self.questions_hard))
         return [{"role": "system", "content": prompt}, *self.reply]
 
 
@@ -190,19 +300,12 @@ class MLTaskMakerPrompt(Prompt):
     questions_hard: str
     interview_hard: str
     topic: str
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for ml scenario."""
-        prompt: str = f"""
-                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
-                с кандидатом на позицию {self.interview_hard} DS-разработчика.
-                Сформулируй задачу на алгоритмы (описание условий, пример данных на вход и выход)
-                и задай по ней вопросы(память и время выполнение) на тему {self.topic} уровня {self.questions_hard}
-                без подсказок и не показывай правильный ответ пока пользователь не отправит свое решение.
-                Разбери решение пользователя когда он тебе ответит
-        """
+        prompt: str = ML_TASK_TEMPLATE.render(_interview_params(self.interview_hard, self.topic, self.questions_hard))
         return [{"role": "system", "content": prompt}, *self.reply]
 
 
@@ -213,19 +316,12 @@ class InterviewMakerPrompt(Prompt):
     questions_hard: str
     interview_hard: str
     topic: str
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for interview scenario."""
-        prompt: str = f"""
-                Представь, что ты опытный IT-рекрутер, проводящий техническое собеседование
-                с кандидатом на позицию {self.interview_hard} DS-разработчика. Вопросы должны быть по теме: {self.topic}
-                Сформулируй две задачи на алгоритмы(описание условий, пример данных на вход и выход)
-                уровня {self.questions_hard} и серию вопросов по уровня {self.questions_hard}
-                без подсказок и не показывай правильныйответ пока пользователь не отправит свое решение
-                Разбери решение пользователя когда он тебе ответит
-        """
+        prompt: str = INTERVIEW_TEMPLATE.render(_interview_params(self.interview_hard, self.topic, self.questions_hard))
         return [{"role": "system", "content": prompt}, *self.reply]
 
 
@@ -236,20 +332,13 @@ class TestMakerPrompt(Prompt):
     questions_hard: str
     interview_hard: str
     topic: str
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for interview scenario."""
-        prompt: str = f"""
-                Выступая в роли опытного IT-рекрутера, вы столкнулись с задачей помочь {self.interview_hard}
-                DS-разработчику в подготовке к теме {self.topic} различного уровня сложности:
-                {self.questions_hard}.Вам необходимо предоставить тест с вариантами ответов,
-                который поможет им оценить свои знания и умения.
-                Важно, чтобы тест был разнообразным и не требовал подсказок.
-                Правильные ответы не следует показывать до тех пор, пока пользователь не отправит свое решение.
-                Разбери решение пользователя когда он тебе ответит
-        """
+        params = _interview_params(self.interview_hard, self.topic, self.questions_hard)
+        prompt: str = TEST_MAKER_TEMPLATE.render(params)
         return [{"role": "system", "content": prompt}, *self.reply]
 
 
@@ -260,17 +349,12 @@ class RoadMapMakerPrompt(Prompt):
     questions_hard: str
     interview_hard: str
     topic: str
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for interview scenario."""
-        prompt: str = f"""
-                    Выступая в роли опытного IT-рекрутера, вы столкнулись с задачей помочь
-                    {self.interview_hard} DS-разработчику в подготовке к теме {self.topic} уровня сложности:
-                    {self.questions_hard}. Вам необходимо предоставить план с пунктами, которые
-                    помогут им освоить эту тему. Важно, чтобы пункты были разнообразными и не требовали ссылок.
-        """
+        prompt: str = ROADMAP_TEMPLATE.render(_interview_params(self.interview_hard, self.topic, self.questions_hard))
         return [{"role": "system", "content": prompt}, *self.reply]
 
 
@@ -278,35 +362,24 @@ class RoadMapMakerPrompt(Prompt):
 class PsychoHelpPrompt(Prompt):
     """Prompt builder for interview task scenario."""
 
-    reply: dict
+    reply: ConversationMemory
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Message history with a prompt for interview scenario."""
-        prompt: str = """
-                Представь, что ты опытный психолог, и к тебе пришел DS-разработчик.
-                И просит помочь ему подготовиться к собеседованию.
-                Ответь на его вопросы и помоги ему
-        """
-        return [{"role": "system", "content": prompt}, *self.reply]
+        return [{"role": "system", "content": PSYCHO_HELP_TEMPLATE.render()}, *self.reply]
 
 
 @dataclass
 class MemeImagePrompt(Prompt):
     """Prompt builder for meme explanation scenario."""
 
-    image: bytearray
+    image: PreparedImage
 
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Meme scenario prompt."""
-        prompt: str = """Представь, что ты столкнулся с мемом, который вызывает у тебя смех. Важно не описать
-         картинку, а понять, почему этот мем смешной. Ответь коротко на следующие вопросы: Какие элементы мема
-         вызывают смех? Какая основная идея или шутка заложена в меме? Есть ли какие-либо культурные или
-         интернет-отсылки, которые следует знать, чтобы понять мем? Ответ не структурируй."""
-        bytes_data = bytes(self.image)
-        base64_encoded = base64.b64encode(bytes_data)
-        base64_string = base64_encoded.decode("utf-8")
+        prompt: str = MEME_IMAGE_TEMPLATE.render()
         return [
             {
                 "role": "user",
@@ -318,7 +391,8 @@ class MemeImagePrompt(Prompt):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_string}",
+                            "url": self.image.data_url,
+                            "detail": self.image.detail,
                         },
                     },
                 ],
@@ -333,8 +407,7 @@ class MemeNeedReactionPrompt(Prompt):
     @property
     def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
         """Meme reaction prompt."""
-        prompt: str = """Представьте, что вам прислали в чат мем. Вам нужно отреагировать на него в чате так, чтобы
-         показать, что вы его поняли."""
+        prompt: str = MEME_NEED_REACTION_TEMPLATE.render()
         return [
             {
                 "role": "user",
@@ -368,3 +441,21 @@ class GenericUserTextPrompt(Prompt):
                 ],
             },
         ]
+
+
+@dataclass
+class DialogSummaryPrompt(Prompt):
+    """Prompt builder for folding old dialog turns into a rolling summary."""
+
+    summary: str
+    turns: list[ChatCompletionMessageParam]
+
+    @property
+    def messages(self: typing.Self) -> typing.Iterable[ChatCompletionMessageParam]:
+        """Summarization prompt."""
+        prompt: str = DIALOG_SUMMARY_TEMPLATE.render()
+        dialog: str = "\n".join(f"{turn['role']}: {turn.get('content')}" for turn in self.turns)
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"Конспект:\n{self.summary or '-'}\n\nНовые реплики:\n{dialog}"},
+        ]
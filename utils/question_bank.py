@@ -0,0 +1,239 @@
+"""Bank of opening tasks for interview-style dialogs, pre-generated offline through the OpenAI Batch API.
+
+The first turn of the algo, ML, interview and test dialogs depends only on the prompt class, the topic and
+the two difficulty settings, so popular combinations are generated in advance and served instantly.
+Tasks of one key are rotated: the least served one goes first, and a user never gets a task they have seen.
+
+Generate a bank (the job waits for the batch, which may take up to 24 hours):
+
+    python -m utils.question_bank --topics "Графы,Деревья,SQL" --variants 3
+
+An interrupted job can be resumed with --batch-id.
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+import typing
+from dataclasses import dataclass
+
+from loguru import logger
+
+from config.openai_client import assistants_client
+from config.settings import QUESTION_BANK_PATH
+from utils.constants import MAX_TOKENS, TEMPERATURE
+from utils.dialog_context import ConversationMemory
+from utils.metrics import QUESTION_BANK_LOOKUPS
+from utils.model_router import ROUTES
+from utils.prompts import AlgoTaskMakerPrompt, InterviewMakerPrompt, MLTaskMakerPrompt, TestMakerPrompt
+
+# prompts of the dialogs whose first turn is banked, they all take the same fields
+BankPrompt = AlgoTaskMakerPrompt | MLTaskMakerPrompt | InterviewMakerPrompt | TestMakerPrompt
+BANK_PROMPTS: typing.Final[dict[str, type[BankPrompt]]] = {
+    prompt.__name__: prompt for prompt in typing.get_args(BankPrompt)
+}
+LEVELS: typing.Final[tuple[str, ...]] = ("INTERN", "JUNIOR", "MIDDLE", "SENIOR")
+DIFFICULTIES: typing.Final[tuple[str, ...]] = ("EASY", "MEDIUM", "HARD")
+BATCH_FINAL_STATUSES: typing.Final[frozenset[str]] = frozenset({"completed", "failed", "expired", "cancelled"})
+# how many served task ids are remembered per user
+SEEN_LIMIT: typing.Final[int] = 200
+
+
+def normalize_topic(topic: str) -> str:
+    """Topic as typed by different users: case, "ё", extra spaces and trailing punctuation do not matter."""
+    return " ".join(topic.lower().replace("ё", "е").split()).strip(" .!?")
+
+
+@dataclass(frozen=True)
+class BankKey:
+    """What the opening task depends on."""
+
+    prompt: str
+    topic: str
+    interview_hard: str
+    questions_hard: str
+
+    @classmethod
+    def of(cls: type[typing.Self], prompt: str, topic: str, interview_hard: str, questions_hard: str) -> typing.Self:
+        """Key with a normalized topic."""
+        return cls(prompt, normalize_topic(topic), interview_hard, questions_hard)
+
+    def custom_id(self: typing.Self, variant: int) -> str:
+        """Id of a batch request; the topic goes last since it may contain the separator."""
+        return f"{self.prompt}|{self.interview_hard}|{self.questions_hard}|{variant}|{self.topic}"
+
+    @classmethod
+    def from_custom_id(cls: type[typing.Self], custom_id: str) -> typing.Self:
+        """Parse a batch request id."""
+        prompt, interview_hard, questions_hard, _, topic = custom_id.split("|", 4)
+        return cls(prompt, topic, interview_hard, questions_hard)
+
+
+class QuestionBank:
+    """SQLite store of pre-generated tasks; without a path the bank is empty."""
+
+    def __init__(self: typing.Self, path: str = ""):
+        self._connection: sqlite3.Connection | None = None
+        if path:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, prompt TEXT NOT NULL, topic TEXT NOT NULL, "
+                "interview_hard TEXT NOT NULL, questions_hard TEXT NOT NULL, content TEXT NOT NULL, "
+                "served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)",
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_key ON tasks (prompt, topic, interview_hard, questions_hard, served)",
+            )
+            self._connection.commit()
+
+    def add(self: typing.Self, key: BankKey, content: str) -> None:
+        """Store a generated task."""
+        if self._connection is None:
+            return
+        self._connection.execute(
+            "INSERT INTO tasks (prompt, topic, interview_hard, questions_hard, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key.prompt, key.topic, key.interview_hard, key.questions_hard, content, time.time()),
+        )
+        self._connection.commit()
+
+    def _take(self: typing.Self, key: BankKey, exclude: typing.Collection[int]) -> tuple[int, str] | None:
+        if self._connection is None:
+            return None
+        # excluded ids are passed as one JSON array, so the query text does not depend on their number
+        row = self._connection.execute(
+            "SELECT id, content FROM tasks WHERE prompt = ? AND topic = ? AND interview_hard = ? "
+            "AND questions_hard = ? AND id NOT IN (SELECT value FROM json_each(?)) ORDER BY served, random() LIMIT 1",
+            (key.prompt, key.topic, key.interview_hard, key.questions_hard, json.dumps(list(exclude))),
+        ).fetchone()
+        if row is not None:
+            self._connection.execute("UPDATE tasks SET served = served + 1 WHERE id = ?", (row[0],))
+            self._connection.commit()
+        return row
+
+    async def take(self: typing.Self, key: BankKey, exclude: typing.Collection[int] = ()) -> tuple[int, str] | None:
+        """Return the least served task of the key not in exclude, with its id."""
+        found = await asyncio.to_thread(self._take, key, exclude)
+        QUESTION_BANK_LOOKUPS.labels(key.prompt, "miss" if found is None else "hit").inc()
+        return found
+
+
+question_bank = QuestionBank(QUESTION_BANK_PATH)
+
+
+def batch_requests(
+    prompts: typing.Iterable[str],
+    topics: typing.Iterable[str],
+    levels: typing.Iterable[str],
+    difficulties: typing.Iterable[str],
+    variants: int,
+) -> list[dict[str, typing.Any]]:
+    """Batch API requests for every combination, as the live dialog would send its first turn."""
+    requests: list[dict[str, typing.Any]] = []
+    for prompt_class in prompts:
+        for topic in topics:
+            for level in levels:
+                for difficulty in difficulties:
+                    prompt = BANK_PROMPTS[prompt_class](
+                        questions_hard=difficulty,
+                        interview_hard=level,
+                        topic=topic,
+                        reply=ConversationMemory(),
+                    )
+                    key = BankKey.of(prompt_class, topic, level, difficulty)
+                    requests.extend(
+                        {
+                            "custom_id": key.custom_id(variant),
+                            "method": "POST",
+                            "url": "/v1/chat/completions",
+                            "body": {
+                                "model": ROUTES[prompt_class].primary,
+                                "messages": list(prompt.messages),
+                                "max_tokens": MAX_TOKENS,
+                                "temperature": TEMPERATURE,
+                            },
+                        }
+                        for variant in range(variants)
+                    )
+    return requests
+
+
+async def submit_batch(requests: list[dict[str, typing.Any]]) -> str:
+    """Upload requests and start a batch, return its id."""
+    payload: bytes = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests).encode()
+    uploaded = await assistants_client.files.create(file=("question_bank.jsonl", payload), purpose="batch")
+    batch = await assistants_client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+        metadata={"job": "question_bank"},
+    )
+    logger.info(f"Batch {batch.id} submitted: {len(requests)} requests")
+    return batch.id
+
+
+async def collect_batch(batch_id: str, bank: QuestionBank, poll_interval: float) -> int:
+    """Wait for a batch to finish and store its results, return the number of stored tasks."""
+    batch = await assistants_client.batches.retrieve(batch_id)
+    while batch.status not in BATCH_FINAL_STATUSES:
+        logger.info(f"Batch {batch_id} is {batch.status}: {batch.request_counts}")
+        await asyncio.sleep(poll_interval)
+        batch = await assistants_client.batches.retrieve(batch_id)
+    if batch.output_file_id is None:
+        msg: str = f"Batch {batch_id} is {batch.status} without results: {batch.errors}"
+        raise RuntimeError(msg)
+
+    output = await assistants_client.files.content(batch.output_file_id)
+    stored: int = 0
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:  # noqa: PLR2004
+            logger.warning(f"Batch request {result['custom_id']} failed: {result.get('error') or response}")
+            continue
+        if content := (response["body"]["choices"][0]["message"].get("content") or "").strip():
+            bank.add(BankKey.from_custom_id(result["custom_id"]), content)
+            stored += 1
+    logger.info(f"Batch {batch_id} is {batch.status}: stored {stored} tasks")
+    return stored
+
+
+async def generate(args: argparse.Namespace, bank: QuestionBank) -> int:
+    """Submit a batch for the matrix from the arguments, or resume one, and fill the bank."""
+    batch_id: str | None = args.batch_id
+    if batch_id is None:
+        requests = batch_requests(args.prompts, args.topics, args.levels, args.difficulties, args.variants)
+        batch_id = await submit_batch(requests)
+    return await collect_batch(batch_id, bank, args.poll_interval)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """Parse command line options of the generation job."""
+
+    def names(value: str) -> list[str]:
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    parser = argparse.ArgumentParser(prog="python -m utils.question_bank", description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--topics", type=names, required=True, help="comma-separated topics")
+    parser.add_argument("--prompts", type=names, default=list(BANK_PROMPTS), help="comma-separated prompt classes")
+    parser.add_argument("--levels", type=names, default=list(LEVELS), help="candidate levels")
+    parser.add_argument("--difficulties", type=names, default=list(DIFFICULTIES), help="task difficulties")
+    parser.add_argument("--variants", type=int, default=3, help="tasks per combination")
+    parser.add_argument("--batch-id", default=None, help="collect the results of an already submitted batch")
+    parser.add_argument("--poll-interval", type=float, default=60, help="seconds between batch status checks")
+    parser.add_argument("--path", default=QUESTION_BANK_PATH, help="SQLite file of the bank")
+    args = parser.parse_args(argv)
+    if unknown := set(args.prompts) - BANK_PROMPTS.keys():
+        parser.error(f"unknown prompt classes: {', '.join(sorted(unknown))}")
+    if not args.path:
+        parser.error("set QUESTION_BANK_PATH or --path")
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    asyncio.run(generate(arguments, QuestionBank(arguments.path)))
@@ -0,0 +1,221 @@
+"""Retries, deadlines, circuit breaking and hedging for OpenAI calls."""
+
+import asyncio
+import random
+import time
+import typing
+from collections import deque
+from dataclasses import dataclass
+
+import openai
+from loguru import logger
+
+from config.settings import LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT
+from exceptions.llm_unavailable_error import LLMUnavailableError
+
+T = typing.TypeVar("T")
+
+# number of latency samples to trust an observed p95
+MIN_LATENCY_SAMPLES: typing.Final[int] = 20
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """How a scenario calls OpenAI.
+
+    Hedging is ignored for streaming calls: a second stream would be paid for but never read.
+    """
+
+    name: str
+    # overall time budget for all attempts, seconds
+    deadline: float
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    # fire a second request if the first one is slower than the observed p95
+    hedge: bool = False
+    # hedge delay used until enough latencies are observed
+    default_hedge_delay: float = 10.0
+    # longest pause between chunks of a streamed reply, seconds
+    idle_timeout: float = 30.0
+
+
+CHAT_POLICY = CallPolicy(name="chat", deadline=120)
+HELP_POLICY = CallPolicy(name="help", deadline=120)
+SUMMARY_POLICY = CallPolicy(name="summary", deadline=60)
+VISION_POLICY = CallPolicy(name="vision", deadline=90, hedge=True, default_hedge_delay=20)
+# embeddings only speed up a dialog, so they get little time
+EMBEDDING_POLICY = CallPolicy(name="embedding", deadline=10, max_attempts=2)
+TRANSCRIPTION_POLICY = CallPolicy(name="transcription", deadline=60, hedge=True, default_hedge_delay=10)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and connection problems are worth retrying.
+
+    openai.APITimeoutError is a subclass of openai.APIConnectionError.
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500  # noqa: PLR2004
+    return isinstance(error, openai.APIConnectionError)
+
+
+class CircuitBreaker:
+    """Stops calling OpenAI after several consecutive failures and probes it again after reset_timeout."""
+
+    def __init__(self: typing.Self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: int = 0
+        self._opened_at: float | None = None
+        self._probing: bool = False
+
+    @property
+    def is_open(self: typing.Self) -> bool:
+        """Calls are rejected without trying."""
+        if self._opened_at is None:
+            return False
+        # after reset_timeout one call is let through (half-open state)
+        return time.monotonic() - self._opened_at < self.reset_timeout
+
+    def admit(self: typing.Self) -> bool:
+        """Let a call through or raise LLMUnavailableError, return True if the call is the half-open probe.
+
+        While the probe is in flight other calls are rejected, so a recovering OpenAI gets one request,
+        not every request that queued up while the breaker was open.
+        """
+        if self._opened_at is None:
+            return False
+        if self.is_open or self._probing:
+            msg = "circuit breaker is open"
+            raise LLMUnavailableError(msg)
+        self._probing = True
+        return True
+
+    def end_probe(self: typing.Self) -> None:
+        """Let the next call probe OpenAI if the probe ended without a verdict, e.g. it was cancelled."""
+        self._probing = False
+
+    def record_success(self: typing.Self) -> None:
+        """Close the breaker."""
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self: typing.Self) -> None:
+        """Count failure and open the breaker if there are too many."""
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            if not self.is_open:
+                logger.error(f"OpenAI circuit breaker opened after {self._failures} failures")
+            self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent latencies of successful calls per policy.
+
+    With max_age, samples older than max_age seconds are forgotten even if few new ones came in.
+    """
+
+    def __init__(self: typing.Self, window: int = 200, max_age: float | None = None):
+        # (time.monotonic() of the sample, latency)
+        self._samples: dict[str, deque[tuple[float, float]]] = {}
+        self.window = window
+        self.max_age = max_age
+
+    def record(self: typing.Self, name: str, latency: float) -> None:
+        """Store call latency."""
+        self._samples.setdefault(name, deque(maxlen=self.window)).append((time.monotonic(), latency))
+
+    def p95(self: typing.Self, name: str) -> float | None:
+        """95th percentile of latency, None while there are too few samples."""
+        samples = self._samples.get(name)
+        if samples is None:
+            return None
+        if self.max_age is not None:
+            expired_before: float = time.monotonic() - self.max_age
+            while samples and samples[0][0] < expired_before:
+                samples.popleft()
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(latency for _, latency in samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+openai_breaker = CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT)
+latency_tracker = LatencyTracker()
+
+
+async def _hedged(call: typing.Callable[[], typing.Awaitable[T]], delay: float) -> T:
+    """Run call, start a second copy if the first is slower than delay, return the first success."""
+    tasks: set[asyncio.Task[T]] = {asyncio.ensure_future(call())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            logger.info(f"Hedge OpenAI request after {delay:.1f}s")
+            tasks.add(asyncio.ensure_future(call()))
+        error: BaseException | None = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise typing.cast(BaseException, error)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def resilient_call(call: typing.Callable[[], typing.Awaitable[T]], policy: CallPolicy) -> T:
+    """Call OpenAI with retries on transient errors, the policy deadline, circuit breaker and hedging."""
+    probe: bool = openai_breaker.admit()
+    try:
+        return await _call_with_retries(call, policy)
+    finally:
+        if probe:
+            openai_breaker.end_probe()
+
+
+async def _call_with_retries(call: typing.Callable[[], typing.Awaitable[T]], policy: CallPolicy) -> T:
+    try:
+        async with asyncio.timeout(policy.deadline):
+            for attempt in range(1, policy.max_attempts + 1):
+                started_at = time.monotonic()
+                try:
+                    if policy.hedge:
+                        hedge_delay = latency_tracker.p95(policy.name) or policy.default_hedge_delay
+                        result = await _hedged(call, hedge_delay)
+                    else:
+                        result = await call()
+                except Exception as error:
+                    if not is_retryable(error):
+                        raise
+                    openai_breaker.record_failure()
+                    if attempt == policy.max_attempts or openai_breaker.is_open:
+                        msg = repr(error)
+                        raise LLMUnavailableError(msg) from error
+                    # full jitter
+                    delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2**attempt))  # noqa: S311
+                    logger.warning(f"OpenAI {policy.name} call failed ({error!r}), retry in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                else:
+                    openai_breaker.record_success()
+                    latency_tracker.record(policy.name, time.monotonic() - started_at)
+                    return result
+    except TimeoutError as error:
+        openai_breaker.record_failure()
+        msg = f"{policy.name} deadline {policy.deadline}s exceeded"
+        raise LLMUnavailableError(msg) from error
+
+    msg = "no attempts made"
+    raise LLMUnavailableError(msg)
+
+
+async def next_chunk(chunks: typing.AsyncIterator[T], policy: CallPolicy) -> T | None:
+    """Next chunk of a streamed reply, None at its end; a stream silent for idle_timeout is given up."""
+    try:
+        async with asyncio.timeout(policy.idle_timeout):
+            return await anext(chunks, None)
+    except TimeoutError as error:
+        openai_breaker.record_failure()
+        msg = f"{policy.name} stream idle for {policy.idle_timeout}s"
+        raise LLMUnavailableError(msg) from error
@@ -0,0 +1,125 @@
+"""Content-addressed cache of LLM responses."""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import typing
+from collections import OrderedDict
+
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from config.settings import RESPONSE_CACHE_PATH, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+from utils.metrics import RESPONSE_CACHE_LOOKUPS
+
+
+def _normalize_text(text: str) -> str:
+    # indentation and line breaks are meaningful in code, only trailing whitespace, line endings
+    # and blank lines around the text are not
+    return "\n".join(line.rstrip() for line in text.splitlines()).strip("\n")
+
+
+def _normalize_message(message: ChatCompletionMessageParam) -> dict[str, typing.Any]:
+    content = message.get("content")
+    if not isinstance(content, str) and content is not None:
+        parts: list[dict[str, typing.Any]] = [dict(part) for part in content]
+        return {
+            "role": message["role"],
+            "content": [
+                {**part, "text": _normalize_text(part["text"])} if part.get("type") == "text" else part
+                for part in parts
+            ],
+        }
+    return {"role": message["role"], "content": _normalize_text(content) if content is not None else None}
+
+
+def make_cache_key(
+    model: str,
+    messages: typing.Iterable[ChatCompletionMessageParam],
+    max_tokens: int,
+    temperature: float,
+) -> str:
+    """Hash of request parameters that does not depend on insignificant whitespace."""
+    payload: str = json.dumps(
+        {
+            "model": model,
+            "messages": [_normalize_message(message) for message in messages],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _SQLiteTier:
+    """On-disk cache tier that survives restarts."""
+
+    def __init__(self: typing.Self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)",
+        )
+        self._connection.commit()
+
+    def get(self: typing.Self, key: str) -> tuple[str, float] | None:
+        return self._connection.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+
+    def set(self: typing.Self, key: str, value: str, expires_at: float) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+        self._connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._connection.commit()
+
+
+class ResponseCache:
+    """In-memory LRU with TTL in front of an optional SQLite tier."""
+
+    def __init__(self: typing.Self, max_size: int, ttl: float, path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._disk: _SQLiteTier | None = _SQLiteTier(path) if path else None
+
+    def _remember(self: typing.Self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    async def get(self: typing.Self, key: str) -> str | None:
+        """Return cached response or None."""
+        entry = self._memory.get(key)
+        if entry is not None and entry[1] <= time.time():
+            del self._memory[key]
+            entry = None
+        if entry is None and self._disk is not None:
+            entry = await asyncio.to_thread(self._disk.get, key)
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None:
+            RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        self._memory.move_to_end(key)
+        RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+        return entry[0]
+
+    async def set(self: typing.Self, key: str, value: str) -> None:
+        """Store response."""
+        expires_at: float = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+
+
+response_cache = ResponseCache(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_PATH)
@@ -0,0 +1,204 @@
+"""Semantic cache of generated opening tasks and roadmaps, matched by topic embeddings.
+
+Users type the same topic in many ways ("линейная регрессия", "регрессия линейная", "linreg"), so exact
+caches miss. Topics are embedded with the OpenAI embeddings endpoint and searched in a local index of unit
+vectors by cosine similarity. Scenario parameters (prompt class and both levels) are not embedded and must
+match exactly: they come from buttons, not free text.
+
+The index is a fixed-size NumPy matrix, memory-mapped to a .npy file next to the SQLite file with entries.
+When it is full, the least recently used entry is replaced. The files belong to one bot process.
+"""
+
+import asyncio
+import sqlite3
+import time
+import typing
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import openai
+from loguru import logger
+
+from config.openai_client import client
+from config.settings import (
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+)
+from exceptions.llm_unavailable_error import LLMUnavailableError
+from utils.metrics import SEMANTIC_CACHE_LOOKUPS
+from utils.question_bank import BankKey
+from utils.resilience import EMBEDDING_POLICY, resilient_call
+
+# embeddings of recent topics, so that a lookup miss and the following save embed the topic once
+EMBEDDING_MEMO_SIZE: typing.Final[int] = 1024
+
+
+def _open_vectors(path: str, shape: tuple[int, int]) -> np.ndarray:
+    if Path(path).exists():
+        vectors = np.load(path, mmap_mode="r+")
+        if vectors.shape == shape:
+            return vectors
+        logger.warning(f"Semantic index {path} has shape {vectors.shape}, expected {shape}: recreated")
+        del vectors
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+
+
+class VectorIndex:
+    """Fixed-capacity matrix of unit vectors with LRU slot allocation, optionally memory-mapped."""
+
+    def __init__(self: typing.Self, dimensions: int, capacity: int, path: str = ""):
+        shape: tuple[int, int] = (capacity, dimensions)
+        self.vectors: np.ndarray = _open_vectors(path, shape) if path else np.zeros(shape, dtype=np.float32)
+        # time of the last use of every slot, 0 for free slots
+        self.used_at: np.ndarray = np.zeros(capacity, dtype=np.float64)
+
+    def allocate(self: typing.Self) -> int:
+        """Return a free slot, or the least recently used one if the index is full."""
+        return int(np.argmin(self.used_at))
+
+    def put(self: typing.Self, slot: int, vector: np.ndarray) -> None:
+        """Store a unit vector in a slot."""
+        self.vectors[slot] = vector
+        self.used_at[slot] = time.time()
+
+    def flush(self: typing.Self) -> None:
+        """Write changed vectors to the file."""
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+
+    def search(self: typing.Self, vector: np.ndarray, slots: typing.Sequence[int]) -> tuple[int, float] | None:
+        """Return the slot most similar to the vector among the given ones, with its cosine similarity."""
+        if not slots:
+            return None
+        candidates = np.fromiter(slots, dtype=np.int64, count=len(slots))
+        similarities: np.ndarray = self.vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+
+
+def _scope(key: BankKey) -> tuple[str, str, str]:
+    """Parameters that must match exactly."""
+    return key.prompt, key.interview_hard, key.questions_hard
+
+
+@dataclass
+class SemanticEntry:
+    """A generated reply and what it was generated for.
+
+    Slots are reused after eviction, so users remember entries they have seen by id, which is never reused.
+    """
+
+    id: int
+    key: BankKey
+    value: str
+
+
+class SemanticCache:
+    """Replies keyed by scenario parameters and topic embedding, with an optional on-disk copy."""
+
+    def __init__(self: typing.Self, capacity: int, threshold: float, path: str = ""):
+        self.threshold = threshold
+        self.index = VectorIndex(EMBEDDING_DIMENSIONS, capacity, f"{path}.npy" if path else "")
+        self.entries: dict[int, SemanticEntry] = {}
+        self._memo: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._last_id: int = 0
+        self._connection: sqlite3.Connection | None = None
+        if path:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (slot INTEGER PRIMARY KEY, prompt TEXT NOT NULL, "
+                "topic TEXT NOT NULL, interview_hard TEXT NOT NULL, questions_hard TEXT NOT NULL, "
+                "value TEXT NOT NULL, used_at REAL NOT NULL, id INTEGER NOT NULL)",
+            )
+            self._connection.commit()
+            rows = self._connection.execute(
+                "SELECT slot, id, prompt, topic, interview_hard, questions_hard, value, used_at FROM entries "
+                "WHERE slot < ?",
+                (capacity,),
+            )
+            for slot, entry_id, prompt, topic, interview_hard, questions_hard, value, used_at in rows:
+                key = BankKey(prompt, topic, interview_hard, questions_hard)
+                self.entries[slot] = SemanticEntry(entry_id, key, value)
+                self.index.used_at[slot] = used_at
+            # the newest entry is never evicted before a newer one is saved, so ids go on from the largest stored
+            self._last_id = max((entry.id for entry in self.entries.values()), default=0)
+
+    async def embed(self: typing.Self, topic: str) -> np.ndarray | None:
+        """Embed a normalized topic as a unit vector, return None if embeddings are unavailable."""
+        if (vector := self._memo.get(topic)) is not None:
+            self._memo.move_to_end(topic)
+            return vector
+        try:
+            response = await resilient_call(
+                lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=topic, dimensions=EMBEDDING_DIMENSIONS),
+                EMBEDDING_POLICY,
+            )
+        except (LLMUnavailableError, openai.OpenAIError) as error:
+            logger.warning(f"Topic embedding failed: {error}")
+            return None
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        self._memo[topic] = vector
+        while len(self._memo) > EMBEDDING_MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return vector
+
+    def _write_used_at(self: typing.Self, slot: int, used_at: float) -> None:
+        if self._connection is not None:
+            self._connection.execute("UPDATE entries SET used_at = ? WHERE slot = ?", (used_at, slot))
+            self._connection.commit()
+
+    def _write_entry(self: typing.Self, slot: int, entry: SemanticEntry, used_at: float) -> None:
+        self.index.flush()
+        if self._connection is not None:
+            key = entry.key
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (slot, id, prompt, topic, interview_hard, questions_hard, value, "
+                "used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (slot, entry.id, key.prompt, key.topic, key.interview_hard, key.questions_hard, entry.value, used_at),
+            )
+            self._connection.commit()
+
+    async def find(self: typing.Self, key: BankKey, exclude: typing.Collection[int] = ()) -> tuple[int, str] | None:
+        """Return the reply for the most similar topic with the same parameters, with its id.
+
+        Entries with ids in exclude are skipped.
+        """
+        found: tuple[int, str] | None = None
+        if (vector := await self.embed(key.topic)) is not None:
+            scope = _scope(key)
+            slots = [
+                slot for slot, entry in self.entries.items() if _scope(entry.key) == scope and entry.id not in exclude
+            ]
+            best = self.index.search(vector, slots)
+            if best is not None and best[1] >= self.threshold:
+                slot, similarity = best
+                logger.debug(f"Semantic cache hit: {key.topic!r} ~ {self.entries[slot].key.topic!r} ({similarity:.3f})")
+                self.index.used_at[slot] = time.time()
+                await asyncio.to_thread(self._write_used_at, slot, float(self.index.used_at[slot]))
+                found = self.entries[slot].id, self.entries[slot].value
+        SEMANTIC_CACHE_LOOKUPS.labels(key.prompt, "miss" if found is None else "hit").inc()
+        return found
+
+    async def save(self: typing.Self, key: BankKey, value: str) -> None:
+        """Store a reply generated for the key."""
+        if (vector := await self.embed(key.topic)) is None:
+            return
+        slot: int = self.index.allocate()
+        self.index.put(slot, vector)
+        self._last_id += 1
+        entry = SemanticEntry(self._last_id, key, value)
+        self.entries[slot] = entry
+        await asyncio.to_thread(self._write_entry, slot, entry, float(self.index.used_at[slot]))
+
+
+semantic_cache = SemanticCache(
+    capacity=SEMANTIC_CACHE_SIZE,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    path=SEMANTIC_CACHE_PATH,
+)
@@ -1,3 +1,5 @@
+import re
+import time
 import typing
 
 from loguru import logger
@@ -9,28 +11,141 @@ from telegram import (
 from telegram.constants import ParseMode
 from telegram.error import NetworkError
 
-from utils.constants import MAX_TELEGRM_MESSAGE_LEN
+from utils.constants import MAX_TELEGRM_MESSAGE_LEN, STREAM_EDIT_INTERVAL, STREAM_PLACEHOLDER
+from utils.metrics import TIME_TO_FIRST_VISIBLE_TOKEN
+
+CODE_FENCE: typing.Final[str] = "```"
+# язык блока кода, который повторяется при переоткрытии; длинная строка после ``` языком не считается
+CODE_FENCE_LANGUAGE: typing.Final[re.Pattern[str]] = re.compile(r"```([\w+-]{0,32})(?![\w+-])")
+# закрывающая строка блока кода, которая дописывается к чанку, разрезавшему блок
+CLOSING_FENCE: typing.Final[str] = f"\n{CODE_FENCE}"
+# в чанк должны влезть переоткрытый блок (язык до 32 символов), один символ текста и закрывающая строка
+MIN_CHUNK_SIZE: typing.Final[int] = len(CODE_FENCE) + 32 + 1 + 1 + len(CLOSING_FENCE)
+
+
+class MarkdownSplitter:
+    """Incremental splitter of Markdown text into chunks of at most max_chunk_size characters.
+
+    Text may be fed piece by piece (e.g. LLM tokens), every character is looked at a constant number
+    of times. Chunks are cut at a line break, then at a sentence end, then at a space, never inside
+    an inline entity if it can be avoided. A code block cut in two is closed in the first chunk and
+    reopened with the same language in the next one. max_chunk_size is at least MIN_CHUNK_SIZE,
+    so that a reopened and closed block still has room for text.
+    """
+
+    def __init__(self, max_chunk_size: int = MAX_TELEGRM_MESSAGE_LEN):
+        if max_chunk_size < MIN_CHUNK_SIZE:
+            msg = f"max_chunk_size must be at least {MIN_CHUNK_SIZE}, got {max_chunk_size}"
+            raise ValueError(msg)
+        self.max_chunk_size = max_chunk_size
+        # остаток оставляет место под закрывающую строку, которую flush допишет к незакрытому блоку
+        self._pending_limit: int = max_chunk_size - len(CLOSING_FENCE)
+        self._pending: list[str] = []
+        self._size: int = 0
+        # открывающая строка блока кода, разрезанного на границе предыдущего чанка
+        self._prefix: str = ""
+
+    @property
+    def pending(self) -> str:
+        """Text that is not emitted yet, as it would look in the next chunk."""
+        return self._prefix + "".join(self._pending)
+
+    def feed(self, text: str) -> list[str]:
+        """Add text and return chunks that are complete now."""
+        self._pending.append(text)
+        self._size += len(text)
+        if len(self._prefix) + self._size <= self._pending_limit:
+            return []
+
+        buffer: str = "".join(self._pending)
+        chunks: list[str] = []
+        start: int = 0
+        while len(self._prefix) + len(buffer) - start > self._pending_limit:
+            chunk, start = self._cut(buffer, start)
+            if chunk:
+                chunks.append(chunk)
+
+        self._pending = [buffer[start:]]
+        self._size = len(buffer) - start
+        return chunks
+
+    def flush(self) -> str | None:
+        """Return the rest of the text as the last chunk."""
+        chunk: str = self.pending.strip()
+        if _open_code_fence(chunk) is not None:
+            chunk += CLOSING_FENCE
+        self._pending, self._size, self._prefix = [], 0, ""
+        return chunk or None
+
+    def _cut(self, buffer: str, start: int) -> tuple[str, int]:
+        # хотя бы один символ за шаг, иначе feed зациклится; MIN_CHUNK_SIZE гарантирует, что он влезет
+        end: int = max(start + self._pending_limit - len(self._prefix), start + 1)
+        cut: int = _find_cut(buffer, start, end)
+
+        chunk: str = (self._prefix + buffer[start:cut]).strip()
+        self._prefix = ""
+        if (fence := _open_code_fence(chunk)) is not None:
+            chunk += CLOSING_FENCE
+            self._prefix = f"{fence}\n"
+
+        if cut < len(buffer) and buffer[cut] in " \n":
+            cut += 1
+        return chunk, cut
+
+
+def _find_cut(text: str, start: int, end: int) -> int:
+    """Position in text[start:end] to cut the chunk at."""
+    cut: int = text.rfind("\n", start, end)
+    if cut <= start:
+        # ". " не встречается внутри чисел и ссылок, в отличие от просто "."
+        cut = text.rfind(". ", start, end - 1) + 1
+    if cut <= start:
+        cut = text.rfind(" ", start, end)
+    if cut <= start:
+        return end
+
+    line_start: int = max(text.rfind("\n", start, cut) + 1, start)
+    if (opener := _unclosed_entity(text, line_start, cut)) is not None and opener > start:
+        return opener
+    return cut
+
+
+def _unclosed_entity(text: str, start: int, end: int) -> int | None:
+    """Position of an inline entity opened in text[start:end] and not closed there."""
+    opened: dict[str, int] = {}
+    i: int = start
+    while i < end:
+        char: str = text[i]
+        if char == "`" and text.startswith(CODE_FENCE, i):
+            i += len(CODE_FENCE)
+            continue
+        if char in "`*[" or (char == "]" and "[" in opened):
+            marker: str = "[" if char == "]" else char
+            if marker in opened:
+                del opened[marker]
+            else:
+                opened[marker] = i
+        i += 1
+    return min(opened.values(), default=None)
+
+
+def _open_code_fence(text: str) -> str | None:
+    """Fence marker with the language of a code block left open at the end of text."""
+    fence: str | None = None
+    for line in text.split("\n"):
+        stripped: str = line.strip()
+        if stripped.startswith(CODE_FENCE):
+            language: re.Match[str] | None = CODE_FENCE_LANGUAGE.match(stripped)
+            fence = (language.group() if language else CODE_FENCE) if fence is None else None
+    return fence
 
 
 def text_splitter(text: str, max_chunk_size: int = MAX_TELEGRM_MESSAGE_LEN) -> typing.Generator[str, None, None]:
     """Split text to good chunks with size less than max_chunk_size."""
-    chunks: list[str] = []
-    for chunk in text.split("\n"):
-        if len(chunk) <= max_chunk_size:
-            chunks.append(f"{chunk}\n")
-        else:
-            chunks.extend([f"{sentence}." for sentence in chunk.split(".")])
-            chunks[-1] = chunks[-1][:-1]
-
-    i: int = 0
-    while i < len(chunks):
-        cur_text: str = chunks[i]
-        j = i + 1
-        while j < len(chunks) and len(cur_text + chunks[j]) < max_chunk_size:
-            cur_text += chunks[j]
-            j += 1
-        yield cur_text.strip()
-        i = j
+    splitter = MarkdownSplitter(max_chunk_size)
+    yield from splitter.feed(text)
+    if (chunk := splitter.flush()) is not None:
+        yield chunk
 
 
 async def print_message(
@@ -51,3 +166,83 @@ async def print_message(
     except NetworkError:
         logger.error(f"ТГ не смог напечатать текст: \n{text}")
         await message.reply_text("Извините, Телеграм не переварил ответ")
+
+
+async def _edit_message(message: Message, text: str, parse_mode: ParseMode | None = None) -> None:
+    """Edit message, falling back to plain text if Telegram rejects the markup."""
+    try:
+        await message.edit_text(text, parse_mode=parse_mode)
+    except NetworkError:
+        if parse_mode is None:
+            logger.debug("ТГ не смог обновить сообщение")
+            return
+        logger.error(f"ТГ не смог отформатировать текст: \n{text}")
+        await _edit_message(message, text)
+
+
+async def stream_message(
+    message: Message,
+    deltas: typing.AsyncIterable[str],
+    parse_mode: ParseMode = ParseMode.MARKDOWN,
+    max_chunk_size: int = MAX_TELEGRM_MESSAGE_LEN,
+    edit_interval: float = STREAM_EDIT_INTERVAL,
+) -> str:
+    """Print LLM reply while it is generated and return the full text.
+
+    A placeholder message is progressively edited as tokens arrive (no more often than edit_interval).
+    Intermediate edits are sent as plain text since unfinished Markdown is usually invalid,
+    the final version of every message is sent with parse_mode.
+    """
+    started_at: float = time.monotonic()
+    current: Message = await message.reply_text(STREAM_PLACEHOLDER)
+    splitter = MarkdownSplitter(max_chunk_size)
+    pieces: list[str] = []
+    shown: str = ""
+    last_edit_at: float = 0.0
+    visible: bool = False
+
+    def observe_visible() -> None:
+        nonlocal visible
+        if not visible:
+            visible = True
+            TIME_TO_FIRST_VISIBLE_TOKEN.observe(time.monotonic() - started_at)
+
+    async for delta in deltas:
+        if not pieces:
+            logger.info(f"time_to_first_token={time.monotonic() - started_at:.3f}s")
+        pieces.append(delta)
+
+        for chunk in splitter.feed(delta):
+            await _edit_message(current, chunk, parse_mode)
+            observe_visible()
+            current = await message.reply_text(STREAM_PLACEHOLDER)
+            shown = ""
+
+        now: float = time.monotonic()
+        if now - last_edit_at >= edit_interval and (text := splitter.pending).strip() and text != shown:
+            await _edit_message(current, text)
+            observe_visible()
+            shown = text
+            last_edit_at = now
+
+    final: str | None = splitter.flush()
+    await _edit_message(current, final or STREAM_PLACEHOLDER, parse_mode)
+    if final:
+        observe_visible()
+    logger.info(f"time_to_full_reply={time.monotonic() - started_at:.3f}s")
+    return "".join(pieces).strip()
+
+
+class StatusMessage:
+    """Service message that shows progress of a long operation."""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.text: str = message.text or ""
+
+    async def update(self, text: str) -> None:
+        """Replace status text, skipping no-op edits."""
+        if text == self.text:
+            return
+        self.text = text
+        await _edit_message(self.message, text)
@@ -0,0 +1,52 @@
+"""Voice input pipeline."""
+
+import typing
+from collections import OrderedDict
+from io import BytesIO
+
+from loguru import logger
+from telegram import Message
+
+from config.openai_client import generate_transcription
+from config.settings import TRANSCRIPTION_CACHE_SIZE
+from utils.metrics import TRANSCRIPTION_AUDIO_SECONDS_SAVED, TRANSCRIPTION_CACHE_LOOKUPS
+
+
+class VoiceInput:
+    """Turns user messages into text, transcribing voice notes with Whisper.
+
+    Transcripts are cached by Telegram file_unique_id, which is the same for forwarded
+    and re-sent copies of a voice note.
+    """
+
+    def __init__(self: typing.Self, max_size: int):
+        self.max_size = max_size
+        self._transcripts: OrderedDict[str, str] = OrderedDict()
+
+    async def read_text(self: typing.Self, message: Message) -> str | None:
+        """Return message text or voice note transcript."""
+        if message.text:
+            return message.text
+        if message.voice is None:
+            return None
+
+        voice = message.voice
+        if (transcript := self._transcripts.get(voice.file_unique_id)) is not None:
+            self._transcripts.move_to_end(voice.file_unique_id)
+            TRANSCRIPTION_CACHE_LOOKUPS.labels("hit").inc()
+            TRANSCRIPTION_AUDIO_SECONDS_SAVED.inc(voice.duration)
+            logger.info(f"Transcription cache hit: {voice.duration}s of audio not sent to Whisper")
+            return transcript
+
+        TRANSCRIPTION_CACHE_LOOKUPS.labels("miss").inc()
+        audio_file = await voice.get_file()
+        audio_bytes = BytesIO(await audio_file.download_as_bytearray())
+        transcript = await generate_transcription(audio_bytes)
+
+        self._transcripts[voice.file_unique_id] = transcript
+        while len(self._transcripts) > self.max_size:
+            self._transcripts.popitem(last=False)
+        return transcript
+
+
+voice_input = VoiceInput(max_size=TRANSCRIPTION_CACHE_SIZE)